@@ -1,4 +1,5 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
+from werkzeug.utils import secure_filename
 from indexer.pdf_indexer import PDFIndexer
 from indexer.txt_indexer import TextIndexer
 from indexer.csv_indexer import CSVIndexer
@@ -6,13 +7,42 @@ from indexer.excel_indexer import ExcelIndexer
 from indexer.json_indexer import JSONIndexer
 from indexer.web_indexer import WebIndexer
 import os
-from config import DOCUMENTS_DIR
-from sklearn.metrics import precision_score, recall_score, f1_score
+import sys
+import hmac
+import random
+import logging
+import json
+import time
+import atexit
+from functools import wraps
+from urllib.parse import quote
+from config import (DOCUMENTS_DIR, SEARCH_CONFIG, SUGGEST_CONFIG, VECTOR_CONFIG, BLOOM_CONFIG, PROFILE_CONFIG, QUERY_LOG_CONFIG,
+                    FILE_TYPES, INGEST_CONFIG, INDEX_DIR, REPLICA_DIR, MERGE_CONFIG)
+from utils.column_schema import parse_filters
+from utils import stats
+from utils.logs import configure_logging
+from utils.profiling import RequestProfile, saved_profile
+from utils.query_log import QueryLog
+from utils.evaluation import evaluate, parse_judgments
+from utils.ingest import ingest_ndjson
+from utils.lexicon import get_surface_forms
+from utils.near_duplicates import get_duplicate_index
+from utils.vectors import get_vector_index, has_stored_vectors
+from utils.replication import ReplicaFollower
+from utils.merging import MergeScheduler, segment_stats, summarize
+from indexer.searching import index_stats
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+if REPLICA_DIR and not os.path.isdir(INDEX_DIR):
+    sys.exit(f"No index generation in {REPLICA_DIR} yet; restore a snapshot first: "
+             f"python -m utils.replication restore --replica-dir {REPLICA_DIR}")
+
 # Initialize indexers
-print("Initializing indexers...")
+logger.info("Initializing indexers...")
 indexers = {
     'pdf': PDFIndexer(),
     'txt': TextIndexer(),
@@ -22,78 +52,506 @@ indexers = {
     'web': WebIndexer()
 }
 
+# A replica serves restored snapshot generations and follows the newest one
+if REPLICA_DIR:
+    ReplicaFollower(indexers).start()
+
+# The near-duplicate table, the vectors and the term spellings outlive the indexes unless they are emptied with them
+elif all(indexer.ix.doc_count_all() == 0 for indexer in indexers.values()):
+    for table in (get_duplicate_index(), get_surface_forms()):
+        if table is not None and len(table):
+            table.clear()
+    if has_stored_vectors():
+        get_vector_index().clear()
+
+# Larger segment merges and compaction run in the background (not on a replica, which never writes)
+merge_scheduler = MergeScheduler(indexers)
+if MERGE_CONFIG['enabled'] and not REPLICA_DIR:
+    merge_scheduler.start()
+
+# Searches served, for replaying real traffic with benchmarks/replay.py
+query_log = None
+if QUERY_LOG_CONFIG['enabled']:
+    query_log = QueryLog()
+    atexit.register(query_log.flush)
+
+def _flag(name):
+    """True if a boolean query string parameter is switched on"""
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes', 'on')
+
+def writable(view):
+    """Refuse a view that changes the indexes when this app is a read-only replica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if REPLICA_DIR:
+            return jsonify({"status": "error", "message": "This node is a read-only replica"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def _profile_allowed():
+    """True if the request carries the configured profiling token"""
+    token = PROFILE_CONFIG['token']
+    return bool(token) and hmac.compare_digest(request.headers.get('X-Profile-Token', ''), token)
+
+def profiled(label):
+    """Profile a view when an authorized client asks for profile=1, or for a sampled share of requests.
+
+    Requested profiles come back as a zip attachment instead of the normal
+    response; sampled ones are saved under PROFILE_CONFIG['dir'] and named in
+    an X-Profile-Id header, see /profiles/<id>.
+    """
+    def decorate(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            requested = _flag('profile')
+            if requested:
+                if not _profile_allowed():
+                    return jsonify({"status": "error", "message": "Profiling is not allowed"}), 403
+            elif not (PROFILE_CONFIG['sample_rate'] and random.random() < PROFILE_CONFIG['sample_rate']):
+                return view(*args, **kwargs)
+
+            with RequestProfile(label) as profile:
+                # Build the response inside the profile so JSON serialization is included
+                response = app.make_response(view(*args, **kwargs))
+            if not profile.acquired:
+                if requested:
+                    return jsonify({"status": "error", "message": "Another request is being profiled"}), 429
+                return response
+            if requested:
+                return Response(profile.artifact(response.get_data()), mimetype='application/zip', headers={
+                    'Content-Disposition': f'attachment; filename=profile-{label}-{profile.id}.zip',
+                    'X-Profile-Id': profile.id})
+            try:
+                profile.save(response.get_data())
+                response.headers['X-Profile-Id'] = profile.id
+            except Exception as e:
+                logger.error("Error saving %s profile: %s", label, e)
+            return response
+        return wrapper
+    return decorate
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/search')
-def search():
-    query = request.args.get('q', '')
-    filetype = request.args.get('filetype', 'all')
-    print(f"Received search query: {query}, filetype: {filetype}")
-    if not query:
-        print("Empty query received")
-        return jsonify([])
-    
+def _one_per_cluster(results):
+    """Keep the best hit of each near-duplicate cluster across indexes, counting the others on it"""
+    kept = {}
+    distinct = []
+    for result in results:
+        cluster = result.get('cluster')
+        if cluster is None:
+            distinct.append(result)
+        elif cluster in kept:
+            kept[cluster]['duplicates'] += 1 + result.get('duplicates', 0)
+        else:
+            kept[cluster] = result
+            distinct.append(result)
+    return distinct
+
+def run_query(query, filetype='all', filters=None, **options):
+    """Search the selected indexes and merge their hits.
+
+    Returns (results sorted by score, summed facet counts, did-you-mean
+    suggestion or None, names of the indexes with partial results). Shared by
+    /search and the batch evaluation behind /metrics/evaluate.
+    """
+    if filters is not None:
+        options['filters'] = filters
+    # One collection budget for the whole request, shared by the indexes searched
+    if SEARCH_CONFIG['time_budget']:
+        options['deadline'] = time.perf_counter() + SEARCH_CONFIG['time_budget']
+    facet_counts = {}
+    # Respelled query -> summed weight from the indexes that proposed it, and the terms it respells
+    suggestions = {}
+    respelled = {}
+    # Indexes that ran out of time or were not searched before the deadline
+    partial = []
+
+    def run_search(indexer_name, indexer):
+        if filters is not None and not getattr(indexer, 'column_fields', False):
+            return []
+        with stats.timed('stage_seconds', stage='search', index=indexer_name):
+            indexer_results = indexer.search(query, **options)
+        # Facet counts come back with the hits of each index and are summed across indexes
+        for name, counts in getattr(indexer_results, 'facets', {}).items():
+            merged = facet_counts.setdefault(name, {})
+            for value, count in counts.items():
+                merged[value] = merged.get(value, 0) + count
+        suggestion = getattr(indexer_results, 'suggestion', None)
+        if suggestion:
+            text, weight, terms = suggestion
+            suggestions[text] = suggestions.get(text, 0) + weight
+            respelled[text] = terms
+        if getattr(indexer_results, 'partial', False):
+            partial.append(indexer_name)
+        return indexer_results
+
     results = []
     if filetype and filetype != 'all':
         # Search only in the selected filetype indexer
         indexer = indexers.get(filetype)
         if indexer:
             try:
-                print(f"Searching in {filetype} indexer only...")
-                indexer_results = indexer.search(query)
-                print(f"Found {len(indexer_results)} results in {filetype}")
+                logger.debug("Searching in %s indexer only...", filetype)
+                indexer_results = run_search(filetype, indexer)
+                logger.debug("Found %s results in %s", len(indexer_results), filetype)
                 if indexer_results:
-                    print(f"First result from {filetype}: {indexer_results[0]}")
+                    logger.debug("First result from %s: %s", filetype, indexer_results[0])
                 results.extend(indexer_results)
             except Exception as e:
-                print(f"Error in {filetype} search: {str(e)}")
+                logger.error("Error in %s search: %s", filetype, e)
         else:
-            print(f"No indexer found for filetype: {filetype}")
+            logger.warning("No indexer found for filetype: %s", filetype)
     else:
-        # Search in all indexers
+        # Search in all indexers, skipping those whose vocabulary rules out the query as typed.
+        # If that rules out every index the query is likely misspelled, and all of them are
+        # searched so its fuzzy variant can still match.
+        skipped = []
+        if BLOOM_CONFIG['enabled'] and query:
+            for indexer_name, indexer in indexers.items():
+                try:
+                    if not indexer.may_match(query):
+                        skipped.append(indexer)
+                except Exception as e:
+                    logger.error("Error checking the %s index for possible matches: %s", indexer_name, e)
+            if len(skipped) == len(indexers):
+                stats.increment('skip_fallbacks')
+                skipped = []
+        unsearched = 0
         for indexer_name, indexer in indexers.items():
+            if indexer in skipped:
+                logger.debug("Skipping %s indexer, no possible match", indexer_name)
+                continue
+            if 'deadline' in options and time.perf_counter() >= options['deadline']:
+                logger.debug("Search budget spent, not searching %s indexer", indexer_name)
+                partial.append(indexer_name)
+                unsearched += 1
+                continue
             try:
-                print(f"Searching in {indexer_name} indexer...")
-                indexer_results = indexer.search(query)
-                print(f"Found {len(indexer_results)} results in {indexer_name}")
+                logger.debug("Searching in %s indexer...", indexer_name)
+                indexer_results = run_search(indexer_name, indexer)
+                logger.debug("Found %s results in %s", len(indexer_results), indexer_name)
                 if indexer_results:
-                    print(f"First result from {indexer_name}: {indexer_results[0]}")
+                    logger.debug("First result from %s: %s", indexer_name, indexer_results[0])
                 results.extend(indexer_results)
             except Exception as e:
-                print(f"Error in {indexer_name} search: {str(e)}")
+                logger.error("Error in %s search: %s", indexer_name, e)
                 continue
+        stats.increment('all_searches')
+        stats.increment('indexes_searched', len(indexers) - len(skipped) - unsearched)
+        stats.increment('indexes_skipped', len(skipped))
+        if len(results) < SEARCH_CONFIG['did_you_mean_below']:
+            # Skipped indexes can still propose a respelling
+            for indexer in skipped:
+                try:
+                    suggestion = indexer.did_you_mean(query)
+                except Exception as e:
+                    logger.error("Error getting suggestion: %s", e)
+                    continue
+                if suggestion:
+                    text, weight, terms = suggestion
+                    suggestions[text] = suggestions.get(text, 0) + weight
+                    respelled[text] = terms
+    
+    with stats.timed('stage_seconds', stage='merge'):
+        # Sort results by score
+        results.sort(key=lambda x: x['score'], reverse=True)
+        if options.get('distinct', SEARCH_CONFIG['distinct']):
+            results = _one_per_cluster(results)
+        did_you_mean = None
+        if suggestions and len(results) < SEARCH_CONFIG['did_you_mean_below']:
+            # Each index respells the words it does not know; a word another searched index knows is no typo
+            searched = [indexers[filetype]] if filetype in indexers else list(indexers.values())
+            suggestions = {text: weight for text, weight in suggestions.items()
+                           if not any(indexer.knows(term) for indexer in searched for term in respelled[text])}
+            if suggestions:
+                did_you_mean = max(suggestions, key=suggestions.get)
+    return results, facet_counts, did_you_mean, partial
+
+@app.route('/search')
+@profiled('search')
+def search():
+    started = time.perf_counter()
+    query = request.args.get('q', '')
+    filetype = request.args.get('filetype', 'all')
+    logger.info("Received search query: %s, filetype: %s", query, filetype)
+    # Structured column filters for CSV/Excel rows, e.g. filter=price>100&filter=city=Cairo
+    try:
+        filters = parse_filters(request.args.getlist('filter'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if not query and filters is None:
+        logger.debug("Empty query received")
+        return jsonify([])
     
-    # Sort results by score
-    results.sort(key=lambda x: x['score'], reverse=True)
-    print(f"Total results found: {len(results)}")
+    options = {}
+    # Hits kept per source file, e.g. collapse=1 for one row per spreadsheet (0 disables collapsing)
+    collapse = request.args.get('collapse')
+    if collapse is not None:
+        try:
+            options['collapse'] = max(0, int(collapse))
+        except ValueError:
+            return jsonify({"status": "error", "message": f"Invalid collapse value: {collapse}"}), 400
+    # Near-duplicates (the same text as PDF and TXT, ...) come back once unless distinct=0
+    if 'distinct' in request.args:
+        options['distinct'] = _flag('distinct')
+    want_facets = _flag('facets')
+    if want_facets:
+        options['facets'] = True
+    results, facet_counts, did_you_mean, partial = run_query(query, filetype, filters, **options)
+    logger.debug("Total results found: %s", len(results))
     if results:
-        print(f"Top result: {results[0]}")
+        logger.debug("Top result: %s", results[0])
+    if did_you_mean:
+        logger.debug("Did you mean: %s", did_you_mean)
+    if partial:
+        stats.increment('partial_searches')
+        logger.info("Partial results (out of time or stopped early) in: %s", ', '.join(partial))
     
+    with stats.timed('stage_seconds', stage='serialize'):
+        if want_facets:
+            response = jsonify({"results": results, "facets": facet_counts, "did_you_mean": did_you_mean,
+                                "partial": partial})
+        else:
+            response = jsonify(results)
+            if did_you_mean:
+                # Plain list responses carry the suggestion in a header (URL-encoded, headers are latin-1)
+                response.headers['X-Did-You-Mean'] = quote(did_you_mean)
+            if partial:
+                response.headers['X-Partial-Results'] = ','.join(partial)
+    elapsed = time.perf_counter() - started
+    stats.observe('request_seconds', elapsed, endpoint='search')
+    if query_log is not None:
+        query_log.record(query, filetype, elapsed, len(results))
+    return response
+
+def _similar_response(vector, exclude=None):
+    """The stored documents closest to a vector, as /search-style results"""
+    vectors = get_vector_index()
+    try:
+        limit = min(max(1, int(request.args.get('limit', VECTOR_CONFIG['limit']))), SEARCH_CONFIG['limit'])
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid limit"}), 400
+    results = []
+    for row, score in vectors.nearest(vector, limit, exclude=exclude):
+        meta = vectors.metadata(row)
+        indexer = indexers.get(meta['index'])
+        results.append({
+            'doc_id': row,
+            'filename': meta['filename'],
+            'filetype': meta['filetype'],
+            'content': indexer.doc_store.get(meta['doc']) if indexer else '',
+            'location': meta['location'],
+            'title': meta['title'],
+            'score': round(score, 4)
+        })
     return jsonify(results)
 
+@app.route('/similar/<int:doc_id>')
+def similar_documents(doc_id):
+    """Documents most like an indexed one; doc_id comes from the doc_id of a /search result"""
+    vectors = get_vector_index()
+    if vectors is None:
+        return jsonify({"status": "error", "message": "Similarity search is disabled"}), 404
+    vector = vectors.vector(doc_id)
+    if vector is None:
+        return jsonify({"status": "error", "message": f"Unknown document: {doc_id}"}), 404
+    with stats.timed('request_seconds', endpoint='similar'):
+        return _similar_response(vector, exclude=doc_id)
+
+@app.route('/similar', methods=['GET', 'POST'])
+def similar_text():
+    """Documents most like a free text, given as text=... or a JSON body {"text": ...}"""
+    vectors = get_vector_index()
+    if vectors is None:
+        return jsonify({"status": "error", "message": "Similarity search is disabled"}), 404
+    body = request.get_json(silent=True) if request.method == 'POST' else None
+    text = body.get('text', '') if isinstance(body, dict) else request.args.get('text', '')
+    if not isinstance(text, str) or not text.strip():
+        return jsonify([])
+    with stats.timed('request_seconds', endpoint='similar'):
+        return _similar_response(vectors.embed(text))
+
+@app.route('/suggest')
+def suggest():
+    """Type-ahead completions for the search box, merged across the selected indexes"""
+    prefix = request.args.get('prefix', '')
+    filetype = request.args.get('filetype', 'all')
+    try:
+        limit = min(max(1, int(request.args.get('limit', SUGGEST_CONFIG['limit']))), SUGGEST_CONFIG['limit'])
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid limit"}), 400
+    if not prefix.strip():
+        return jsonify([])
+
+    if filetype and filetype != 'all':
+        selected = [indexers[filetype]] if filetype in indexers else []
+    else:
+        selected = indexers.values()
+    merged = {}
+    for indexer in selected:
+        try:
+            for completion in indexer.suggest(prefix, limit):
+                key = (completion['text'].lower(), completion['kind'])
+                if key in merged:
+                    merged[key]['weight'] += completion['weight']
+                else:
+                    merged[key] = completion
+        except Exception as e:
+            logger.error("Error getting suggestions: %s", e)
+    completions = sorted(merged.values(), key=lambda c: c['weight'], reverse=True)
+    return jsonify(completions[:limit])
+
 @app.route('/index')
+@writable
+@profiled('index')
 def index_files():
     try:
         # Create documents directory if it doesn't exist
         if not os.path.exists(DOCUMENTS_DIR):
             os.makedirs(DOCUMENTS_DIR)
-            print(f"Created documents directory at {DOCUMENTS_DIR}")
+            logger.info("Created documents directory at %s", DOCUMENTS_DIR)
         
         # Index all files
         for indexer_name, indexer in indexers.items():
             try:
-                print(f"Indexing files with {indexer_name} indexer...")
+                logger.info("Indexing files with %s indexer...", indexer_name)
                 indexer.index_all_files()
             except Exception as e:
-                print(f"Error indexing files with {indexer_name}: {str(e)}")
+                logger.error("Error indexing files with %s: %s", indexer_name, e)
                 continue
         
         return jsonify({"status": "success", "message": "Files indexed successfully"})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
+def _indexer_for_upload(filename):
+    """Name of the indexer handling a file extension, or None"""
+    extension = os.path.splitext(filename)[1].lower()
+    for name, file_type in FILE_TYPES.items():
+        if extension in file_type['extensions']:
+            return name
+    return None
+
+def _save_uploads(files):
+    """Save multipart uploads to the upload directory; returns (saved filename or None, original name) pairs"""
+    os.makedirs(INGEST_CONFIG['upload_dir'], exist_ok=True)
+    saved = []
+    for upload in files:
+        filename = secure_filename(upload.filename or '')
+        if _indexer_for_upload(filename) is None:
+            saved.append((None, upload.filename))
+            continue
+        upload.save(os.path.join(INGEST_CONFIG['upload_dir'], filename))
+        saved.append((filename, upload.filename))
+    return saved
+
+def _ingest_uploads(saved):
+    """Queue saved uploads on the indexer for their extension, one acknowledgement per file.
+
+    The files are committed together at the end; the summary lists those whose commit failed.
+    """
+    queued = {}
+    accepted = rejected = 0
+    for number, (filename, original) in enumerate(saved, 1):
+        if filename is None:
+            rejected += 1
+            yield {'batch': number, 'file': original, 'accepted': 0, 'error': f"Unsupported file type: {original}"}
+            continue
+        indexer_name = _indexer_for_upload(filename)
+        file = indexers[indexer_name].index_file(os.path.join(INGEST_CONFIG['upload_dir'], filename))
+        result = {'batch': number, 'file': filename, 'index': indexer_name, 'accepted': int(file is not None)}
+        if file is None:
+            rejected += 1
+            result['error'] = "Error indexing file"
+        else:
+            accepted += 1
+            queued.setdefault(indexer_name, []).append((filename, file))
+        yield result
+    committed = True
+    uncommitted = []
+    for name, files in queued.items():
+        failures = set()
+        committed &= indexers[name].writes.flush(failures=failures)
+        uncommitted.extend(filename for filename, file in files if not file.done(failures))
+    summary = {'done': True, 'batches': len(saved), 'committed': committed, 'accepted': accepted - len(uncommitted),
+               'rejected': rejected + len(uncommitted)}
+    if uncommitted:
+        summary['uncommitted'] = uncommitted
+    yield summary
+
+@app.route('/documents', methods=['POST'])
+@writable
+def push_documents():
+    """Bulk ingestion of NDJSON documents or multipart file uploads.
+
+    An NDJSON body (one pre-extracted document per line, see
+    utils.ingest.ingest_ndjson; filetype=<index> sets a default index) is
+    parsed as it streams in. Multipart files are routed by extension to
+    their indexer. The response streams one NDJSON acknowledgement per batch
+    and ends with a summary once the documents are committed.
+    """
+    if request.mimetype == 'multipart/form-data':
+        # Uploads are spooled by the form parser and only valid during the request, so save them first
+        acks = _ingest_uploads(_save_uploads(request.files.getlist('file') or list(request.files.values())))
+    else:
+        default = request.args.get('filetype')
+        if default is not None and default not in indexers:
+            return jsonify({"status": "error", "message": f"Unknown filetype: {default}"}), 400
+        acks = ingest_ndjson(request.stream, indexers, default_filetype=default)
+    return Response(stream_with_context(json.dumps(ack) + '\n' for ack in acks), mimetype='application/x-ndjson')
+
+@app.route('/metrics', methods=['GET'])
+def search_counters():
+    """Counters kept by the search dispatcher, e.g. indexes skipped by the Bloom filters"""
+    return jsonify(stats.counters())
+
+@app.route('/profiles/<profile_id>')
+def download_profile(profile_id):
+    """A profile artifact saved from a sampled request"""
+    if not _profile_allowed():
+        return jsonify({"status": "error", "message": "Profiling is not allowed"}), 403
+    path = saved_profile(profile_id)
+    if path is None:
+        return jsonify({"status": "error", "message": f"Unknown profile: {profile_id}"}), 404
+    return send_file(path, mimetype='application/zip', as_attachment=True)
+
+@app.route('/stats')
+def prometheus_stats():
+    """Counters, timing histograms and index gauges in the Prometheus text format"""
+    gauges = []
+    for indexer_name, indexer in indexers.items():
+        try:
+            for name, value in index_stats(indexer.ix).items():
+                gauges.append((f'index_{name}', {'index': indexer_name}, value))
+            gauges.append(('doc_store_documents', {'index': indexer_name}, len(indexer.doc_store)))
+            summary = summarize(segment_stats(indexer.ix))
+            for name, key in (('deleted_documents', 'deleted'), ('deleted_ratio', 'deleted_ratio'),
+                              ('bytes', 'bytes'), ('largest_segment_bytes', 'largest_segment_bytes')):
+                gauges.append((f'index_{name}', {'index': indexer_name}, summary[key]))
+            for tier, count in summary['tiers'].items():
+                gauges.append(('index_segments_by_tier', {'index': indexer_name, 'tier': tier}, count))
+        except Exception as e:
+            logger.error("Error reading %s index stats: %s", indexer_name, e)
+    counts = stats.counters()
+    for cache in ('query_cache', 'doc_store_cache'):
+        hits, misses = counts.get(f'{cache}_hits', 0), counts.get(f'{cache}_misses', 0)
+        if hits + misses:
+            gauges.append(('cache_hit_ratio', {'cache': cache}, round(hits / (hits + misses), 4)))
+    # The lemma cache only exists once the lemmatizing analyzer or TextProcessor has been used
+    text_processor = sys.modules.get('utils.text_processor')
+    info = text_processor and text_processor.lemma_cache_info()
+    if info and info.hits + info.misses:
+        gauges.append(('cache_hit_ratio', {'cache': 'lemma'}, round(info.hits / (info.hits + info.misses), 4)))
+        gauges.append(('cache_entries', {'cache': 'lemma'}, info.currsize))
+    return Response(stats.prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/segments')
+def segments():
+    """Segment statistics of every index and the last merge the background scheduler ran on it"""
+    return jsonify(merge_scheduler.report())
+
 @app.route('/metrics', methods=['POST'])
 def metrics():
     """
@@ -126,20 +584,41 @@ def metrics():
         "fn": fn
     })
 
+@app.route('/metrics/evaluate', methods=['POST'])
+def evaluate_judged_queries():
+    """MAP, NDCG@k, MRR, P@k, recall and latency of a judged query set run against the live indexes.
+
+    The body lists queries with their relevant files (see utils.evaluation.parse_judgments);
+    results are ranked by file, like y_pred of /metrics.
+    """
+    try:
+        queries, k = parse_judgments(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    report = evaluate(queries, lambda q, filetype: run_query(q, filetype)[0], k)
+    logger.info("Evaluated %s judged queries: MAP %s, NDCG@%s %s", len(queries), report['summary']['map'], k,
+                report['summary'][f'ndcg@{k}'])
+    return jsonify(report)
+
 if __name__ == '__main__':
     # Create necessary directories
     os.makedirs(DOCUMENTS_DIR, exist_ok=True)
     
-    # Start indexing
-    print("Starting indexing...")
-    for indexer_name, indexer in indexers.items():
-        try:
-            print(f"Indexing files with {indexer_name} indexer...")
-            indexer.index_all_files()
-        except Exception as e:
-            print(f"Error during indexing with {indexer_name}: {str(e)}")
-            continue
+    # Start indexing (a replica only serves what it restores). Indexes persist across
+    # restarts, so only empty ones are built here; /index rescans on demand
+    if not REPLICA_DIR:
+        logger.info("Starting indexing...")
+        for indexer_name, indexer in indexers.items():
+            if indexer.ix.doc_count_all():
+                logger.info("Reusing the %s index (%s documents)", indexer_name, indexer.ix.doc_count_all())
+                continue
+            try:
+                logger.info("Indexing files with %s indexer...", indexer_name)
+                indexer.index_all_files()
+            except Exception as e:
+                logger.error("Error during indexing with %s: %s", indexer_name, e)
+                continue
     
     # Run the app
-    print("Starting Flask application...")
+    logger.info("Starting Flask application...")
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""Compare the throughput of StemmingAnalyzer, LemmaAnalyzer and TextProcessor.preprocess.
+
+Usage: python benchmarks/analyzer_throughput.py [--copies N] [--procs N]
+
+Needs the NLTK data listed in config.NLTK_DATA for the lemmatizing runs.
+"""
+import os
+import sys
+import time
+import argparse
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from whoosh.analysis import StemmingAnalyzer
+
+from config import LEMMA_CONFIG
+from benchmarks.doc_store_size import load_documents
+from utils.lemma_analyzer import LemmaAnalyzer, shared_processor
+
+
+def count_tokens(args):
+    analyzer, texts = args
+    return sum(1 for text in texts for _ in analyzer(text))
+
+
+def run_analyzer(analyzer, texts, procs):
+    """Tokens produced and seconds taken to analyze every text"""
+    start = time.perf_counter()
+    if procs > 1:
+        # Analyzers are pickled into the workers, as in a multiprocessing index writer
+        chunks = [texts[i::procs] for i in range(procs)]
+        with Pool(procs) as pool:
+            tokens = sum(pool.map(count_tokens, [(analyzer, chunk) for chunk in chunks]))
+    else:
+        tokens = count_tokens((analyzer, texts))
+    return tokens, time.perf_counter() - start
+
+
+def run_preprocess(texts):
+    """The per-document NLTK path of TextProcessor.preprocess"""
+    processor = shared_processor()
+    start = time.perf_counter()
+    tokens = sum(len(processor.preprocess(text).split()) for text in texts)
+    return tokens, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--copies', type=int, default=20, help='times to repeat the document set')
+    parser.add_argument('--procs', type=int, default=1, help='worker processes for the analyzer runs')
+    args = parser.parse_args()
+
+    texts = load_documents(args.copies)
+    size = sum(len(t.encode('utf-8')) for t in texts) / 1024 / 1024
+    print(f"{len(texts)} documents, {size:.2f} MB of text")
+
+    lemma = LemmaAnalyzer(batch_size=LEMMA_CONFIG['batch_size'])
+    runs = [
+        ('stemming', lambda: run_analyzer(StemmingAnalyzer(), texts, args.procs)),
+        ('lemma (cold)', lambda: run_analyzer(lemma, texts, args.procs)),
+        ('lemma (warm)', lambda: run_analyzer(lemma, texts, args.procs)),
+        ('preprocess', lambda: run_preprocess(texts)),
+    ]
+    for label, run in runs:
+        tokens, elapsed = run()
+        print(f"{label:>13}: {tokens / elapsed:12.0f} tokens/s, {size / elapsed:8.2f} MB/s ({elapsed:.2f}s)")
+
+    info = shared_processor()._lemma.cache_info()
+    if info.hits + info.misses:
+        print(f"lemma cache: {info.currsize} entries, hit rate {info.hits / (info.hits + info.misses):.1%}")
+
+
+if __name__ == '__main__':
+    main()
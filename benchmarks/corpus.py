@@ -0,0 +1,204 @@
+"""Seeded generator of a synthetic multi-format corpus for the benchmarks.
+
+Writes TXT, PDF, CSV, XLSX and JSON files whose total size approaches the
+requested number of megabytes. Words are drawn from a fixed synthetic
+vocabulary with a Zipf-like distribution, so the same seed and size always
+produce the same files and the same benchmark queries.
+
+Usage: python benchmarks/corpus.py OUTPUT_DIR [--size-mb N] [--seed N] [--formats txt,pdf,...]
+"""
+import os
+import json
+import random
+import argparse
+import itertools
+from bisect import bisect
+
+FORMATS = ('txt', 'pdf', 'csv', 'xlsx', 'json')
+
+# Share of the corpus size per format; PDF and XLSX are slow to write and parse
+FORMAT_WEIGHTS = {'txt': 0.35, 'pdf': 0.1, 'csv': 0.3, 'xlsx': 0.05, 'json': 0.2}
+
+# Target size of one generated file per format, in bytes
+FILE_SIZE = {'txt': 256 * 1024, 'pdf': 128 * 1024, 'csv': 4 * 1024 * 1024,
+             'xlsx': 1024 * 1024, 'json': 512 * 1024}
+
+SYLLABLES = ['ka', 'to', 'ri', 'men', 'sa', 'lo', 'ver', 'dan', 'pi', 'qu', 'el', 'bar',
+             'no', 'ti', 'gra', 'ph', 'ix', 'or', 'un', 'se', 'ar', 'mo', 'li', 'zen']
+
+
+class Vocabulary:
+    """Synthetic words with Zipf-like frequencies drawn from a seeded generator"""
+
+    def __init__(self, seed, size=20000):
+        self.random = random.Random(seed)
+        words = set()
+        while len(words) < size:
+            words.add(''.join(self.random.choice(SYLLABLES) for _ in range(self.random.randint(2, 4))))
+        self.words = sorted(words)
+        self.random.shuffle(self.words)
+        # Cumulative weights 1/rank for bisect sampling
+        self.cumulative = list(itertools.accumulate(1 / rank for rank in range(1, size + 1)))
+
+    def word(self):
+        return self.words[bisect(self.cumulative, self.random.random() * self.cumulative[-1])]
+
+    def sentence(self, length=None):
+        length = length or self.random.randint(6, 18)
+        return ' '.join(self.word() for _ in range(length)).capitalize() + '.'
+
+    def paragraph(self, sentences=None):
+        return ' '.join(self.sentence() for _ in range(sentences or self.random.randint(3, 8)))
+
+    def words_by_rank(self, start, stop):
+        """Words of a frequency band, e.g. (0, 100) for the most common ones"""
+        return self.words[start:stop]
+
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path, pages):
+    """Minimal PDF with one Helvetica text page per list of lines, readable by PyPDF2"""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for lines in pages:
+        stream = 'BT /F1 9 Tf 11 TL 40 800 Td ' + ' '.join(f'({_pdf_escape(line)}) Tj T*' for line in lines) + ' ET'
+        stream = stream.encode('latin-1', 'replace')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                       b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % len(objects))
+        kids.append(len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % k for k in kids), len(kids))
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+    return len(out)
+
+
+def _wrap(text, width=95):
+    line, lines = [], []
+    for word in text.split():
+        if sum(len(w) + 1 for w in line) + len(word) > width:
+            lines.append(' '.join(line))
+            line = []
+        line.append(word)
+    if line:
+        lines.append(' '.join(line))
+    return lines
+
+
+def _rows(vocab, target):
+    """CSV/XLSX rows of mixed text, numeric and date columns up to about ``target`` bytes"""
+    rng = vocab.random
+    size = 0
+    while size < target:
+        row = {
+            'id': rng.randint(1, 10 ** 9),
+            'name': f'{vocab.word()} {vocab.word()}',
+            'category': vocab.words[rng.randint(0, 30)],
+            'price': round(rng.uniform(1, 5000), 2),
+            'quantity': rng.randint(0, 1000),
+            'date': f'20{rng.randint(10, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'description': vocab.sentence(),
+        }
+        size += sum(len(str(v)) + 1 for v in row.values())
+        yield row
+
+
+def write_file(fmt, path, vocab, target):
+    """Write one file of roughly ``target`` bytes and return its size"""
+    if fmt == 'txt':
+        size = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            while size < target:
+                paragraph = vocab.paragraph() + '\n\n'
+                f.write(paragraph)
+                size += len(paragraph)
+    elif fmt == 'pdf':
+        pages, page, size = [], [], 0
+        while size < target:
+            for line in _wrap(vocab.paragraph()):
+                page.append(line)
+                size += len(line) + 8
+                if len(page) == 70:
+                    pages.append(page)
+                    page = []
+        pages.append(page or [vocab.sentence()])
+        return write_pdf(path, pages)
+    elif fmt == 'csv':
+        import csv
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = None
+            for row in _rows(vocab, target):
+                if writer is None:
+                    writer = csv.DictWriter(f, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+    elif fmt == 'xlsx':
+        import pandas as pd
+        rows = list(_rows(vocab, target))
+        half = len(rows) // 2
+        with pd.ExcelWriter(path) as writer:
+            pd.DataFrame(rows[:half]).to_excel(writer, sheet_name='first', index=False)
+            pd.DataFrame(rows[half:]).to_excel(writer, sheet_name='second', index=False)
+    elif fmt == 'json':
+        items, size = [], 0
+        while size < target:
+            item = {'title': vocab.sentence(4), 'author': {'name': vocab.word(), 'team': vocab.word()},
+                    'tags': [vocab.word() for _ in range(3)], 'body': vocab.paragraph()}
+            items.append(item)
+            size += len(json.dumps(item))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(items, f)
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+    return os.path.getsize(path)
+
+
+def generate(output_dir, size_mb, seed=0, formats=FORMATS):
+    """Write the corpus and return (vocabulary, {format: [paths]}, {format: bytes})"""
+    vocab = Vocabulary(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    total_weight = sum(FORMAT_WEIGHTS[fmt] for fmt in formats)
+    files, sizes = {}, {}
+    for fmt in formats:
+        budget = size_mb * 1024 * 1024 * FORMAT_WEIGHTS[fmt] / total_weight
+        files[fmt], sizes[fmt] = [], 0
+        number = 0
+        while sizes[fmt] < budget or not files[fmt]:
+            target = min(FILE_SIZE[fmt], max(1024, budget - sizes[fmt]))
+            path = os.path.join(output_dir, f'{fmt}_{number:05d}.{fmt}')
+            sizes[fmt] += write_file(fmt, path, vocab, target)
+            files[fmt].append(path)
+            number += 1
+    return vocab, files, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output_dir')
+    parser.add_argument('--size-mb', type=float, default=10, help='approximate corpus size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--formats', default=','.join(FORMATS), help='comma-separated subset of ' + ','.join(FORMATS))
+    args = parser.parse_args()
+
+    _, files, sizes = generate(args.output_dir, args.size_mb, args.seed, args.formats.split(','))
+    for fmt in files:
+        print(f"{fmt:>5}: {len(files[fmt])} files, {sizes[fmt] / 1024 / 1024:.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
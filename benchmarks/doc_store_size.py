@@ -0,0 +1,110 @@
+"""Compare index size and hit loading cost of stored `content` against the document store.
+
+Usage: python benchmarks/doc_store_size.py [--copies N] [--query TERM]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+import csv
+import json
+import copy
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from whoosh.fields import TEXT
+from whoosh.index import create_in
+from whoosh.qparser import QueryParser
+
+from config import DOCUMENTS_DIR, SCHEMA, analyzer
+from utils.doc_store import DocumentStore
+
+
+def load_documents(copies):
+    """Text of every TXT file, CSV row and JSON value in the documents directory"""
+    texts = []
+    for root, _, files in os.walk(DOCUMENTS_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            lower = name.lower()
+            if lower.endswith('.txt'):
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    texts.append(f.read())
+            elif lower.endswith('.csv'):
+                with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+                    for row in csv.DictReader(f):
+                        texts.append(' '.join(f"{k}: {v}" for k, v in row.items() if v))
+            elif lower.endswith('.json'):
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                values = data.values() if isinstance(data, dict) else data
+                texts.extend(str(value) for value in values)
+    return texts * copies
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def build(path, texts, use_store):
+    schema = copy.deepcopy(SCHEMA)
+    if not use_store:
+        schema.remove('content')
+        schema.add('content', TEXT(stored=True, analyzer=analyzer))
+    ix = create_in(path, schema)
+    store = DocumentStore(path) if use_store else None
+    writer = ix.writer()
+    for i, text in enumerate(texts):
+        fields = dict(filename=f'doc_{i}', filetype='bench', content=text, location=str(i),
+                      title=f'doc_{i}', timestamp=datetime.now())
+        if use_store:
+            fields['doc_id'] = store.put(text)
+        writer.add_document(**fields)
+    writer.commit()
+    if store:
+        store.flush()
+    return ix, store
+
+
+def measure_hits(ix, store, query, rounds):
+    """Time and peak memory of reading the content of every hit, `rounds` times"""
+    q = QueryParser('content', ix.schema).parse(query)
+    tracemalloc.start()
+    start = time.perf_counter()
+    with ix.searcher() as searcher:
+        for _ in range(rounds):
+            for hit in searcher.search(q, limit=20):
+                content = store.get(hit['doc_id']) if store else hit['content']
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--copies', type=int, default=50, help='times to repeat the document set')
+    parser.add_argument('--query', default='information', help='term used to read hits')
+    parser.add_argument('--rounds', type=int, default=200, help='searches per layout')
+    args = parser.parse_args()
+
+    texts = load_documents(args.copies)
+    raw = sum(len(t.encode('utf-8')) for t in texts)
+    print(f"{len(texts)} documents, {raw / 1024:.1f} KB of text")
+
+    for label, use_store in (('stored content', False), ('document store', True)):
+        with tempfile.TemporaryDirectory() as path:
+            ix, store = build(path, texts, use_store)
+            store_size = store.size_on_disk() if store else 0
+            index_size = directory_size(path) - store_size
+            elapsed, peak = measure_hits(ix, store, args.query, args.rounds)
+            ix.close()
+        print(f"{label:>15}: index {index_size / 1024:9.1f} KB, store {store_size / 1024:9.1f} KB, "
+              f"hit loading {elapsed * 1000 / args.rounds:.3f} ms/search, peak {peak / 1024:.1f} KB")
+
+
+if __name__ == '__main__':
+    main()
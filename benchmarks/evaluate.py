@@ -0,0 +1,104 @@
+"""Run a judged query set against a running instance and report relevance and latency.
+
+The judgments are either the JSON body of POST /metrics/evaluate
+({"k": 10, "queries": [{"id", "q", "filetype", "relevant"}, ...]}) or a
+TREC-style qrels file ("query_id 0 filename grade" per line) with --topics,
+a tab-separated "query_id<TAB>query text" file. The server runs the queries
+in parallel and returns MAP, NDCG@k, MRR, P@k, recall and per-query latency.
+
+With --baseline an earlier --output report is compared metric by metric,
+and the exit status is 1 if any mean metric dropped by more than
+--tolerance, so ranking speedups can be checked for relevance regressions.
+
+Usage: python benchmarks/evaluate.py JUDGMENTS [--topics FILE] [--url URL] [--k N] [--output FILE] [--baseline FILE]
+"""
+import sys
+import json
+import argparse
+import urllib.error
+import urllib.request
+
+# Mean metrics where a lower value is a regression
+QUALITY = ('map', 'mrr', 'ndcg@{k}', 'p@{k}', 'recall@{k}', 'recall')
+
+
+def read_trec(qrels_path, topics_path):
+    """Judged queries from a TREC qrels file and a query_id<TAB>text topics file"""
+    queries = {}
+    with open(topics_path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                query_id, text = line.rstrip('\n').split('\t', 1)
+                queries[query_id] = {'id': query_id, 'q': text, 'relevant': {}}
+    with open(qrels_path, encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 4 and parts[0] in queries:
+                queries[parts[0]]['relevant'][parts[2]] = float(parts[3])
+    return list(queries.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('judgments', help='JSON judged query set, or TREC qrels with --topics')
+    parser.add_argument('--topics', help='query_id<TAB>query text file for TREC qrels')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='base URL of the running app')
+    parser.add_argument('--k', type=int, help='cutoff of P@k, recall@k and NDCG@k')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='largest allowed drop of a mean metric')
+    args = parser.parse_args()
+
+    if args.topics:
+        body = {'queries': read_trec(args.judgments, args.topics)}
+    else:
+        with open(args.judgments, encoding='utf-8') as f:
+            body = json.load(f)
+    if args.k:
+        body['k'] = args.k
+
+    request = urllib.request.Request(f"{args.url.rstrip('/')}/metrics/evaluate", data=json.dumps(body).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=args.timeout) as response:
+            report = json.load(response)
+    except urllib.error.HTTPError as e:
+        sys.exit(f"Evaluation failed ({e.code}): {e.read().decode(errors='replace')}")
+
+    k = report['k']
+    names = [name.format(k=k) for name in QUALITY]
+    print(f"{'id':<12} {'ap':>7} {f'ndcg@{k}':>8} {'rr':>7} {f'p@{k}':>7} {'recall':>7} {'ms':>9}")
+    for row in report['queries']:
+        print(f"{row['id'][:12]:<12} {row['ap']:>7.3f} {row[f'ndcg@{k}']:>8.3f} {row['rr']:>7.3f} "
+              f"{row[f'p@{k}']:>7.3f} {row['recall']:>7.3f} {row['latency_ms']:>9.1f}"
+              + (f"  error: {row['error']}" if 'error' in row else ''))
+    summary = report['summary']
+    print(' '.join(f"{name}={summary[name]}" for name in names),
+          f"latency p50={summary['latency_p50_ms']}ms p95={summary['latency_p95_ms']}ms "
+          f"p99={summary['latency_p99_ms']}ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['k'] != k:
+            sys.exit(f"Baseline was computed with k={baseline['k']}, not {k}")
+        regressed = []
+        print(f"{'metric':<14} {'baseline':>9} {'current':>9} {'change':>9}")
+        for name in names + ['latency_p50_ms', 'latency_p95_ms', 'latency_p99_ms']:
+            old, new = baseline['summary'].get(name), summary[name]
+            print(f"{name:<14} {old if old is not None else '-':>9} {new:>9} "
+                  f"{f'{new - old:+.4f}' if old is not None else 'n/a':>9}")
+            if name in names and old is not None and old - new > args.tolerance:
+                regressed.append(name)
+        if regressed:
+            print(f"Relevance regressed: {', '.join(regressed)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Replay logged searches against a running instance and report throughput and latency.
+
+Reads a query log written with QUERY_LOG=1 (utils/query_log.py) and sends
+its searches to /search in logged order, cycling when it runs out. Two
+load models:
+
+  open loop   --qps N: requests start on a fixed schedule whether or not
+              earlier ones have finished. Latency is measured from the
+              scheduled start, so queueing inside this tool counts too.
+  closed loop --concurrency N: N clients each send the next request as soon
+              as their previous one completes.
+
+Several comma-separated --qps or --concurrency values run one step each;
+the report shows where throughput stops following the offered load and
+latency or errors climb, i.e. the saturation point.
+
+Usage: python benchmarks/replay.py QUERY_LOG [--url URL] (--qps N[,N...] | --concurrency N[,N...]) [--duration S] [--json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from itertools import cycle, islice
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.suite import percentile
+from utils.query_log import read_query_log
+
+
+def send(url, search, timeout):
+    """Run one search and return its HTTP status, or the exception class name on failure"""
+    params = {'q': search['query']}
+    if search['filetype'] and search['filetype'] != 'all':
+        params['filetype'] = search['filetype']
+    try:
+        with urllib.request.urlopen(f'{url}/search?{urllib.parse.urlencode(params)}', timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, OSError) as e:
+        return type(e).__name__
+
+
+def open_loop(url, searches, qps, duration, timeout, max_workers):
+    """Start qps requests a second for ``duration`` seconds; return (latency, outcome) pairs and elapsed time"""
+    total = max(1, int(qps * duration))
+    samples = []
+    lock = threading.Lock()
+
+    def run(search, scheduled):
+        outcome = send(url, search, timeout)
+        with lock:
+            samples.append((time.perf_counter() - scheduled, outcome))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for number, search in enumerate(islice(searches, total)):
+            scheduled = start + number / qps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, search, scheduled)
+    return samples, time.perf_counter() - start
+
+
+def closed_loop(url, searches, concurrency, duration, timeout):
+    """Keep ``concurrency`` requests in flight for ``duration`` seconds"""
+    samples = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < stop_at:
+            with lock:
+                search = next(searches)
+            sent = time.perf_counter()
+            outcome = send(url, search, timeout)
+            with lock:
+                samples.append((time.perf_counter() - sent, outcome))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, elapsed):
+    latencies = [seconds * 1000 for seconds, _ in samples]
+    outcomes = {}
+    for _, outcome in samples:
+        outcomes[str(outcome)] = outcomes.get(str(outcome), 0) + 1
+    errors = len(samples) - outcomes.get('200', 0)
+    summary = {
+        'requests': len(samples),
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0,
+        'error_rate': round(errors / len(samples), 4) if samples else 0,
+        'outcomes': outcomes,
+    }
+    if latencies:
+        summary.update({
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'max_ms': round(max(latencies), 3),
+        })
+    return summary
+
+
+def _levels(text):
+    return [float(v) for v in text.split(',')] if text else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('query_log')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='base URL of the running app')
+    load = parser.add_mutually_exclusive_group(required=True)
+    load.add_argument('--qps', help='open loop: target requests per second, comma-separated for several steps')
+    load.add_argument('--concurrency', help='closed loop: clients in flight, comma-separated for several steps')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per step')
+    parser.add_argument('--timeout', type=float, default=10, help='seconds before a request counts as failed')
+    parser.add_argument('--max-workers', type=int, default=256, help='open loop: requests allowed in flight')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    searches = list(read_query_log(args.query_log))
+    if not searches:
+        parser.error(f'no searches in {args.query_log}')
+    url = args.url.rstrip('/')
+
+    steps = []
+    for level in _levels(args.qps) or _levels(args.concurrency):
+        queue = cycle(searches)
+        if args.qps:
+            samples, elapsed = open_loop(url, queue, level, args.duration, args.timeout, args.max_workers)
+            step = {'mode': 'open', 'target_qps': level}
+        else:
+            samples, elapsed = closed_loop(url, queue, int(level), args.duration, args.timeout)
+            step = {'mode': 'closed', 'concurrency': int(level)}
+        step.update(summarize(samples, elapsed))
+        steps.append(step)
+        print(f"{step['mode']} {level:g}: {step['throughput_rps']} req/s, p50 {step.get('p50_ms', 0):.1f} ms, "
+              f"p99 {step.get('p99_ms', 0):.1f} ms, errors {step['error_rate']:.1%}", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps({'url': url, 'searches_logged': len(searches), 'steps': steps}, indent=2))
+    else:
+        print(f"{'load':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}")
+        for step in steps:
+            level = step.get('target_qps', step.get('concurrency'))
+            print(f"{level:>8g} {step['throughput_rps']:>9} {step.get('p50_ms', 0):>9.1f} "
+                  f"{step.get('p95_ms', 0):>9.1f} {step.get('p99_ms', 0):>9.1f} {step['error_rate']:>8.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Import-time profile of starting the search app.
+
+Runs `import app` in a fresh interpreter with `python -X importtime`, against
+an empty temporary index directory, and reports the startup time, the slowest
+top-level imports and which optional heavy dependencies got loaded (none of
+them should be until a file type is indexed).
+
+Usage: python benchmarks/startup_profile.py [--top N] [--json]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies that should only load when their file type is indexed or NLTK is used
+HEAVY_MODULES = ['nltk', 'pandas', 'numpy', 'PyPDF2', 'sklearn', 'bs4', 'requests', 'openpyxl']
+
+STARTUP_CODE = """
+import sys, time, json
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({'startup': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def parse_importtime(stderr):
+    """(module, self us, cumulative us) for the top-level imports in -X importtime output"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|', 2)
+        # Nested imports are indented under the module that triggered them
+        if name.startswith(' ') and not name.startswith('  '):
+            imports.append((name.strip(), int(self_us), int(cumulative)))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        env = dict(os.environ, INDEX_DIR=index_dir)
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+                              cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:], file=sys.stderr)
+        sys.exit(proc.returncode)
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    imports = sorted(parse_importtime(proc.stderr), key=lambda i: i[2], reverse=True)
+    report = {
+        'startup_seconds': round(result['startup'], 4),
+        'import_seconds': round(sum(i[2] for i in imports) / 1e6, 4),
+        'heavy_modules_loaded': result['loaded'],
+        'slowest_imports': [{'module': name, 'self_ms': self_us / 1000, 'cumulative_ms': cumulative / 1000}
+                            for name, self_us, cumulative in imports[:args.top]]
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"startup (import app): {report['startup_seconds'] * 1000:.1f} ms, "
+          f"imports {report['import_seconds'] * 1000:.1f} ms")
+    print(f"heavy modules loaded: {', '.join(report['heavy_modules_loaded']) or 'none'}")
+    print(f"{'module':<40} {'self ms':>9} {'cumulative ms':>14}")
+    for entry in report['slowest_imports']:
+        print(f"{entry['module']:<40} {entry['self_ms']:9.1f} {entry['cumulative_ms']:14.1f}")
+
+
+if __name__ == '__main__':
+    main()
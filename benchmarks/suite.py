@@ -0,0 +1,218 @@
+"""Indexing throughput and /search latency on a generated corpus, as JSON.
+
+Generates a seeded corpus (benchmarks/corpus.py) in a temporary directory,
+indexes it format by format with the app's own indexers into a temporary
+INDEX_DIR, then times /search requests through the Flask test client for
+term, phrase, AND, OR, wildcard and fuzzy queries drawn from the corpus
+vocabulary. The report holds the commit, the settings and, per format and
+query type, throughput or latency percentiles, so two runs can be compared
+with --compare.
+
+Usage: python benchmarks/suite.py [--size-mb N] [--seed N] [--queries N] [--output FILE] [--compare FILE]
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import FORMATS, generate
+
+# Indexer in app.indexers for each generated format
+INDEXER_FOR = {'txt': 'txt', 'pdf': 'pdf', 'csv': 'csv', 'xlsx': 'excel', 'json': 'json'}
+
+QUERY_TYPES = ('term', 'phrase', 'and', 'or', 'wildcard', 'fuzzy')
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process since the last reset_peak_rss()"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def reset_peak_rss():
+    """Reset the peak RSS counter where Linux allows it, so each format gets its own peak"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def make_queries(vocab, count, seed):
+    """``count`` query strings per query type from the mid-frequency band of the vocabulary"""
+    rng = random.Random(seed)
+    band = vocab.words_by_rank(20, 2000)
+    queries = {kind: [] for kind in QUERY_TYPES}
+    for _ in range(count):
+        a, b = rng.sample(band, 2)
+        queries['term'].append(a)
+        queries['phrase'].append(f'"{a} {b}"')
+        queries['and'].append(f'{a} AND {b}')
+        queries['or'].append(f'{a} OR {b}')
+        queries['wildcard'].append(f'{a[:3]}*')
+        # Drop one letter so the query needs the fuzzy variant to match
+        i = rng.randrange(1, len(a))
+        queries['fuzzy'].append(a[:i] + a[i + 1:])
+    return queries
+
+
+def run_indexing(app_module, files, sizes):
+    results = {}
+    for fmt, paths in files.items():
+        indexer = app_module.indexers[INDEXER_FOR[fmt]]
+        first_doc = len(indexer.doc_store)
+        exact_peak = reset_peak_rss()
+        start = time.perf_counter()
+        queued = [indexer.index_file(path) for path in paths]
+        # Include the commit of the queued documents
+        failures = set()
+        indexer.writes.flush(failures=failures)
+        failed = sum(1 for file in queued if file is None or not file.done(failures))
+        elapsed = time.perf_counter() - start
+        documents = len(indexer.doc_store) - first_doc
+        megabytes = sizes[fmt] / 1024 / 1024
+        results[fmt] = {
+            'files': len(paths),
+            'failed_files': failed,
+            'documents': documents,
+            'megabytes': round(megabytes, 3),
+            'seconds': round(elapsed, 3),
+            'docs_per_second': round(documents / elapsed, 1),
+            'mb_per_second': round(megabytes / elapsed, 3),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            # Without a resettable peak this is the process peak so far
+            'peak_rss_is_per_format': exact_peak,
+        }
+        print(f"indexed {fmt:>5}: {documents} docs, {megabytes:.1f} MB in {elapsed:.2f}s", file=sys.stderr)
+    return results
+
+
+def run_queries(app_module, queries, warmup):
+    client = app_module.app.test_client()
+    results = {}
+    for kind, texts in queries.items():
+        for text in texts[:warmup]:
+            client.get('/search', query_string={'q': text})
+        latencies, hits, errors = [], [], 0
+        for text in texts:
+            start = time.perf_counter()
+            response = client.get('/search', query_string={'q': text})
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+            else:
+                hits.append(len(response.get_json()))
+        results[kind] = {
+            'queries': len(texts),
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'max_ms': round(max(latencies), 3),
+            'mean_results': round(sum(hits) / len(hits), 2) if hits else 0,
+        }
+        print(f"queried {kind:>8}: p50 {results[kind]['p50_ms']:.2f} ms, "
+              f"p99 {results[kind]['p99_ms']:.2f} ms", file=sys.stderr)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    """Print the change of each throughput and latency figure against an earlier report"""
+    print(f"{'metric':<36} {'baseline':>12} {'current':>12} {'change':>8}")
+    rows = []
+    for fmt, stats in report['indexing'].items():
+        for key in ('docs_per_second', 'mb_per_second', 'peak_rss_mb'):
+            rows.append((f'indexing.{fmt}.{key}', baseline['indexing'].get(fmt, {}).get(key), stats[key]))
+    for kind, stats in report['queries'].items():
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            rows.append((f'queries.{kind}.{key}', baseline['queries'].get(kind, {}).get(key), stats[key]))
+    for name, old, new in rows:
+        change = f'{(new - old) / old:+.1%}' if old else 'n/a'
+        print(f"{name:<36} {old if old is not None else '-':>12} {new:>12} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=float, default=10, help='approximate corpus size')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the corpus and the queries')
+    parser.add_argument('--formats', default=','.join(FORMATS), help='comma-separated subset of ' + ','.join(FORMATS))
+    parser.add_argument('--queries', type=int, default=200, help='timed queries per query type')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed queries per type run first')
+    parser.add_argument('--corpus-dir', help='keep the generated corpus here instead of a temporary directory')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='earlier JSON report to compare against')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus_dir = args.corpus_dir or os.path.join(workdir, 'corpus')
+        start = time.perf_counter()
+        vocab, files, sizes = generate(corpus_dir, args.size_mb, args.seed, args.formats.split(','))
+        print(f"generated {sum(sizes.values()) / 1024 / 1024:.1f} MB in {time.perf_counter() - start:.1f}s",
+              file=sys.stderr)
+
+        # The app opens its indexes at import, so point it at an empty index directory first
+        os.environ['INDEX_DIR'] = os.path.join(workdir, 'indexes')
+        logging.disable(logging.INFO)
+        import app as app_module
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'size_mb': args.size_mb,
+                'seed': args.seed,
+                'queries_per_type': args.queries,
+            },
+            'indexing': run_indexing(app_module, files, sizes),
+            'queries': run_queries(app_module, make_queries(vocab, args.queries, args.seed), args.warmup),
+        }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
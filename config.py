@@ -1,5 +1,6 @@
 import os
-from whoosh.fields import Schema, TEXT, ID, DATETIME
+import logging
+from whoosh.fields import Schema, TEXT, ID, DATETIME, STORED, NUMERIC, KEYWORD
 from whoosh.analysis import StemmingAnalyzer
 
 # Base directory for the project
@@ -8,35 +9,187 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Directory for storing documents
 DOCUMENTS_DIR = os.path.join(BASE_DIR, 'data', 'documents')
 
-# Directory for storing indexes
-INDEX_DIR = os.path.join(BASE_DIR, 'data', 'indexes')
+# Directory for storing indexes (INDEX_DIR in the environment overrides it, e.g. for profiling runs)
+INDEX_DIR = os.environ.get('INDEX_DIR', os.path.join(BASE_DIR, 'data', 'indexes'))
+
+# Read-only replica node: REPLICA_DIR in the environment serves the snapshot generation
+# REPLICA_DIR/current points to (see utils/replication.py) instead of building indexes
+REPLICA_DIR = os.environ.get('REPLICA_DIR')
+if REPLICA_DIR:
+    INDEX_DIR = os.path.join(REPLICA_DIR, 'current')
 
 # Poppler configuration for Windows
 if os.name == 'nt':  # Windows
     POPPLER_PATH = os.environ.get('POPPLER_PATH', r'C:\Program Files\poppler-23.11.0\Library\bin')
     if not os.path.exists(POPPLER_PATH):
-        print(f"WARNING: Poppler not found at {POPPLER_PATH}")
-        print("Please install Poppler and set POPPLER_PATH environment variable")
-        print("You can download Poppler from: https://github.com/oschwartz10612/poppler-windows/releases/")
+        logging.getLogger(__name__).warning(
+            "Poppler not found at %s. Please install Poppler and set POPPLER_PATH environment variable. "
+            "You can download Poppler from: https://github.com/oschwartz10612/poppler-windows/releases/",
+            POPPLER_PATH)
 
 # Create directories if they don't exist
 os.makedirs(DOCUMENTS_DIR, exist_ok=True)
-os.makedirs(INDEX_DIR, exist_ok=True)
+if not REPLICA_DIR:
+    # On a replica this is a symlink that only a restored snapshot creates
+    os.makedirs(INDEX_DIR, exist_ok=True)
+
+# Analyzer for content and title: 'stemming' uses Whoosh's Porter stemmer, 'lemma'
+# uses NLTK WordNet lemmas (utils/lemma_analyzer.py, needs the NLTK data below).
+# Changing it requires re-indexing
+TEXT_ANALYZER = 'stemming'
+LEMMA_CONFIG = {
+    'cache_size': 100000,  # (word, POS bucket) -> lemma entries kept in the LRU cache
+    'batch_size': 1000  # Tokens POS-tagged per tagger call
+}
 
 # Create a stemming analyzer for better search results
-analyzer = StemmingAnalyzer()
+if TEXT_ANALYZER == 'lemma':
+    from utils.lemma_analyzer import LemmaAnalyzer
+    analyzer = LemmaAnalyzer(batch_size=LEMMA_CONFIG['batch_size'])
+else:
+    analyzer = StemmingAnalyzer()
 
 # Schema for Whoosh index
 SCHEMA = Schema(
-    filename=ID(stored=True),
-    filetype=ID(stored=True),
-    content=TEXT(stored=True, analyzer=analyzer),
+    filename=ID(stored=True, sortable=True),
+    filetype=ID(stored=True, sortable=True),
+    content=TEXT(analyzer=analyzer),  # Full text lives in the document store, see DOC_STORE_CONFIG
     location=ID(stored=True),
     title=TEXT(stored=True, analyzer=analyzer),
-    timestamp=DATETIME(stored=True)
+    timestamp=DATETIME(stored=True),
+    doc_id=STORED,  # Key into the document store
+    sheet=ID(stored=True, sortable=True),  # Excel sheet name
+    keypath=ID(stored=True, sortable=True),  # Flattened JSON key
+    cluster=ID(stored=True, sortable=True),  # Near-duplicate cluster, see DUPLICATE_CONFIG
+    vector_id=STORED  # Row in the similarity vectors, see VECTOR_CONFIG
 )
 
-# NLTK settings
+# Typed per-column fields for CSV/Excel rows (see COLUMN_FIELDS)
+SCHEMA.add('num_*', NUMERIC(float), glob=True)
+SCHEMA.add('date_*', DATETIME, glob=True)
+SCHEMA.add('kw_*', KEYWORD(lowercase=True, commas=True), glob=True)
+
+# Index storage per file type: 'disk' searches the FileStorage index directly,
+# 'ram' loads the persisted index into RamStorage at startup and periodically
+# writes committed changes back to the index directory
+INDEX_STORAGE = {
+    'pdf': 'disk',
+    'txt': 'disk',
+    'csv': 'disk',
+    'excel': 'disk',
+    'json': 'disk',
+    'web': 'disk'
+}
+RAM_SYNC_INTERVAL = 30  # Seconds between syncs of RAM-resident indexes to disk
+
+# Per-index write coordinator (utils/index_writer.py): documents from all producers are
+# queued and committed by one thread per index, so new documents are searchable
+# within about max_delay seconds
+WRITER_CONFIG = {
+    'max_docs': 5000,  # Queued documents that trigger a commit
+    'max_delay': 1.0,  # Seconds a queued document may wait for its commit
+    'max_queued': 50000,  # Queued documents at which producers wait for a commit (0 never waits)
+    'lock_timeout': 30.0  # Seconds to wait for a write lock held by another process
+}
+
+# Background segment merging (utils/merging.py): commits still merge their small segments
+# as they land; on top of that a scheduler merges segments of similar size, rewrites
+# segments with many deleted documents and optimizes, while an index is idle inside a quiet window
+MERGE_CONFIG = {
+    'enabled': True,
+    # 'HH:MM-HH:MM' local times, comma-separated in MERGE_WINDOWS; none means any time
+    'windows': [w.strip() for w in os.environ.get('MERGE_WINDOWS', '').split(',') if w.strip()],
+    'idle_seconds': 10,  # Seconds without commits before an index counts as quiet
+    'interval': 30,  # Seconds between checks of every index
+    'merge_factor': 10,  # Segments of one size tier merged together
+    'floor_bytes': 1024 * 1024,  # Segments smaller than this all count as the lowest tier
+    'max_merge_bytes': 64 * 1024 * 1024,  # Largest merge, except an optimize (a commit waits for a running merge)
+    'max_segments': 50,  # Beyond this many segments, merging also runs outside quiet windows
+    'deleted_ratio': 0.2,  # Share of deleted documents at which a segment is rewritten
+    'optimize_deleted_ratio': 0.3,  # Share of deleted documents at which a whole index is optimized...
+    'optimize_max_bytes': 256 * 1024 * 1024,  # ...if it is no larger than this
+    'io_bytes_per_second': 32 * 1024 * 1024  # Bytes read plus written per second of merging (0 means no limit)
+}
+
+# Document store holding the full text of indexed documents (one per index directory)
+DOC_STORE_CONFIG = {
+    'block_size': 64 * 1024,  # Uncompressed bytes packed into one compressed block
+    'cache_blocks': 64,  # Decompressed blocks kept in the LRU cache
+    'compression_level': 6  # zlib compression level
+}
+
+# Column-aware indexing of CSV/Excel files: column types are inferred per file and
+# each column is also indexed as num_<column>, date_<column> or kw_<column> so
+# /search?filter=price>100 runs as an index lookup
+COLUMN_FIELDS = {
+    'enabled': True,
+    'sample_rows': 100,  # Values checked when deciding whether a text column holds dates
+    'max_keyword_length': 100  # Longer text values are only searchable through content
+}
+
+# Text files are memory-mapped and indexed as overlapping passages, each located by
+# its byte range in the file (location path#bytes=start-end); files up to
+# passage_bytes stay one document
+PASSAGE_CONFIG = {
+    'passage_bytes': 16 * 1024,  # Approximate size of one passage
+    'overlap_bytes': 1024,  # Bytes repeated at the start of the next passage
+    'batch_passages': 500,  # Passages queued per write batch, bounding memory for very large files
+    'detect_bytes': 64 * 1024  # Leading bytes sampled to detect the encoding
+}
+
+# Near-duplicate detection at indexing time: each document gets a 64-bit SimHash,
+# looked up in an LSH band table shared by all indexes. Near-duplicates join the
+# cluster of the first copy ('cluster' mode, collapsed by /search) or are not
+# indexed at all ('skip' mode)
+DUPLICATE_CONFIG = {
+    'enabled': True,
+    'mode': 'cluster',
+    'max_distance': 3,  # Differing signature bits still counted as a near-duplicate
+    'bands': 4,  # LSH bands; must exceed max_distance
+    'min_tokens': 8,  # Shorter documents (e.g. small rows) are never clustered
+    'max_candidates': 64  # Signatures compared per band bucket
+}
+
+# "More like this" vectors behind /similar: hashed TF-IDF random projections of every
+# document in a memory-mapped float32 matrix, with a k-means (IVF) coarse index
+VECTOR_CONFIG = {
+    'enabled': True,
+    'dimensions': 256,
+    'hash_positions': 4,  # Dimensions each word is projected onto
+    'df_buckets': 2 ** 18,  # Hashed document-frequency counters for the IDF weights
+    'nlist': 64,  # Coarse cells
+    'nprobe': 8,  # Cells scanned per lookup
+    'train_min': 2048,  # Vectors before the cells are trained; smaller collections are scanned in full
+    'retrain_growth': 4,  # Retrain once the collection has grown this many times since the last training
+    'kmeans_iterations': 10,
+    'limit': 10  # Similar documents returned unless the request sets limit
+}
+
+# Structures built from each index's vocabulary, refreshed as segments are committed
+LEXICON_CONFIG = {
+    'fields': ['content', 'title'],
+    'ngram_size': 3,  # Character n-grams used to resolve *infix* and *suffix wildcards
+    'fuzzy_prefix_length': 7  # Leading characters of a term expanded into deletion neighbourhoods for fuzzy lookups
+}
+
+# Per-segment Bloom filters of each index vocabulary, used to skip indexes that
+# cannot match when searching all file types
+BLOOM_CONFIG = {
+    'enabled': True,
+    'error_rate': 0.01  # False positive rate of each filter
+}
+
+# Type-ahead completions served by /suggest from each index lexicon
+SUGGEST_CONFIG = {
+    'limit': 8,  # Completions returned per request
+    'precomputed_depth': 2,  # Prefixes up to this length have their top completions precomputed
+    'max_titles': 10000,  # Distinct document titles kept per index
+    'max_terms': 100000  # Distinct terms kept per index, and spellings of terms kept for all indexes
+}
+
+# NLTK settings. Missing data is only downloaded when NLTK_AUTO_DOWNLOAD is on;
+# otherwise install it with: python -m nltk.downloader punkt stopwords averaged_perceptron_tagger wordnet
+NLTK_AUTO_DOWNLOAD = False
 NLTK_DATA = {
     'stopwords': 'english',
     'punkt': True,
@@ -48,7 +201,16 @@ NLTK_DATA = {
 SEARCH_CONFIG = {
     'limit': 20,  # Maximum number of results to return
     'min_score': 0.1,  # Minimum score threshold for results
-    'fuzzy_distance': 2  # Maximum edit distance for fuzzy matching
+    'fuzzy_distance': 2,  # Maximum edit distance for fuzzy matching
+    'did_you_mean_below': 3,  # Suggest a respelled query when fewer results than this are found
+    'query_cache_size': 1024,  # Parsed queries kept per index
+    'collapse_limit': 3,  # Hits kept per source file (0 disables collapsing)
+    # Stop collecting once this many files have a full set of hits. Matches arrive in index
+    # order, not score order, so a better hit in a later file can be missed; such results
+    # are reported as partial. None scans all matches
+    'collapse_stop_after': None,
+    'time_budget': 1.0,  # Seconds a search may spend collecting across all indexes (None disables the limit)
+    'distinct': True  # Return one hit per near-duplicate cluster (distinct=0 on /search shows them all)
 }
 
 # File type configurations
@@ -79,4 +241,70 @@ FILE_TYPES = {
 FLASK_CONFIG = {
     'SECRET_KEY': 'your-secret-key-here',
     'DEBUG': True
-} 
\ No newline at end of file
+} 
+
+# Logging: level of the app's loggers (LOG_LEVEL in the environment overrides it) and
+# the fraction of DEBUG/INFO records that are kept; warnings and errors are always logged
+LOGGING_CONFIG = {
+    'level': os.environ.get('LOG_LEVEL', 'INFO'),
+    'sample_rate': 1.0,
+    'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'
+}
+
+# Metrics served at /stats in the Prometheus text format
+STATS_CONFIG = {
+    'prefix': 'search_engine_',
+    # Upper bounds in seconds of the timing histogram buckets
+    'buckets': (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+}
+
+# On-demand request profiling (profile=1 on /search and /index). Requests must send the
+# token in an X-Profile-Token header; profiling is off while no token is set. A
+# sample_rate fraction of ordinary requests is also profiled and saved to dir
+PROFILE_CONFIG = {
+    'token': os.environ.get('PROFILE_TOKEN'),
+    'sample_rate': 0.0,
+    'dir': os.path.join(BASE_DIR, 'data', 'profiles'),
+    'keep': 50,  # Saved artifacts kept in dir
+    'top': 30,  # Functions and allocation sites listed in the report
+    'traceback_frames': 5
+}
+
+# Optional log of the searches served (query, filetype, latency, result count), one
+# tab-separated line per search; benchmarks/replay.py replays it against /search
+QUERY_LOG_CONFIG = {
+    'enabled': os.environ.get('QUERY_LOG', '').lower() in ('1', 'true', 'yes', 'on'),
+    'path': os.path.join(BASE_DIR, 'data', 'query.log'),
+    'flush_every': 5,  # Seconds between writes of buffered lines
+    'buffer_lines': 1000,  # Buffered lines that force a write
+    'max_bytes': 64 * 1024 * 1024,  # Size at which the log is rotated (0 never rotates)
+    'backups': 3  # Rotated logs kept
+}
+
+# Batch relevance evaluation (POST /metrics/evaluate, benchmarks/evaluate.py)
+EVALUATION_CONFIG = {
+    'k': 10,  # Cutoff of P@k, recall@k and NDCG@k unless the request sets one
+    'workers': 4,  # Judged queries searched in parallel
+    'max_queries': 1000  # Largest query set accepted per request
+}
+
+# Bulk ingestion through POST /documents: NDJSON bodies are read line by line and
+# acknowledged per batch; multipart uploads are saved to upload_dir and indexed
+INGEST_CONFIG = {
+    'batch_size': 5000,  # NDJSON lines per acknowledged batch
+    'max_line_bytes': 16 * 1024 * 1024,  # Longer NDJSON lines are rejected
+    'upload_dir': os.path.join(DOCUMENTS_DIR, 'uploads')
+}
+
+# Index snapshots (python -m utils.replication): a snapshot copies the latest committed
+# generation of every index into snapshot_dir, shipping only segment files and file
+# chunks the destination does not hold yet; replicas restore snapshots into new
+# generation directories and switch to them atomically
+REPLICATION_CONFIG = {
+    'snapshot_dir': os.environ.get('SNAPSHOT_DIR', os.path.join(BASE_DIR, 'data', 'snapshots')),
+    'chunk_bytes': 1024 * 1024,  # Unit in which files other than segments are compared and shipped
+    'keep_snapshots': 5,  # Snapshots kept in snapshot_dir, with the files they use
+    'keep_generations': 2,  # Restored generations kept on a replica, so in-flight searches finish
+    'poll_interval': 5,  # Seconds between checks for a new snapshot or generation
+    'retries': 5  # Attempts at capturing an index that a merge keeps changing
+}
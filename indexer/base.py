@@ -6,13 +6,16 @@ from whoosh.qparser import QueryParser, MultifieldParser
 from whoosh.query import FuzzyTerm, Wildcard
 from whoosh.analysis import StemmingAnalyzer
 import os
+import logging
 
-from config import INDEX_DIR, SCHEMA
-from utils.text_processor import TextProcessor
+from config import INDEX_DIR, SCHEMA, SEARCH_CONFIG
+from utils.doc_store import open_doc_store
+from utils.lexicon import Lexicon
+
+logger = logging.getLogger(__name__)
 
 class BaseIndexer(ABC):
     def __init__(self):
-        self.text_processor = TextProcessor()
         self.schema = Schema(
             filename=ID(stored=True),
             filetype=ID(stored=True),
@@ -22,9 +25,17 @@ class BaseIndexer(ABC):
             timestamp=DATETIME(stored=True)
         )
         self._ensure_index()
+        self.doc_store = open_doc_store(INDEX_DIR, self.ix)
+        self.lexicon = Lexicon()
         self.analyzer = StemmingAnalyzer()
         self.query_parser = QueryParser("content", schema=SCHEMA)
 
+    @property
+    def text_processor(self):
+        """Shared TextProcessor, loaded on first use since it imports NLTK and checks its data"""
+        from utils.text_processor import get_text_processor
+        return get_text_processor()
+
     def _ensure_index(self):
         """Ensure the index directory exists and create it if it doesn't"""
         if not os.path.exists(INDEX_DIR):
@@ -56,6 +67,7 @@ class BaseIndexer(ABC):
                     filename=doc['filename'],
                     filetype=doc['filetype'],
                     content=doc['content'],
+                    doc_id=self.doc_store.put(doc['content']),
                     location=doc['location'],
                     title=doc['title'],
                     timestamp=datetime.now()
@@ -63,9 +75,10 @@ class BaseIndexer(ABC):
             
             # Commit the changes
             writer.commit()
+            self.doc_store.flush()
             return True
         except Exception as e:
-            print(f"Error indexing file {file_path}: {str(e)}")
+            logger.error("Error indexing file %s: %s", file_path, e)
             return False
 
     def index_document(self, path, content, metadata=None):
@@ -75,15 +88,17 @@ class BaseIndexer(ABC):
             writer.add_document(
                 path=path,
                 content=content,
+                doc_id=self.doc_store.put(content),
                 title=metadata.get('title', '') if metadata else '',
                 created=metadata.get('created', datetime.now()) if metadata else datetime.now(),
                 modified=metadata.get('modified', datetime.now()) if metadata else datetime.now()
             )
             writer.commit()
+            self.doc_store.flush()
             return True
         except Exception as e:
             writer.cancel()
-            print(f"Error indexing document {path}: {str(e)}")
+            logger.error("Error indexing document %s: %s", path, e)
             return False
 
     def search(self, query, filetype=None, limit=20):
@@ -107,7 +122,7 @@ class BaseIndexer(ABC):
             elif '~' in query:
                 # Handle fuzzy queries
                 term = query.replace('~', '')
-                q = FuzzyTerm('content', term)
+                q = FuzzyTerm('content', term, maxdist=SEARCH_CONFIG['fuzzy_distance'])
             else:
                 # Handle phrase queries
                 q = QueryParser('content', self.schema).parse(query)
@@ -116,6 +131,10 @@ class BaseIndexer(ABC):
             if filetype:
                 q = q & QueryParser('filetype', self.schema).parse(filetype)
             
+            # Resolve wildcard and fuzzy expansion through the lexicon structures
+            self.lexicon.refresh(searcher.reader())
+            q = self.lexicon.rewrite_query(q)
+
             # Execute the search
             results = searcher.search(q, limit=limit)
             
@@ -125,7 +144,7 @@ class BaseIndexer(ABC):
                 processed_results.append({
                     'filename': result['filename'],
                     'filetype': result['filetype'],
-                    'content': result['content'],
+                    'content': self.doc_store.get(result.get('doc_id')),
                     'location': result['location'],
                     'title': result['title'],
                     'score': result.score
@@ -133,7 +152,7 @@ class BaseIndexer(ABC):
             
             return processed_results
         except Exception as e:
-            print(f"Error searching: {str(e)}")
+            logger.error("Error searching: %s", e)
             return []
         finally:
             searcher.close()
@@ -144,8 +163,9 @@ class BaseIndexer(ABC):
         try:
             writer.delete_by_query(None)
             writer.commit()
+            self.doc_store.clear()
             return True
         except Exception as e:
             writer.cancel()
-            print(f"Error clearing index: {str(e)}")
+            logger.error("Error clearing index: %s", e)
             return False 
\ No newline at end of file
@@ -0,0 +1,159 @@
+import time
+from bisect import insort
+from collections import defaultdict
+from whoosh import sorting
+from whoosh.collectors import TopCollector, WrappingCollector
+from whoosh.searching import TimeLimit
+
+
+class CollapsibleTopCollector(TopCollector):
+    """Whoosh's TopCollector, but a removed hit reopens its slot to any score.
+
+    Whoosh keeps the k-th score as the quality threshold after remove(), so
+    block-quality skipping and matcher replacement would go on skipping
+    postings that now fit in the freed slot. The collapse collectors remove
+    hits, so this is the top-k collector under them.
+    """
+
+    def remove(self, global_docnum):
+        TopCollector.remove(self, global_docnum)
+        if len(self.items) < self.limit:
+            self.minscore = 0
+
+
+class SourceCollapseCollector(WrappingCollector):
+    """Keep the best ``limit`` hits per source file and count the rest.
+
+    Row-level (CSV/Excel) and field-level (JSON) documents share the filename
+    of the file they came from, so without collapsing one large file can fill
+    every result slot. Unlike Whoosh's CollapseCollector, the decision is made
+    in ``collect()``, so this collector can sit under a FacetCollector (facet
+    counts still see every match) and under a FilterCollector. It also counts
+    hits displaced from a source's best list. With ``stop_after`` it stops the
+    match loop once that many sources have a full list of hits instead of
+    walking every posting of a broad query; matches arrive in document
+    order, so a better hit in a later source can be missed and the results
+    report ``stopped_early``. Collapsers can be stacked (by
+    source file and by near-duplicate cluster): a hit removed by an outer one
+    is also dropped from this one's lists.
+    """
+
+    def __init__(self, child, fieldname='filename', limit=1, stop_after=None, counts_name='collapsed_counts'):
+        self.child = child
+        # Results attribute the displaced-hit counts are reported in, distinct per stacked collapser
+        self.counts_name = counts_name
+        self.keyfacet = sorting.FieldFacet(fieldname)
+        self.limit = limit
+        self.stop_after = stop_after
+
+    def prepare(self, top_searcher, q, context):
+        self.keyer = self.keyfacet.categorizer(top_searcher)
+        # Source key -> sorted list of (sortkey, global_docnum) for the best hits
+        self.lists = defaultdict(list)
+        # global_docnum -> source key of each kept hit
+        self.keys = {}
+        # Source key -> number of hits left out of the results
+        self.collapsed_counts = defaultdict(int)
+        self.collapsed_total = 0
+        self.full_sources = 0
+        self.stopped = False
+        self.child.prepare(top_searcher, q, context.set(needs_current=True))
+
+    def set_subsearcher(self, subsearcher, offset):
+        WrappingCollector.set_subsearcher(self, subsearcher, offset)
+        self.keyer.set_searcher(subsearcher, offset)
+
+    def count(self):
+        return self.child.count() - self.collapsed_total
+
+    def matches(self):
+        for sub_docnum in self.child.matches():
+            if self.stopped:
+                return
+            yield sub_docnum
+
+    def collect(self, sub_docnum):
+        child = self.child
+        key = self.keyer.key_to_name(self.keyer.key_for(child.matcher, sub_docnum))
+        if not key:
+            return child.collect(sub_docnum)
+
+        sortkey = child.sort_key(sub_docnum)
+        global_docnum = child.offset + sub_docnum
+        best = self.lists[key]
+        if len(best) < self.limit:
+            insort(best, (sortkey, global_docnum))
+            self.keys[global_docnum] = key
+            if len(best) == self.limit:
+                self.full_sources += 1
+                if self.stop_after and self.full_sources >= self.stop_after:
+                    self.stopped = True
+            return child.collect(sub_docnum)
+
+        self.collapsed_counts[key] += 1
+        self.collapsed_total += 1
+        if sortkey < best[-1][0]:
+            # Replace the weakest kept hit of this source
+            removed = best.pop()[1]
+            del self.keys[removed]
+            child.remove(removed)
+            insort(best, (sortkey, global_docnum))
+            self.keys[global_docnum] = key
+            return child.collect(sub_docnum)
+        return sortkey
+
+    def remove(self, global_docnum):
+        key = self.keys.pop(global_docnum, None)
+        if key is not None:
+            best = self.lists[key]
+            if len(best) == self.limit:
+                self.full_sources -= 1
+            best[:] = [entry for entry in best if entry[1] != global_docnum]
+        self.child.remove(global_docnum)
+
+    def results(self):
+        r = self.child.results()
+        setattr(r, self.counts_name, dict(self.collapsed_counts))
+        r.stopped_early = getattr(r, 'stopped_early', False) or self.stopped
+        return r
+
+
+class DeadlineCollector(WrappingCollector):
+    """Raise TimeLimit once ``time.perf_counter()`` passes ``deadline``.
+
+    Works like Whoosh's TimeLimitCollector, but without a timer thread or
+    SIGALRM (which only works on the main thread, not in request workers):
+    the clock is read in ``matches()`` every ``check_every`` matches, so it
+    also works under a FilterCollector, and before each segment, so the term
+    expansion of later segments is skipped too. The deadline is absolute, so
+    one budget can be shared by the searches of several indexes. The wrapped
+    collector keeps the hits collected so far.
+    """
+
+    def __init__(self, child, deadline, check_every=256):
+        self.child = child
+        self.deadline = deadline
+        self.check_every = check_every
+        self.timedout = False
+
+    def _check(self):
+        if time.perf_counter() >= self.deadline:
+            self.timedout = True
+            raise TimeLimit
+
+    def prepare(self, top_searcher, q, context):
+        self.timedout = False
+        self.child.prepare(top_searcher, q, context)
+
+    def set_subsearcher(self, subsearcher, offset):
+        self._check()
+        WrappingCollector.set_subsearcher(self, subsearcher, offset)
+
+    def matches(self):
+        countdown = self.check_every
+        for sub_docnum in self.child.matches():
+            countdown -= 1
+            if not countdown:
+                self._check()
+                countdown = self.check_every
+            yield sub_docnum
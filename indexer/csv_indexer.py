@@ -1,37 +1,51 @@
 import os
-import pandas as pd
+import time
+import logging
 from datetime import datetime
-from whoosh.fields import Schema, TEXT, ID, DATETIME
-from whoosh.index import create_in, open_dir
-from whoosh.qparser import QueryParser, MultifieldParser, FuzzyTermPlugin, WildcardPlugin
-from whoosh.analysis import StemmingAnalyzer, StandardAnalyzer
-from config import INDEX_DIR, SCHEMA
+from config import INDEX_DIR, COLUMN_FIELDS
+from utils.index_storage import open_index
+from utils.doc_store import open_doc_store
+from utils.index_writer import IndexWriteCoordinator, QueuedFile
+from indexer.searching import search_index, complete_index, query_may_match, refresh_vocabulary, respell_query, term_known, SearchResults, QueryCache
+from utils.lexicon import Lexicon
+from utils.bloom import VocabularyFilter
+from utils.column_schema import infer_column_types, row_fields
+
+logger = logging.getLogger(__name__)
 
 class CSVIndexer:
     def __init__(self):
-        print("Initializing CSV indexer...")
+        logger.info("Initializing CSV indexer...")
         self.index_dir = os.path.join(INDEX_DIR, 'csv')
         if not os.path.exists(self.index_dir):
-            print(f"Creating CSV index directory at {self.index_dir}")
+            logger.info("Creating CSV index directory at %s", self.index_dir)
             os.makedirs(self.index_dir)
         
         # Create or open the index
-        if not os.path.exists(os.path.join(self.index_dir, 'index')):
-            print("Creating new CSV index...")
-            self.ix = create_in(self.index_dir, SCHEMA)
-        else:
-            print("Opening existing CSV index...")
-            self.ix = open_dir(self.index_dir)
+        self.ix = open_index(self.index_dir, 'csv', 'CSV')
+        self.doc_store = open_doc_store(self.index_dir, self.ix)
+        self.writes = IndexWriteCoordinator(self.ix, self.doc_store, 'csv')
+        self.lexicon = Lexicon()
+        self.vocabulary = VocabularyFilter()
+        # Skip checks stay current with every commit instead of waiting for the next search
+        self.writes.on_commit.append(self.refresh)
+        self.queries = QueryCache()
+        self.column_fields = COLUMN_FIELDS['enabled']
 
     def index_file(self, file_path):
-        """Index a CSV file"""
-        print(f"Indexing CSV file: {file_path}")
+        """Queue a CSV file for indexing; returns its QueuedFile, or None if it could not be read"""
+        import pandas as pd
+        logger.info("Indexing CSV file: %s", file_path)
+        start = time.perf_counter()
         try:
             # Read the CSV file
             df = pd.read_csv(file_path)
+            column_types = infer_column_types(df) if self.column_fields else {}
+            if column_types:
+                logger.debug("Column types for %s: %s", file_path, column_types)
             
             # Process each row
-            writer = self.ix.writer()
+            writer = self.writes.batch()
             for i, row in df.iterrows():
                 # Convert row to string representation with column names
                 content_parts = []
@@ -48,94 +62,76 @@ class CSVIndexer:
                     content=content,
                     location=f'row_{i+1}',
                     title=f'{os.path.basename(file_path)} - Row {i+1}',
-                    timestamp=datetime.now()
+                    timestamp=datetime.now(),
+                    **row_fields(row, column_types)
                 )
             
-            writer.commit()
-            print(f"Successfully indexed {file_path}")
-            return True
+            queued = QueuedFile(self.writes, file_path, os.path.getsize(file_path), start)
+            queued.add(writer)
+            return queued
 
         except Exception as e:
-            print(f"Error processing CSV file {file_path}: {str(e)}")
-            return False
+            logger.error("Error processing CSV file %s: %s", file_path, e)
+            return None
 
-    def search(self, query_text):
+    def search(self, query_text, **options):
         """Search the index"""
-        print(f"Searching CSV index for: {query_text}")
+        logger.debug("Searching CSV index for: %s", query_text)
         try:
-            with self.ix.searcher() as searcher:
-                # Create a parser that searches in both title and content
-                parser = MultifieldParser(["content", "title"], self.ix.schema)
-                parser.add_plugin(FuzzyTermPlugin())  # Add fuzzy matching
-                parser.add_plugin(WildcardPlugin())   # Add wildcard matching
-                
-                # Try different query variations
-                queries = [
-                    query_text,                    # Original query
-                    f"*{query_text}*",            # Wildcard match
-                    f"{query_text}~",             # Fuzzy match
-                    query_text.lower(),           # Lowercase
-                    query_text.upper()            # Uppercase
-                ]
-                
-                all_results = []
-                for q in queries:
-                    try:
-                        # Parse the query
-                        query = parser.parse(q)
-                        print(f"Trying query: {q}")
-                        
-                        # Search with fuzzy matching
-                        results = searcher.search(query, limit=20)
-                        print(f"Found {len(results)} results for query: {q}")
-                        
-                        # Add results to all_results
-                        for result in results:
-                            result_dict = {
-                                'filename': result['filename'],
-                                'filetype': result['filetype'],
-                                'content': result['content'],
-                                'location': result['location'],
-                                'title': result['title'],
-                                'score': result.score
-                            }
-                            # Only add if not already in results
-                            if result_dict not in all_results:
-                                all_results.append(result_dict)
-                    except Exception as e:
-                        print(f"Error with query {q}: {str(e)}")
-                        continue
-                
-                # Sort results by score
-                all_results.sort(key=lambda x: x['score'], reverse=True)
-                
-                # Print debug information
-                print(f"Total unique results found: {len(all_results)}")
+            all_results = search_index(self.ix, self.doc_store, query_text, lexicon=self.lexicon,
+                                       queries=self.queries, **options)
+
+            # Per-result dump, only built when debug logging is on
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Total unique results found: %s", len(all_results))
                 for i, result in enumerate(all_results):
-                    print(f"Result {i+1}:")
-                    print(f"  Title: {result['title']}")
-                    print(f"  Filename: {result['filename']}")
-                    print(f"  Score: {result['score']}")
-                    if result['content']:
-                        print(f"  Content preview: {result['content'][:100]}...")
-                
-                return all_results
+                    logger.debug("Result %s: title=%r filename=%r score=%s preview=%r", i + 1, result['title'],
+                                 result['filename'], result['score'], (result['content'] or '')[:100])
+
+            return all_results
         except Exception as e:
-            print(f"Error searching CSV index: {str(e)}")
-            return []
+            logger.error("Error searching CSV index: %s", e)
+            return SearchResults()
+
+    def may_match(self, query_text):
+        """False if no document of this index can match the query"""
+        return query_may_match(self.ix, query_text, self.vocabulary, self.lexicon, self.queries)
+
+    def refresh(self):
+        """Bring the Bloom filters and lexicon up to the latest commit"""
+        refresh_vocabulary(self.ix, self.vocabulary, self.lexicon)
+
+    def did_you_mean(self, query_text):
+        """Respelled query, its weight and the respelled terms for an index that was skipped"""
+        return respell_query(self.ix, self.lexicon, query_text)
+
+    def knows(self, term):
+        """False if no document of this index contains the analyzed term"""
+        return term_known(self.ix, self.vocabulary, term)
+
+    def suggest(self, prefix, limit):
+        """Type-ahead completions for a prefix"""
+        return complete_index(self.ix, self.lexicon, prefix, limit)
 
     def index_all_files(self):
         """Index all CSV files in the documents directory"""
         from config import DOCUMENTS_DIR
-        print(f"Scanning for CSV files in {DOCUMENTS_DIR}")
+        logger.debug("Scanning for CSV files in %s", DOCUMENTS_DIR)
         csv_files = []
         for root, _, files in os.walk(DOCUMENTS_DIR):
             for file in files:
                 if file.lower().endswith('.csv'):
                     file_path = os.path.join(root, file)
                     csv_files.append(file_path)
-                    print(f"Found CSV file: {file_path}")
+                    logger.debug("Found CSV file: %s", file_path)
         
-        print(f"Found {len(csv_files)} CSV files to index")
+        logger.debug("Found %s CSV files to index", len(csv_files))
+        queued = []
         for file_path in csv_files:
-            self.index_file(file_path) 
\ No newline at end of file
+            queued.append(self.index_file(file_path))
+        # One commit for the whole scan, after which each file is recorded as indexed
+        failures = set()
+        self.writes.flush(failures=failures)
+        for file in queued:
+            if file is not None:
+                file.done(failures)
\ No newline at end of file
@@ -1,32 +1,45 @@
 import os
-import pandas as pd
+import time
+import logging
 from datetime import datetime
-from whoosh.fields import Schema, TEXT, ID, DATETIME
-from whoosh.index import create_in, open_dir
-from whoosh.qparser import MultifieldParser, FuzzyTermPlugin, WildcardPlugin
-from config import INDEX_DIR, SCHEMA
+from config import INDEX_DIR, COLUMN_FIELDS
+from utils.index_storage import open_index
+from utils.doc_store import open_doc_store
+from utils.index_writer import IndexWriteCoordinator, QueuedFile
+from indexer.searching import search_index, complete_index, query_may_match, refresh_vocabulary, respell_query, term_known, SearchResults, QueryCache
+from utils.lexicon import Lexicon
+from utils.bloom import VocabularyFilter
+from utils.column_schema import infer_column_types, row_fields
+
+logger = logging.getLogger(__name__)
 
 class ExcelIndexer:
     def __init__(self):
-        print("Initializing Excel indexer...")
+        logger.info("Initializing Excel indexer...")
         self.index_dir = os.path.join(INDEX_DIR, 'excel')
         if not os.path.exists(self.index_dir):
-            print(f"Creating Excel index directory at {self.index_dir}")
+            logger.info("Creating Excel index directory at %s", self.index_dir)
             os.makedirs(self.index_dir)
-        if not os.path.exists(os.path.join(self.index_dir, 'index')):
-            print("Creating new Excel index...")
-            self.ix = create_in(self.index_dir, SCHEMA)
-        else:
-            print("Opening existing Excel index...")
-            self.ix = open_dir(self.index_dir)
+        self.ix = open_index(self.index_dir, 'excel', 'Excel')
+        self.doc_store = open_doc_store(self.index_dir, self.ix)
+        self.writes = IndexWriteCoordinator(self.ix, self.doc_store, 'excel')
+        self.lexicon = Lexicon()
+        self.vocabulary = VocabularyFilter()
+        # Skip checks stay current with every commit instead of waiting for the next search
+        self.writes.on_commit.append(self.refresh)
+        self.queries = QueryCache()
+        self.column_fields = COLUMN_FIELDS['enabled']
 
     def index_file(self, file_path):
-        print(f"Indexing Excel file: {file_path}")
+        import pandas as pd
+        logger.info("Indexing Excel file: %s", file_path)
+        start = time.perf_counter()
         try:
             excel_file = pd.ExcelFile(file_path)
-            writer = self.ix.writer()
+            writer = self.writes.batch()
             for sheet_name in excel_file.sheet_names:
                 df = pd.read_excel(file_path, sheet_name=sheet_name)
+                column_types = infer_column_types(df) if self.column_fields else {}
                 for i, row in df.iterrows():
                     content = ' '.join(str(value) for value in row.values if pd.notnull(value))
                     writer.add_document(
@@ -34,65 +47,64 @@ class ExcelIndexer:
                         filetype='excel',
                         content=content,
                         location=f"{file_path}#sheet_{sheet_name}_row_{i+1}",
+                        sheet=str(sheet_name),
                         title=f"{os.path.basename(file_path)} - {sheet_name} - Row {i+1}",
-                        timestamp=datetime.now()
+                        timestamp=datetime.now(),
+                        **row_fields(row, column_types)
                     )
-            writer.commit()
-            print(f"Successfully indexed {file_path}")
-            return True
+            queued = QueuedFile(self.writes, file_path, os.path.getsize(file_path), start)
+            queued.add(writer)
+            return queued
         except Exception as e:
-            print(f"Error processing Excel file {file_path}: {str(e)}")
-            return False
+            logger.error("Error processing Excel file %s: %s", file_path, e)
+            return None
 
-    def search(self, query_text):
-        print(f"Searching Excel index for: {query_text}")
+    def search(self, query_text, **options):
+        logger.debug("Searching Excel index for: %s", query_text)
         try:
-            with self.ix.searcher() as searcher:
-                parser = MultifieldParser(["content", "title"], self.ix.schema)
-                parser.add_plugin(FuzzyTermPlugin())
-                parser.add_plugin(WildcardPlugin())
-                queries = [
-                    query_text,
-                    f"*{query_text}*",
-                    f"{query_text}~",
-                    query_text.lower(),
-                    query_text.upper()
-                ]
-                all_results = []
-                for q in queries:
-                    try:
-                        query = parser.parse(q)
-                        results = searcher.search(query, limit=20)
-                        for result in results:
-                            result_dict = {
-                                'filename': result['filename'],
-                                'filetype': result['filetype'],
-                                'content': result['content'],
-                                'location': result['location'],
-                                'title': result['title'],
-                                'score': result.score
-                            }
-                            if result_dict not in all_results:
-                                all_results.append(result_dict)
-                    except Exception as e:
-                        print(f"Error with query {q}: {str(e)}")
-                        continue
-                all_results.sort(key=lambda x: x['score'], reverse=True)
-                return all_results
+            return search_index(self.ix, self.doc_store, query_text, lexicon=self.lexicon,
+                                queries=self.queries, **options)
         except Exception as e:
-            print(f"Error searching Excel index: {str(e)}")
-            return []
+            logger.error("Error searching Excel index: %s", e)
+            return SearchResults()
+
+    def may_match(self, query_text):
+        """False if no document of this index can match the query"""
+        return query_may_match(self.ix, query_text, self.vocabulary, self.lexicon, self.queries)
+
+    def refresh(self):
+        """Bring the Bloom filters and lexicon up to the latest commit"""
+        refresh_vocabulary(self.ix, self.vocabulary, self.lexicon)
+
+    def did_you_mean(self, query_text):
+        """Respelled query, its weight and the respelled terms for an index that was skipped"""
+        return respell_query(self.ix, self.lexicon, query_text)
+
+    def knows(self, term):
+        """False if no document of this index contains the analyzed term"""
+        return term_known(self.ix, self.vocabulary, term)
+
+    def suggest(self, prefix, limit):
+        """Type-ahead completions for a prefix"""
+        return complete_index(self.ix, self.lexicon, prefix, limit)
 
     def index_all_files(self):
         from config import DOCUMENTS_DIR
-        print(f"Scanning for Excel files in {DOCUMENTS_DIR}")
+        logger.debug("Scanning for Excel files in %s", DOCUMENTS_DIR)
         excel_files = []
         for root, _, files in os.walk(DOCUMENTS_DIR):
             for file in files:
                 if file.lower().endswith('.xlsx'):
                     file_path = os.path.join(root, file)
                     excel_files.append(file_path)
-                    print(f"Found Excel file: {file_path}")
-        print(f"Found {len(excel_files)} Excel files to index")
+                    logger.debug("Found Excel file: %s", file_path)
+        logger.debug("Found %s Excel files to index", len(excel_files))
+        queued = []
         for file_path in excel_files:
-            self.index_file(file_path) 
\ No newline at end of file
+            queued.append(self.index_file(file_path))
+        # One commit for the whole scan, after which each file is recorded as indexed
+        failures = set()
+        self.writes.flush(failures=failures)
+        for file in queued:
+            if file is not None:
+                file.done(failures)
\ No newline at end of file
@@ -1,31 +1,40 @@
 import os
-import PyPDF2
+import time
+import logging
 from datetime import datetime
-from whoosh.fields import Schema, TEXT, ID, DATETIME
-from whoosh.index import create_in, open_dir
-from whoosh.qparser import QueryParser, MultifieldParser, FuzzyTermPlugin, WildcardPlugin
-from whoosh.analysis import StemmingAnalyzer
-from config import INDEX_DIR, SCHEMA
+from config import INDEX_DIR
+from utils.index_storage import open_index
+from utils.doc_store import open_doc_store
+from utils.index_writer import IndexWriteCoordinator, QueuedFile
+from indexer.searching import search_index, complete_index, query_may_match, refresh_vocabulary, respell_query, term_known, SearchResults, QueryCache
+from utils.lexicon import Lexicon
+from utils.bloom import VocabularyFilter
+
+logger = logging.getLogger(__name__)
 
 class PDFIndexer:
     def __init__(self):
-        print("Initializing PDF indexer...")
+        logger.info("Initializing PDF indexer...")
         self.index_dir = os.path.join(INDEX_DIR, 'pdf')
         if not os.path.exists(self.index_dir):
-            print(f"Creating PDF index directory at {self.index_dir}")
+            logger.info("Creating PDF index directory at %s", self.index_dir)
             os.makedirs(self.index_dir)
         
         # Create or open the index
-        if not os.path.exists(os.path.join(self.index_dir, 'index')):
-            print("Creating new PDF index...")
-            self.ix = create_in(self.index_dir, SCHEMA)
-        else:
-            print("Opening existing PDF index...")
-            self.ix = open_dir(self.index_dir)
+        self.ix = open_index(self.index_dir, 'pdf', 'PDF')
+        self.doc_store = open_doc_store(self.index_dir, self.ix)
+        self.writes = IndexWriteCoordinator(self.ix, self.doc_store, 'pdf')
+        self.lexicon = Lexicon()
+        self.vocabulary = VocabularyFilter()
+        # Skip checks stay current with every commit instead of waiting for the next search
+        self.writes.on_commit.append(self.refresh)
+        self.queries = QueryCache()
 
     def index_file(self, file_path):
-        """Index a PDF file using PyPDF2 only"""
-        print(f"Indexing PDF file: {file_path}")
+        """Queue a PDF file for indexing using PyPDF2 only; returns its QueuedFile or None"""
+        import PyPDF2
+        logger.info("Indexing PDF file: %s", file_path)
+        start = time.perf_counter()
         try:
             # Extract text using PyPDF2
             with open(file_path, 'rb') as file:
@@ -36,15 +45,15 @@ class PDFIndexer:
                         page_text = page.extract_text()
                         if page_text:
                             text_content += page_text + "\n"
-                            print(f"Extracted text from page {i+1}")
+                            logger.debug("Extracted text from page %s", i+1)
                         else:
-                            print(f"Warning: No text found on page {i+1}")
+                            logger.warning("No text found on page %s", i+1)
                     except Exception as e:
-                        print(f"Warning: Could not extract text from page {i+1} in {file_path}: {str(e)}")
+                        logger.warning("Could not extract text from page %s in %s: %s", i+1, file_path, e)
                         continue
 
             # Add document to index
-            writer = self.ix.writer()
+            writer = self.writes.batch()
             writer.add_document(
                 filename=os.path.basename(file_path),
                 filetype='pdf',
@@ -53,66 +62,62 @@ class PDFIndexer:
                 title=os.path.basename(file_path),
                 timestamp=datetime.now()
             )
-            writer.commit()
-            print(f"Successfully indexed {file_path}")
+            queued = QueuedFile(self.writes, file_path, os.path.getsize(file_path), start)
+            queued.add(writer)
+            return queued
 
         except Exception as e:
-            print(f"Error processing PDF {file_path}: {str(e)}")
-            return False
-        return True
+            logger.error("Error processing PDF %s: %s", file_path, e)
+            return None
 
-    def search(self, query_text):
-        print(f"Searching PDF index for: {query_text}")
+    def search(self, query_text, **options):
+        logger.debug("Searching PDF index for: %s", query_text)
         try:
-            with self.ix.searcher() as searcher:
-                parser = MultifieldParser(["content", "title"], self.ix.schema)
-                parser.add_plugin(FuzzyTermPlugin())
-                parser.add_plugin(WildcardPlugin())
-                # دعم الاستعلامات المنطقية والعبارية
-                queries = [
-                    query_text,
-                    f"*{query_text}*",
-                    f"{query_text}~",
-                    query_text.lower(),
-                    query_text.upper()
-                ]
-                all_results = []
-                for q in queries:
-                    try:
-                        query = parser.parse(q)
-                        results = searcher.search(query, limit=20)
-                        for result in results:
-                            result_dict = {
-                                'filename': result['filename'],
-                                'filetype': result['filetype'],
-                                'content': result['content'],
-                                'location': result['location'],
-                                'title': result['title'],
-                                'score': result.score
-                            }
-                            if result_dict not in all_results:
-                                all_results.append(result_dict)
-                    except Exception as e:
-                        print(f"Error with query {q}: {str(e)}")
-                        continue
-                all_results.sort(key=lambda x: x['score'], reverse=True)
-                return all_results
+            return search_index(self.ix, self.doc_store, query_text, lexicon=self.lexicon,
+                                queries=self.queries, **options)
         except Exception as e:
-            print(f"Error searching PDF index: {str(e)}")
-            return []
+            logger.error("Error searching PDF index: %s", e)
+            return SearchResults()
+
+    def may_match(self, query_text):
+        """False if no document of this index can match the query"""
+        return query_may_match(self.ix, query_text, self.vocabulary, self.lexicon, self.queries)
+
+    def refresh(self):
+        """Bring the Bloom filters and lexicon up to the latest commit"""
+        refresh_vocabulary(self.ix, self.vocabulary, self.lexicon)
+
+    def did_you_mean(self, query_text):
+        """Respelled query, its weight and the respelled terms for an index that was skipped"""
+        return respell_query(self.ix, self.lexicon, query_text)
+
+    def knows(self, term):
+        """False if no document of this index contains the analyzed term"""
+        return term_known(self.ix, self.vocabulary, term)
+
+    def suggest(self, prefix, limit):
+        """Type-ahead completions for a prefix"""
+        return complete_index(self.ix, self.lexicon, prefix, limit)
 
     def index_all_files(self):
         """Index all PDF files in the documents directory"""
         from config import DOCUMENTS_DIR
-        print(f"Scanning for PDF files in {DOCUMENTS_DIR}")
+        logger.debug("Scanning for PDF files in %s", DOCUMENTS_DIR)
         pdf_files = []
         for root, _, files in os.walk(DOCUMENTS_DIR):
             for file in files:
                 if file.lower().endswith('.pdf'):
                     file_path = os.path.join(root, file)
                     pdf_files.append(file_path)
-                    print(f"Found PDF file: {file_path}")
+                    logger.debug("Found PDF file: %s", file_path)
         
-        print(f"Found {len(pdf_files)} PDF files to index")
+        logger.debug("Found %s PDF files to index", len(pdf_files))
+        queued = []
         for file_path in pdf_files:
-            self.index_file(file_path) 
\ No newline at end of file
+            queued.append(self.index_file(file_path))
+        # One commit for the whole scan, after which each file is recorded as indexed
+        failures = set()
+        self.writes.flush(failures=failures)
+        for file in queued:
+            if file is not None:
+                file.done(failures)
\ No newline at end of file
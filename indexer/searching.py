@@ -0,0 +1,323 @@
+import logging
+import threading
+from collections import OrderedDict
+from whoosh import sorting, collectors
+from whoosh.searching import TimeLimit
+from whoosh.qparser import MultifieldParser, FuzzyTermPlugin, WildcardPlugin
+from whoosh.query import (Or, And, Every, Term, Phrase, Wildcard, FuzzyTerm, DisjunctionMax,
+                          AndNot, AndMaybe, Require, Otherwise)
+from whoosh.query.qcore import _NullQuery
+
+from config import SEARCH_CONFIG
+from indexer.collectors import CollapsibleTopCollector, SourceCollapseCollector, DeadlineCollector
+from utils import stats
+
+logger = logging.getLogger(__name__)
+
+# Fields counted when a search asks for facets; all are sortable (column-stored) in config.SCHEMA
+FACET_FIELDS = ['filetype', 'filename', 'sheet', 'keypath']
+
+# Fields the query text is parsed against
+SEARCH_FIELDS = ('content', 'title')
+
+
+class SearchResults(list):
+    """Result dicts from one index search plus the facet counts collected with them.
+
+    ``suggestion`` is a respelled query, its weight and the respelled terms
+    when the search found few hits, see Lexicon.did_you_mean. ``partial`` is set when the search ran
+    out of time and holds only the hits collected before the deadline.
+    """
+
+    def __init__(self, results=(), facets=None, suggestion=None, partial=False):
+        super().__init__(results)
+        self.facets = facets or {}
+        self.suggestion = suggestion
+        self.partial = partial
+
+
+def query_variants(query_text):
+    """Query strings tried for every search"""
+    return [
+        query_text,                    # Original query
+        f"*{query_text}*",            # Wildcard match
+        f"{query_text}~{SEARCH_CONFIG['fuzzy_distance']}",  # Fuzzy match
+        query_text.lower(),           # Lowercase
+        query_text.upper()            # Uppercase
+    ]
+
+
+def _parser(schema, fields):
+    parser = MultifieldParser(list(fields), schema)
+    parser.add_plugin(FuzzyTermPlugin())
+    parser.add_plugin(WildcardPlugin())
+    return parser
+
+
+def _parse_variants(parser, query_text):
+    subqueries = []
+    for q in query_variants(query_text):
+        try:
+            query = parser.parse(q)
+        except Exception as e:
+            logger.debug("Could not parse query variant %s: %s", q, e)
+            continue
+        if query not in subqueries:
+            subqueries.append(query)
+
+    if not subqueries:
+        return None
+    return subqueries[0] if len(subqueries) == 1 else Or(subqueries)
+
+
+class QueryCache:
+    """Prebuilt query parser for an index plus an LRU cache of parsed queries.
+
+    Entries are keyed by query text and field set. Parsing only depends on
+    the schema, so the cache is only cleared when a commit changes it; the
+    schema is compared when the index generation moves, since reading it
+    from a file index loads the TOC.
+    """
+
+    def __init__(self, fields=SEARCH_FIELDS, size=SEARCH_CONFIG['query_cache_size']):
+        self.fields = tuple(fields)
+        self.size = size
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.schema = None
+        self.parser = None
+        self.generation = None
+
+    def _check_schema(self, ix):
+        generation = ix.latest_generation()
+        if generation == self.generation:
+            return
+        schema = ix.schema
+        if self.parser is None or schema != self.schema:
+            self.schema = schema
+            self.parser = _parser(schema, self.fields)
+            self.cache.clear()
+        self.generation = generation
+
+    def parse_typed(self, ix, query_text):
+        """The query as typed, without the variants; not cached"""
+        with self.lock:
+            self._check_schema(ix)
+            return self.parser.parse(query_text)
+
+    def parse(self, ix, query_text):
+        """The variant disjunction for a query, parsed at most once per schema"""
+        key = (query_text, self.fields)
+        with self.lock:
+            self._check_schema(ix)
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                stats.increment('query_cache_hits')
+                return self.cache[key]
+            stats.increment('query_cache_misses')
+            query = _parse_variants(self.parser, query_text)
+            self.cache[key] = query
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+            return query
+
+
+def build_query(ix, query_text, queries=None):
+    """Parse the query variants into one disjunction so they are collected in a single pass"""
+    if not query_text:
+        # Column filters only
+        return Every()
+    if queries is not None:
+        return queries.parse(ix, query_text)
+    return _parse_variants(_parser(ix.schema, SEARCH_FIELDS), query_text)
+
+
+def _facet_counts(hits):
+    facets = {}
+    for name in FACET_FIELDS:
+        counts = hits.groups(name)
+        facets[name] = {value: count for value, count in counts.items() if value}
+    return facets
+
+
+def _collector(limit, facets, collapse, filters, deadline=None, distinct=False):
+    """Top-k collector chain, like Searcher.collector() but with source and cluster collapsing under the facets"""
+    # Block-quality skipping stops scoring postings that cannot beat the current
+    # k-th hit. It is off when facet counts have to see every match; the collapsed
+    # and duplicate counts only cover the postings that were scored.
+    collector = CollapsibleTopCollector(limit, usequality=not facets)
+    if collapse:
+        # Stopping early would leave the facet counts incomplete
+        stop_after = None if facets else SEARCH_CONFIG['collapse_stop_after']
+        collector = SourceCollapseCollector(collector, 'filename', limit=collapse, stop_after=stop_after)
+    if distinct:
+        # One hit per near-duplicate cluster (utils/near_duplicates.py)
+        collector = SourceCollapseCollector(collector, 'cluster', limit=1, counts_name='duplicate_counts')
+    if facets:
+        groupedby = {name: sorting.FieldFacet(name) for name in FACET_FIELDS}
+        collector = collectors.FacetCollector(collector, groupedby, maptype=sorting.Count)
+    if deadline is not None:
+        collector = DeadlineCollector(collector, deadline)
+    if filters is not None:
+        # Filtering wraps last so it sees the docs first
+        collector = collectors.FilterCollector(collector, allow=filters)
+    return collector
+
+
+def search_index(ix, doc_store, query_text, lexicon=None, queries=None, filters=None, facets=False,
+                 collapse=SEARCH_CONFIG['collapse_limit'], limit=SEARCH_CONFIG['limit'], deadline=None,
+                 distinct=SEARCH_CONFIG['distinct']):
+    """Search one index and return the top hits as result dicts.
+
+    ``collapse`` keeps at most that many hits per source file (0 disables it);
+    each kept hit reports how many hits of its file were left out.
+    ``distinct`` keeps the best hit per near-duplicate cluster, reporting its
+    cluster and how many of its near-duplicates matched as well. Without
+    ``facets`` both counts leave out hits that block-quality skipping passed
+    over for scoring too low to be returned.
+    ``deadline`` is a ``time.perf_counter()`` value; collection stops there
+    and the hits found so far come back marked as partial, as they do when
+    the collapse collector stops early (``collapse_stop_after``).
+    """
+    with stats.timed('stage_seconds', stage='parse'):
+        query = build_query(ix, query_text, queries)
+    if query is None:
+        return SearchResults()
+    if filters is not None and isinstance(query, Every):
+        query = filters
+
+    with ix.searcher() as searcher:
+        if lexicon is not None:
+            lexicon.refresh(searcher.reader())
+            query = lexicon.rewrite_query(query)
+        collector = _collector(limit, facets, collapse, filters, deadline, distinct)
+        partial = False
+        try:
+            searcher.search_with_collector(query, collector)
+        except TimeLimit:
+            logger.info("Search for %r ran out of time, returning partial results", query_text)
+            partial = True
+        hits = collector.results()
+        if getattr(hits, 'stopped_early', False):
+            logger.info("Search for %r stopped early, returning partial results", query_text)
+            partial = True
+        collapsed = getattr(hits, 'collapsed_counts', {})
+        duplicates = getattr(hits, 'duplicate_counts', {})
+        results = SearchResults(partial=partial)
+        for hit in hits:
+            result = {
+                'filename': hit['filename'],
+                'filetype': hit['filetype'],
+                'content': doc_store.get(hit.get('doc_id')),
+                'location': hit['location'],
+                'title': hit['title'],
+                'score': hit.score
+            }
+            if hit.get('vector_id') is not None:
+                # Key of /similar/<doc_id>
+                result['doc_id'] = hit['vector_id']
+            if collapse:
+                result['collapsed'] = collapsed.get(hit['filename'], 0)
+            if distinct and hit.get('cluster'):
+                result['cluster'] = hit['cluster']
+                result['duplicates'] = duplicates.get(hit['cluster'], 0)
+            results.append(result)
+        if facets:
+            results.facets = _facet_counts(hits)
+        if (lexicon is not None and query_text and not partial
+                and len(results) < SEARCH_CONFIG['did_you_mean_below']):
+            results.suggestion = lexicon.did_you_mean(searcher.reader(), query_text)
+    return results
+
+
+def index_stats(ix):
+    """Document and segment counts of the latest commit of an index"""
+    with ix.reader() as reader:
+        segments = sum(1 for segreader, _ in reader.leaf_readers()
+                       if getattr(segreader, 'segment', lambda: None)() is not None)
+        return {'documents': reader.doc_count(), 'segments': segments, 'generation': ix.latest_generation()}
+
+
+def term_known(ix, vocabulary, term):
+    """False if no tracked field of the index holds the analyzed term"""
+    vocabulary.refresh(ix)
+    btext = term.encode('utf-8')
+    return any(vocabulary.may_contain(field, btext) for field in vocabulary.fields)
+
+
+def respell_query(ix, lexicon, query_text):
+    """Respelled query and its weight from one index without searching it, see Lexicon.did_you_mean"""
+    with ix.searcher() as searcher:
+        lexicon.refresh(searcher.reader())
+        return lexicon.did_you_mean(searcher.reader(), query_text)
+
+
+def complete_index(ix, lexicon, prefix, limit):
+    """Type-ahead completions from one index; the lexicon is only refreshed after a commit"""
+    if ix.latest_generation() != lexicon.generation:
+        with ix.searcher() as searcher:
+            lexicon.refresh(searcher.reader())
+    return lexicon.complete(prefix, limit)
+
+
+def _can_match(q, schema, vocabulary, lexicon):
+    """False only if no document of the index can match q"""
+    if isinstance(q, _NullQuery):
+        return False
+    if type(q) is Term:
+        if q.fieldname not in schema:
+            return False
+        return vocabulary.may_contain(q.fieldname, schema[q.fieldname].to_bytes(q.text))
+    if isinstance(q, Phrase):
+        if q.fieldname not in schema:
+            return False
+        field = schema[q.fieldname]
+        return all(vocabulary.may_contain(q.fieldname, field.to_bytes(word)) for word in q.words)
+    if isinstance(q, (AndNot, AndMaybe, Otherwise)):
+        return _can_match(q.a, schema, vocabulary, lexicon) or (
+            isinstance(q, Otherwise) and _can_match(q.b, schema, vocabulary, lexicon))
+    if isinstance(q, (And, Require)):
+        return all(_can_match(sub, schema, vocabulary, lexicon) for sub in q.children())
+    if isinstance(q, (Or, DisjunctionMax)):
+        return any(_can_match(sub, schema, vocabulary, lexicon) for sub in q.children())
+    # Wildcard and fuzzy expansions are checked against the lexicon structures,
+    # refreshed as each commit lands
+    if lexicon is not None and isinstance(q, (Wildcard, FuzzyTerm)) and q.fieldname in lexicon.fuzzy:
+        if type(q) is Wildcard and q.text[:1] in ('*', '?'):
+            candidates = lexicon.ngrams[q.fieldname].candidates(q.text)
+            return candidates is None or bool(candidates)
+        if isinstance(q, FuzzyTerm):
+            candidates = lexicon.fuzzy[q.fieldname].candidates(q.text, q.maxdist, q.prefixlength)
+            return candidates is None or bool(candidates)
+    return True
+
+
+def query_may_match(ix, query_text, vocabulary, lexicon=None, queries=None):
+    """Cheap pre-check for dispatching a search: False if the index certainly has no match.
+
+    Only the query as typed is checked, before the wildcard, fuzzy and case
+    variants are added, so an index lacking a required term is skipped.
+    Terms are looked up in the per-segment Bloom filters of the vocabulary;
+    wildcards and fuzzy terms the user typed use the lexicon when it is current.
+    """
+    if not query_text:
+        return True
+    try:
+        if queries is not None:
+            query = queries.parse_typed(ix, query_text)
+        else:
+            query = _parser(ix.schema, SEARCH_FIELDS).parse(query_text)
+    except Exception as e:
+        logger.debug("Could not parse %r for the pre-check: %s", query_text, e)
+        return True
+    vocabulary.refresh(ix)
+    if lexicon is not None and lexicon.generation != vocabulary.generation:
+        lexicon = None
+    return _can_match(query, ix.schema, vocabulary, lexicon)
+
+
+def refresh_vocabulary(ix, vocabulary, lexicon):
+    """Bring the Bloom filters and lexicon of an index up to its latest commit, e.g. as soon as one lands"""
+    vocabulary.refresh(ix)
+    with ix.searcher() as searcher:
+        lexicon.refresh(searcher.reader())
\ No newline at end of file
@@ -1,32 +1,41 @@
 import os
-import requests
-from bs4 import BeautifulSoup
+import time
+import logging
 from datetime import datetime
-from whoosh.fields import Schema, TEXT, ID, DATETIME
-from whoosh.index import create_in, open_dir
-from whoosh.qparser import MultifieldParser, FuzzyTermPlugin, WildcardPlugin
-from config import INDEX_DIR, SCHEMA
+from config import INDEX_DIR
+from utils.index_storage import open_index
+from utils.doc_store import open_doc_store
+from utils.index_writer import IndexWriteCoordinator, QueuedFile
+from indexer.searching import search_index, complete_index, query_may_match, refresh_vocabulary, respell_query, term_known, SearchResults, QueryCache
+from utils.lexicon import Lexicon
+from utils.bloom import VocabularyFilter
 
 from indexer.base import BaseIndexer
 
+logger = logging.getLogger(__name__)
+
 class WebIndexer(BaseIndexer):
     def __init__(self):
         super().__init__()
         self.filetype = 'web'
-        print("Initializing Web indexer...")
+        logger.info("Initializing Web indexer...")
         self.index_dir = os.path.join(INDEX_DIR, 'web')
         if not os.path.exists(self.index_dir):
-            print(f"Creating Web index directory at {self.index_dir}")
+            logger.info("Creating Web index directory at %s", self.index_dir)
             os.makedirs(self.index_dir)
-        if not os.path.exists(os.path.join(self.index_dir, 'index')):
-            print("Creating new Web index...")
-            self.ix = create_in(self.index_dir, SCHEMA)
-        else:
-            print("Opening existing Web index...")
-            self.ix = open_dir(self.index_dir)
+        self.ix = open_index(self.index_dir, 'web', 'Web')
+        self.doc_store = open_doc_store(self.index_dir, self.ix)
+        self.writes = IndexWriteCoordinator(self.ix, self.doc_store, 'web')
+        self.lexicon = Lexicon()
+        self.vocabulary = VocabularyFilter()
+        # Skip checks stay current with every commit instead of waiting for the next search
+        self.writes.on_commit.append(self.refresh)
+        self.queries = QueryCache()
 
     def process_file(self, file_path):
         """Process a web page and return a list of documents to index"""
+        import requests
+        from bs4 import BeautifulSoup
         documents = []
         
         try:
@@ -61,23 +70,26 @@ class WebIndexer(BaseIndexer):
                     }
                     documents.append(doc)
                 except Exception as e:
-                    print(f"Error processing URL {url}: {str(e)}")
+                    logger.error("Error processing URL %s: %s", url, e)
                     continue
             
             return documents
         except Exception as e:
-            print(f"Error processing web file {file_path}: {str(e)}")
+            logger.error("Error processing web file %s: %s", file_path, e)
             return []
 
     def index_url(self, url):
-        print(f"Indexing web page: {url}")
+        import requests
+        from bs4 import BeautifulSoup
+        logger.info("Indexing web page: %s", url)
+        start = time.perf_counter()
         try:
             response = requests.get(url, timeout=10)
             soup = BeautifulSoup(response.text, 'html.parser')
             title = soup.title.string.strip() if soup.title else url
             paragraphs = ' '.join(p.get_text(separator=' ', strip=True) for p in soup.find_all('p'))
             content = paragraphs.strip()
-            writer = self.ix.writer()
+            writer = self.writes.batch()
             writer.add_document(
                 filename=url,
                 filetype='web',
@@ -86,60 +98,55 @@ class WebIndexer(BaseIndexer):
                 title=title,
                 timestamp=datetime.now()
             )
-            writer.commit()
-            print(f"Successfully indexed {url}")
-            return True
+            queued = QueuedFile(self.writes, url, len(response.content), start)
+            queued.add(writer)
+            return queued
         except Exception as e:
-            print(f"Error indexing web page {url}: {str(e)}")
-            return False
+            logger.error("Error indexing web page %s: %s", url, e)
+            return None
 
-    def search(self, query_text):
-        print(f"Searching Web index for: {query_text}")
+    def search(self, query_text, **options):
+        logger.debug("Searching Web index for: %s", query_text)
         try:
-            with self.ix.searcher() as searcher:
-                parser = MultifieldParser(["content", "title"], self.ix.schema)
-                parser.add_plugin(FuzzyTermPlugin())
-                parser.add_plugin(WildcardPlugin())
-                queries = [
-                    query_text,
-                    f"*{query_text}*",
-                    f"{query_text}~",
-                    query_text.lower(),
-                    query_text.upper()
-                ]
-                all_results = []
-                for q in queries:
-                    try:
-                        query = parser.parse(q)
-                        results = searcher.search(query, limit=20)
-                        for result in results:
-                            result_dict = {
-                                'filename': result['filename'],
-                                'filetype': result['filetype'],
-                                'content': result['content'],
-                                'location': result['location'],
-                                'title': result['title'],
-                                'score': result.score
-                            }
-                            if result_dict not in all_results:
-                                all_results.append(result_dict)
-                    except Exception as e:
-                        print(f"Error with query {q}: {str(e)}")
-                        continue
-                all_results.sort(key=lambda x: x['score'], reverse=True)
-                return all_results
+            return search_index(self.ix, self.doc_store, query_text, lexicon=self.lexicon,
+                                queries=self.queries, **options)
         except Exception as e:
-            print(f"Error searching Web index: {str(e)}")
-            return []
+            logger.error("Error searching Web index: %s", e)
+            return SearchResults()
+
+    def may_match(self, query_text):
+        """False if no document of this index can match the query"""
+        return query_may_match(self.ix, query_text, self.vocabulary, self.lexicon, self.queries)
+
+    def refresh(self):
+        """Bring the Bloom filters and lexicon up to the latest commit"""
+        refresh_vocabulary(self.ix, self.vocabulary, self.lexicon)
+
+    def did_you_mean(self, query_text):
+        """Respelled query, its weight and the respelled terms for an index that was skipped"""
+        return respell_query(self.ix, self.lexicon, query_text)
+
+    def knows(self, term):
+        """False if no document of this index contains the analyzed term"""
+        return term_known(self.ix, self.vocabulary, term)
+
+    def suggest(self, prefix, limit):
+        """Type-ahead completions for a prefix"""
+        return complete_index(self.ix, self.lexicon, prefix, limit)
 
     def index_all_files(self):
         # This function can be customized to read URLs from a file or list
         urls_file = os.path.join(os.path.dirname(__file__), 'web_urls.txt')
         if not os.path.exists(urls_file):
-            print(f"No web_urls.txt file found at {urls_file}")
+            logger.info("No web_urls.txt file found at %s", urls_file)
             return
         with open(urls_file, 'r', encoding='utf-8') as f:
             urls = [line.strip() for line in f if line.strip()]
-        print(f"Found {len(urls)} URLs to index")
-        for url in urls:
-            self.index_url(url) 
\ No newline at end of file
+        logger.debug("Found %s URLs to index", len(urls))
+        queued = [self.index_url(url) for url in urls]
+        # One commit for the whole scan, after which each page is recorded as indexed
+        failures = set()
+        self.writes.flush(failures=failures)
+        for page in queued:
+            if page is not None:
+                page.done(failures)
\ No newline at end of file
@@ -0,0 +1,84 @@
+import math
+import hashlib
+import threading
+
+from config import LEXICON_CONFIG, BLOOM_CONFIG
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over byte strings"""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class VocabularyFilter:
+    """Bloom filters of the analyzed vocabulary of an index, one per segment.
+
+    Segments are immutable, so a commit only needs filters for its new
+    segments, and a merge simply drops the filters of the segments it
+    replaced. A term that is in no filter is certainly not in the index.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = fields or LEXICON_CONFIG['fields']
+        self.error_rate = BLOOM_CONFIG['error_rate']
+        self.lock = threading.Lock()
+        # Segment id -> BloomFilter
+        self.filters = {}
+        self.generation = -1
+
+    @staticmethod
+    def _key(fieldname, btext):
+        return fieldname.encode('utf-8') + b'\x00' + btext
+
+    def refresh(self, ix):
+        """Bring the filters up to date with the latest commit of an index"""
+        if ix.latest_generation() == self.generation:
+            return
+        with self.lock, ix.searcher() as searcher:
+            reader = searcher.reader()
+            leaves = {}
+            for segreader, _ in reader.leaf_readers():
+                segment = getattr(segreader, 'segment', None)
+                segment = segment() if segment is not None else None
+                if segment is not None:
+                    leaves[segment.segment_id()] = segreader
+            for segment_id in set(self.filters) - set(leaves):
+                del self.filters[segment_id]
+            for segment_id in set(leaves) - set(self.filters):
+                self.filters[segment_id] = self._build(leaves[segment_id])
+            generation = reader.generation()
+            self.generation = generation if generation is not None else ix.latest_generation()
+
+    def _build(self, segreader):
+        keys = [self._key(field, btext)
+                for field in self.fields if field in segreader.schema
+                for btext in segreader.lexicon(field)]
+        bloom = BloomFilter(len(keys), self.error_rate)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    def may_contain(self, fieldname, btext):
+        """False if the term is certainly not in the index; fields that are not tracked always pass"""
+        if fieldname not in self.fields:
+            return True
+        key = self._key(fieldname, btext)
+        return any(key in bloom for bloom in list(self.filters.values()))
@@ -0,0 +1,142 @@
+import re
+import warnings
+from datetime import datetime, timedelta
+from whoosh.query import And, Or, Term, NumericRange, DateRange
+
+from config import COLUMN_FIELDS
+
+# Field name prefix for each inferred column type, matching the glob fields in config.SCHEMA
+# pandas is imported inside the functions that need it: parse_filters runs on
+# every /search request and must not pull it in at startup
+FIELD_PREFIXES = {
+    'numeric': 'num_',
+    'date': 'date_',
+    'keyword': 'kw_'
+}
+
+_FILTER_PATTERN = re.compile(r'^\s*([^<>=]+?)\s*(>=|<=|>|<|=)\s*(.+?)\s*$')
+
+
+def column_key(column):
+    """Normalize a column name into the part of a field name after the type prefix"""
+    return re.sub(r'[^0-9a-z]+', '_', str(column).lower()).strip('_')
+
+
+def _looks_like_dates(values):
+    """True if every sampled string value parses as a date"""
+    import pandas as pd
+    sample = values.astype(str).head(COLUMN_FIELDS['sample_rows'])
+    if sample.str.fullmatch(r'[-+]?\d+(\.\d+)?').any():
+        return False
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        parsed = pd.to_datetime(sample, errors='coerce', format='mixed')
+    return bool(parsed.notna().all())
+
+
+def infer_column_types(df):
+    """Map each column of a DataFrame to 'numeric', 'date' or 'keyword'"""
+    import pandas as pd
+    types = {}
+    for column in df.columns:
+        if not column_key(column):
+            continue
+        values = df[column].dropna()
+        if values.empty:
+            continue
+        if pd.api.types.is_bool_dtype(values):
+            types[column] = 'keyword'
+        elif pd.api.types.is_numeric_dtype(values):
+            types[column] = 'numeric'
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            types[column] = 'date'
+        elif _looks_like_dates(values):
+            types[column] = 'date'
+        else:
+            types[column] = 'keyword'
+    return types
+
+
+def row_fields(row, types):
+    """Typed index fields for one row, given the column types of its file"""
+    import pandas as pd
+    fields = {}
+    for column, kind in types.items():
+        value = row.get(column)
+        if value is None or pd.isna(value):
+            continue
+        name = FIELD_PREFIXES[kind] + column_key(column)
+        try:
+            if kind == 'numeric':
+                fields[name] = float(value)
+            elif kind == 'date':
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    timestamp = pd.to_datetime(value, errors='coerce', format='mixed')
+                if not pd.isna(timestamp):
+                    fields[name] = timestamp.to_pydatetime().replace(tzinfo=None)
+            else:
+                text = str(value).strip()
+                if text and len(text) <= COLUMN_FIELDS['max_keyword_length']:
+                    fields[name] = text.replace(',', ' ')
+        except (TypeError, ValueError, OverflowError):
+            continue
+    return fields
+
+
+def _parse_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _parse_date(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _filter_query(spec):
+    match = _FILTER_PATTERN.match(spec)
+    if not match:
+        raise ValueError(f"Invalid filter: {spec}")
+    column, op, value = match.groups()
+    key = column_key(column)
+    if not key:
+        raise ValueError(f"Invalid filter column: {column}")
+
+    number = _parse_number(value)
+    if number is not None:
+        field = FIELD_PREFIXES['numeric'] + key
+        if op == '=':
+            # Codes like "007" may have been indexed as keywords in some files
+            return Or([NumericRange(field, number, number), Term(FIELD_PREFIXES['keyword'] + key, value.lower())])
+        if op in ('>', '>='):
+            return NumericRange(field, number, None, startexcl=(op == '>'))
+        return NumericRange(field, None, number, endexcl=(op == '<'))
+
+    date = _parse_date(value)
+    if date is not None:
+        field = FIELD_PREFIXES['date'] + key
+        if op == '=':
+            # A bare date matches the whole day
+            if len(value) <= 10:
+                return DateRange(field, date, date + timedelta(days=1), endexcl=True)
+            return DateRange(field, date, date)
+        if op in ('>', '>='):
+            return DateRange(field, date, None, startexcl=(op == '>'))
+        return DateRange(field, None, date, endexcl=(op == '<'))
+
+    if op != '=':
+        raise ValueError(f"Range filters need a number or an ISO date: {spec}")
+    return Term(FIELD_PREFIXES['keyword'] + key, value.lower())
+
+
+def parse_filters(specs):
+    """Build a Whoosh filter query from specs like 'price>100', 'date>=2024-01-01' or 'city=Cairo'"""
+    queries = [_filter_query(spec) for spec in specs if spec.strip()]
+    if not queries:
+        return None
+    return queries[0] if len(queries) == 1 else And(queries)
@@ -0,0 +1,187 @@
+import os
+import zlib
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+
+from config import DOC_STORE_CONFIG
+from utils import stats
+
+# Block index entry: file offset and compressed length of a block
+_BLOCK = struct.Struct('<QI')
+# Document index entry: block number, offset and length inside the uncompressed block
+_DOC = struct.Struct('<III')
+
+
+class DocumentStore:
+    """Append-only store for full document text, kept out of the Whoosh stored fields.
+
+    Documents are packed into blocks of roughly ``block_size`` bytes that are
+    zlib-compressed on disk. A lookup by doc id reads a single block, and
+    recently used blocks are kept decompressed in an LRU cache.
+    """
+
+    def __init__(self, directory, name='docstore'):
+        self.block_size = DOC_STORE_CONFIG['block_size']
+        self.cache_blocks = DOC_STORE_CONFIG['cache_blocks']
+        self.level = DOC_STORE_CONFIG['compression_level']
+        self.data_path = os.path.join(directory, f'{name}.dat')
+        self.blocks_path = os.path.join(directory, f'{name}.blk')
+        self.docs_path = os.path.join(directory, f'{name}.doc')
+        self.lock = threading.RLock()
+        self.cache = OrderedDict()
+        self._load()
+
+    def _load(self):
+        """Read the block and document tables into memory"""
+        self.block_offsets = array('Q')
+        self.block_lengths = array('I')
+        self.doc_table = array('I')
+        if os.path.exists(self.blocks_path):
+            with open(self.blocks_path, 'rb') as f:
+                for offset, length in _BLOCK.iter_unpack(f.read()):
+                    self.block_offsets.append(offset)
+                    self.block_lengths.append(length)
+        if os.path.exists(self.docs_path):
+            with open(self.docs_path, 'rb') as f:
+                raw = f.read()
+            # Drop entries whose block never made it to disk, so later blocks line up again
+            for entry in _DOC.iter_unpack(raw[:len(raw) - len(raw) % _DOC.size]):
+                if entry[0] >= len(self.block_offsets):
+                    break
+                self.doc_table.extend(entry)
+            valid = len(self.doc_table) // 3 * _DOC.size
+            if valid != len(raw):
+                with open(self.docs_path, 'r+b') as f:
+                    f.truncate(valid)
+        self.pending = []
+        self.pending_size = 0
+
+    def __len__(self):
+        return len(self.doc_table) // 3 + len(self.pending)
+
+    def put(self, text):
+        """Add a document and return its doc id"""
+        with self.lock:
+            doc_id = len(self)
+            self.pending.append((text or '').encode('utf-8'))
+            self.pending_size += len(self.pending[-1])
+            if self.pending_size >= self.block_size:
+                self._write_block()
+            return str(doc_id)
+
+    def flush(self):
+        """Write buffered documents as a (possibly short) block"""
+        with self.lock:
+            if self.pending:
+                self._write_block()
+
+    def _write_block(self):
+        block_no = len(self.block_offsets)
+        entries = []
+        start = 0
+        for data in self.pending:
+            entries.append(_DOC.pack(block_no, start, len(data)))
+            self.doc_table.extend((block_no, start, len(data)))
+            start += len(data)
+        compressed = zlib.compress(b''.join(self.pending), self.level)
+
+        with open(self.data_path, 'ab') as f:
+            offset = f.tell()
+            f.write(compressed)
+        with open(self.docs_path, 'ab') as f:
+            f.write(b''.join(entries))
+        # The block table is written last: a document only counts as stored once its block is listed
+        with open(self.blocks_path, 'ab') as f:
+            f.write(_BLOCK.pack(offset, len(compressed)))
+
+        self.block_offsets.append(offset)
+        self.block_lengths.append(len(compressed))
+        self.pending = []
+        self.pending_size = 0
+
+    def _read_block(self, block_no):
+        block = self.cache.get(block_no)
+        if block is not None:
+            self.cache.move_to_end(block_no)
+            stats.increment('doc_store_cache_hits')
+            return block
+        stats.increment('doc_store_cache_misses')
+        with open(self.data_path, 'rb') as f:
+            f.seek(self.block_offsets[block_no])
+            block = zlib.decompress(f.read(self.block_lengths[block_no]))
+        self.cache[block_no] = block
+        if len(self.cache) > self.cache_blocks:
+            self.cache.popitem(last=False)
+        return block
+
+    def get(self, doc_id):
+        """Return the text of a document, or an empty string for an unknown id"""
+        try:
+            doc_id = int(doc_id)
+        except (TypeError, ValueError):
+            return ''
+        if doc_id < 0:
+            return ''
+        with self.lock:
+            stored = len(self.doc_table) // 3
+            if doc_id >= stored:
+                pending = doc_id - stored
+                if 0 <= pending < len(self.pending):
+                    return self.pending[pending].decode('utf-8')
+                return ''
+            block_no, start, length = self.doc_table[doc_id * 3:doc_id * 3 + 3]
+            block = self._read_block(block_no)
+        return block[start:start + length].decode('utf-8')
+
+    def size_on_disk(self):
+        """Total bytes used by the store files"""
+        return sum(os.path.getsize(path) for path in (self.data_path, self.blocks_path, self.docs_path)
+                   if os.path.exists(path))
+
+    def clear(self):
+        """Remove every document from the store"""
+        with self.lock:
+            for path in (self.data_path, self.blocks_path, self.docs_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.cache.clear()
+            self._load()
+
+
+def open_doc_store(index_dir, ix):
+    """Open the document store next to an index, emptying it if the index has no documents"""
+    store = DocumentStore(index_dir)
+    if ix.doc_count_all() == 0 and len(store):
+        store.clear()
+    return store
+
+
+def consistent_sizes(directory, name='docstore'):
+    """Byte lengths of the data, document and block files that form a complete store.
+
+    Another process may be appending while the files are copied; copying
+    these prefixes gives a store whose tables only list blocks that are
+    fully written. The block table is read first since it is written last.
+    """
+    sizes = {}
+    blocks_path = os.path.join(directory, f'{name}.blk')
+    blocks = []
+    if os.path.exists(blocks_path):
+        with open(blocks_path, 'rb') as f:
+            raw = f.read()
+        blocks = list(_BLOCK.iter_unpack(raw[:len(raw) - len(raw) % _BLOCK.size]))
+    sizes[f'{name}.blk'] = len(blocks) * _BLOCK.size
+    docs_path = os.path.join(directory, f'{name}.doc')
+    docs = 0
+    if os.path.exists(docs_path):
+        with open(docs_path, 'rb') as f:
+            raw = f.read()
+        for entry in _DOC.iter_unpack(raw[:len(raw) - len(raw) % _DOC.size]):
+            if entry[0] >= len(blocks):
+                break
+            docs += 1
+    sizes[f'{name}.doc'] = docs * _DOC.size
+    sizes[f'{name}.dat'] = blocks[-1][0] + blocks[-1][1] if blocks else 0
+    return sizes
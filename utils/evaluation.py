@@ -0,0 +1,147 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import EVALUATION_CONFIG
+
+
+def ranked_files(results):
+    """Distinct filenames in rank order; a file's rank is that of its best hit"""
+    seen = set()
+    ranking = []
+    for result in results:
+        if result['filename'] not in seen:
+            seen.add(result['filename'])
+            ranking.append(result['filename'])
+    return ranking
+
+
+def precision_at(ranking, relevant, k):
+    return sum(1 for name in ranking[:k] if relevant.get(name, 0) > 0) / k
+
+
+def recall_at(ranking, relevant, k=None):
+    wanted = sum(1 for grade in relevant.values() if grade > 0)
+    if not wanted:
+        return 0.0
+    return sum(1 for name in ranking[:k] if relevant.get(name, 0) > 0) / wanted
+
+
+def average_precision(ranking, relevant):
+    wanted = sum(1 for grade in relevant.values() if grade > 0)
+    found, total = 0, 0.0
+    for rank, name in enumerate(ranking, 1):
+        if relevant.get(name, 0) > 0:
+            found += 1
+            total += found / rank
+    return total / wanted if wanted else 0.0
+
+
+def reciprocal_rank(ranking, relevant):
+    for rank, name in enumerate(ranking, 1):
+        if relevant.get(name, 0) > 0:
+            return 1 / rank
+    return 0.0
+
+
+def ndcg_at(ranking, relevant, k):
+    """Normalized DCG of the top k with graded gains 2^grade - 1"""
+    def dcg(grades):
+        return sum((2 ** grade - 1) / math.log2(rank + 1) for rank, grade in enumerate(grades, 1))
+
+    ideal = dcg(sorted((g for g in relevant.values() if g > 0), reverse=True)[:k])
+    return dcg(relevant.get(name, 0) for name in ranking[:k]) / ideal if ideal else 0.0
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def parse_judgments(data):
+    """Validate a judged query set, returning (queries, k).
+
+    ``data`` is {"k": 10, "queries": [{"id": ..., "q": ..., "filetype": "all",
+    "relevant": {"file.txt": 2, ...} or ["file.txt", ...]}, ...]}; a list
+    of relevant files gives each of them grade 1. Raises ValueError.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('queries'), list) or not data['queries']:
+        raise ValueError("Expected a JSON object with a non-empty 'queries' list")
+    if len(data['queries']) > EVALUATION_CONFIG['max_queries']:
+        raise ValueError(f"At most {EVALUATION_CONFIG['max_queries']} queries per evaluation")
+    try:
+        k = int(data.get('k', EVALUATION_CONFIG['k']))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid k: {data.get('k')}")
+    if k < 1:
+        raise ValueError(f"Invalid k: {k}")
+    queries = []
+    for number, item in enumerate(data['queries'], 1):
+        if not isinstance(item, dict) or not isinstance(item.get('q'), str) or not item['q'].strip():
+            raise ValueError(f"Query {number} has no 'q' text")
+        relevant = item.get('relevant', {})
+        if isinstance(relevant, list):
+            relevant = {name: 1 for name in relevant}
+        if not isinstance(relevant, dict):
+            raise ValueError(f"Query {number}: 'relevant' must be a list or an object of grades")
+        try:
+            relevant = {str(name): float(grade) for name, grade in relevant.items()}
+        except (TypeError, ValueError):
+            raise ValueError(f"Query {number}: relevance grades must be numbers")
+        queries.append({'id': str(item.get('id', number)), 'q': item['q'],
+                        'filetype': item.get('filetype', 'all'), 'relevant': relevant})
+    return queries, k
+
+
+def evaluate(queries, search, k, workers=EVALUATION_CONFIG['workers']):
+    """Run judged queries in parallel through ``search(q, filetype)`` and score the rankings.
+
+    Returns per-query metrics and latency, and their means plus latency
+    percentiles over the whole set.
+    """
+    def run(item):
+        start = time.perf_counter()
+        try:
+            results, error = search(item['q'], item['filetype']), None
+        except Exception as e:
+            results, error = [], str(e)
+        latency = (time.perf_counter() - start) * 1000
+        ranking = ranked_files(results)
+        relevant = item['relevant']
+        row = {
+            'id': item['id'],
+            'q': item['q'],
+            'retrieved': len(ranking),
+            'relevant': sum(1 for grade in relevant.values() if grade > 0),
+            'ap': average_precision(ranking, relevant),
+            f'ndcg@{k}': ndcg_at(ranking, relevant, k),
+            'rr': reciprocal_rank(ranking, relevant),
+            f'p@{k}': precision_at(ranking, relevant, k),
+            f'recall@{k}': recall_at(ranking, relevant, k),
+            'recall': recall_at(ranking, relevant),
+            'latency_ms': round(latency, 3),
+        }
+        if error:
+            row['error'] = error
+        return row
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        rows = list(pool.map(run, queries))
+
+    metrics = ('ap', f'ndcg@{k}', 'rr', f'p@{k}', f'recall@{k}', 'recall')
+    latencies = [row['latency_ms'] for row in rows]
+    summary = {'queries': len(rows), 'errors': sum(1 for row in rows if 'error' in row)}
+    # Means over the query set; mean AP and mean RR are reported as MAP and MRR
+    for name in metrics:
+        summary[{'ap': 'map', 'rr': 'mrr'}.get(name, name)] = round(sum(row[name] for row in rows) / len(rows), 4)
+    summary.update({
+        'latency_p50_ms': round(percentile(latencies, 50), 3),
+        'latency_p95_ms': round(percentile(latencies, 95), 3),
+        'latency_p99_ms': round(percentile(latencies, 99), 3),
+        'latency_mean_ms': round(sum(latencies) / len(latencies), 3),
+    })
+    for row in rows:
+        for name in metrics:
+            row[name] = round(row[name], 4)
+    return {'k': k, 'summary': summary, 'queries': rows}
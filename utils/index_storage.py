@@ -0,0 +1,138 @@
+import os
+import logging
+import atexit
+import threading
+import time
+from whoosh.filedb.filestore import FileStorage, RamStorage
+from whoosh.index import create_in, open_dir, exists_in, TOC
+
+from config import SCHEMA, INDEX_STORAGE, RAM_SYNC_INTERVAL, REPLICA_DIR
+
+logger = logging.getLogger(__name__)
+
+# RAM-resident indexes that need their commits written back to disk
+_mirrors = []
+_sync_thread = None
+_sync_lock = threading.Lock()
+
+
+def open_index(index_dir, fmt, label):
+    """Open the index for a file type using the storage mode from config.INDEX_STORAGE"""
+    if REPLICA_DIR:
+        # A restored snapshot generation, only ever read
+        logger.info("Opening replicated %s index...", label)
+        return open_dir(index_dir)
+
+    if INDEX_STORAGE.get(fmt, 'disk') == 'ram':
+        mirror = RamIndexMirror(index_dir, label)
+        _register(mirror)
+        return mirror.ix
+
+    if not exists_in(index_dir):
+        logger.info("Creating new %s index...", label)
+        return create_in(index_dir, SCHEMA)
+    logger.info("Opening existing %s index...", label)
+    ix = open_dir(index_dir)
+    if set(ix.schema.names()) != set(SCHEMA.names()):
+        logger.warning("%s index uses an older schema, starting a new index...", label)
+        return create_in(index_dir, SCHEMA)
+    return ix
+
+
+_toc_pattern = TOC._pattern('MAIN')
+_segment_pattern = TOC._segment_pattern('MAIN')
+
+
+def _is_index_file(name):
+    """Whoosh TOC and segment files, without locks, temporary files or the document store"""
+    return bool(_toc_pattern.match(name) or _segment_pattern.match(name))
+
+
+class RamIndexMirror:
+    """Keep an index in RamStorage and write committed generations back to its directory"""
+
+    def __init__(self, index_dir, label):
+        self.label = label
+        self.disk = FileStorage(index_dir)
+        self.ram = RamStorage()
+
+        if exists_in(index_dir):
+            logger.info("Loading %s index snapshot into memory...", label)
+            for name in self.disk.list():
+                if _is_index_file(name):
+                    self._copy(self.disk, self.ram, name)
+            self.ix = self.ram.open_index()
+            if set(self.ix.schema.names()) != set(SCHEMA.names()):
+                logger.warning("%s index snapshot uses an older schema, starting a new in-memory index...", label)
+                self.ram = RamStorage()
+                self.ix = self.ram.create_index(SCHEMA)
+        else:
+            logger.info("Creating new in-memory %s index...", label)
+            self.ix = self.ram.create_index(SCHEMA)
+        self.synced_generation = self.ix.latest_generation()
+
+    def _copy(self, source, dest, name, target=None):
+        with source.open_file(name) as src:
+            data = src.read()
+        with dest.create_file(target or name) as dst:
+            dst.write(data)
+
+    def sync(self):
+        """Write the latest committed generation to disk if it changed since the last sync"""
+        generation = self.ix.latest_generation()
+        if generation == self.synced_generation:
+            return False
+
+        names = [name for name in self.ram.list() if _is_index_file(name)]
+        tocs = [name for name in names if name.endswith('.toc')]
+        on_disk = set(self.disk.list())
+        try:
+            # Segment files never change once written, so only new ones are copied.
+            # The TOC goes last and is renamed into place so a reader on disk never
+            # sees a generation whose segments are missing.
+            for name in names:
+                if not name.endswith('.toc') and name not in on_disk:
+                    self._copy(self.ram, self.disk, name)
+            for name in tocs:
+                self._copy(self.ram, self.disk, name, name + '.tmp')
+                self.disk.rename_file(name + '.tmp', name)
+        except NameError:
+            # A merge removed a file while we were copying; the next round picks up the new generation
+            return False
+
+        current = set(names)
+        for name in on_disk:
+            if _is_index_file(name) and name not in current:
+                try:
+                    self.disk.delete_file(name)
+                except OSError:
+                    pass
+
+        self.synced_generation = generation
+        logger.debug("Synced %s index generation %s to disk", self.label, generation)
+        return True
+
+
+def sync_all():
+    """Write pending commits of every RAM-resident index to disk"""
+    with _sync_lock:
+        for mirror in _mirrors:
+            try:
+                mirror.sync()
+            except Exception as e:
+                logger.error("Error syncing %s index to disk: %s", mirror.label, e)
+
+
+def _sync_loop():
+    while True:
+        time.sleep(RAM_SYNC_INTERVAL)
+        sync_all()
+
+
+def _register(mirror):
+    global _sync_thread
+    _mirrors.append(mirror)
+    if _sync_thread is None:
+        _sync_thread = threading.Thread(target=_sync_loop, name='ram-index-sync', daemon=True)
+        _sync_thread.start()
+        atexit.register(sync_all)
@@ -0,0 +1,290 @@
+import atexit
+import logging
+import threading
+import time
+
+from config import WRITER_CONFIG, DUPLICATE_CONFIG
+from utils import stats
+from utils.lexicon import get_surface_forms
+from utils.near_duplicates import get_duplicate_index
+from utils.vectors import get_vector_index
+
+logger = logging.getLogger(__name__)
+
+# Coordinators with work that must be committed before the process exits
+_coordinators = []
+_registered = threading.Lock()
+
+
+class WriteBatch:
+    """Documents of one file, queued on the coordinator together when committed.
+
+    Mirrors the add_document/commit/cancel calls of a Whoosh writer, so
+    indexers build a batch the way they used to build a writer. Each
+    document is assigned its near-duplicate cluster and its similarity
+    vector row as it is added, and its text is put in the document store
+    unless it was skipped as a near-duplicate.
+    """
+
+    def __init__(self, coordinator):
+        self.coordinator = coordinator
+        self.documents = []
+        self.ticket = None
+
+    def add_document(self, **fields):
+        duplicates = self.coordinator.duplicates
+        if duplicates is not None:
+            cluster, duplicate = duplicates.assign(fields.get('content') or '')
+            if duplicate:
+                stats.increment('near_duplicates', index=self.coordinator.label)
+                if DUPLICATE_CONFIG['mode'] == 'skip':
+                    return
+            if cluster is not None:
+                fields['cluster'] = str(cluster)
+        fields['doc_id'] = self.coordinator.doc_store.put(fields.get('content'))
+        vectors = self.coordinator.vectors
+        if vectors is not None:
+            fields['vector_id'] = vectors.reserve()
+        self.documents.append(fields)
+
+    def commit(self):
+        """Queue the documents; they are searchable once the coordinator's next commit lands"""
+        if self.documents:
+            self.ticket = self.coordinator.submit(self.documents)
+        return self.ticket
+
+    def cancel(self):
+        self.documents = []
+
+
+class QueuedFile:
+    """The batches of one file queued on a coordinator, recorded as indexed once they are committed.
+
+    index_file() returns one without waiting for the commit. Callers that
+    index many files flush the coordinator once and then call ``done()`` on
+    each; a caller indexing a single file calls ``wait()``.
+    """
+
+    def __init__(self, coordinator, path, nbytes, start):
+        self.coordinator = coordinator
+        self.path = path
+        self.nbytes = nbytes
+        self.start = start
+        self.tickets = []
+        self.documents = 0
+
+    def add(self, batch):
+        """Queue a batch of this file"""
+        ticket = batch.commit()
+        if ticket is not None:
+            self.tickets.append(ticket)
+            self.documents += len(batch.documents)
+
+    def done(self, failures=()):
+        """Record the file as indexed unless one of its tickets is in ``failures``; True if it was"""
+        if any(ticket in failures for ticket in self.tickets):
+            logger.error("Could not commit the documents of %s", self.path)
+            return False
+        stats.record_indexing(self.coordinator.label, self.documents, self.nbytes, time.perf_counter() - self.start)
+        logger.info("Successfully indexed %s", self.path)
+        return True
+
+    def wait(self, timeout=None):
+        """Block until this file's batches are committed, then record it; False if a commit failed"""
+        return self.done({ticket for ticket in self.tickets if not self.coordinator.wait(ticket, timeout)})
+
+
+class IndexWriteCoordinator:
+    """The only writer of one index, fed by any number of producers.
+
+    Batches from index_file(), /index, the startup scan or an upload are
+    queued and committed by one background thread, in order, once
+    ``max_docs`` documents are waiting or the oldest has waited
+    ``max_delay`` seconds. Producers in this process therefore never race
+    for the index write lock, and new documents become searchable within
+    about ``max_delay`` seconds plus the commit time. Producers block once
+    ``max_queued`` documents are waiting, so a fast producer cannot outrun
+    the commits. Another process holding the lock is waited for up to
+    ``lock_timeout`` seconds. Each commit merges the small segments, as
+    Whoosh does by default; a merge scheduler (utils/merging.py) takes
+    ``write_lock`` for the larger merges while the index is idle.
+    """
+
+    def __init__(self, ix, doc_store, label, max_docs=WRITER_CONFIG['max_docs'],
+                 max_delay=WRITER_CONFIG['max_delay'], max_queued=WRITER_CONFIG['max_queued'],
+                 lock_timeout=WRITER_CONFIG['lock_timeout']):
+        self.ix = ix
+        self.doc_store = doc_store
+        self.label = label
+        self.max_docs = max_docs
+        self.max_delay = max_delay
+        self.max_queued = max_queued
+        self.lock_timeout = lock_timeout
+        self.duplicates = get_duplicate_index()
+        self.surface_forms = get_surface_forms()
+        self.condition = threading.Condition()
+        self.queue = []  # (ticket, documents) in submission order
+        self.queued_docs = 0
+        self.oldest = None
+        self.submitted = 0  # Last ticket handed out
+        self.committed = 0  # Last ticket whose commit finished, successfully or not
+        self.failed = set()  # Tickets whose commit failed, until a wait() or flush() reports them
+        self.flush_requested = False
+        self.committing = False
+        self.last_commit = time.monotonic()
+        # Held by whoever writes to the index in this process: a commit or a merge
+        self.write_lock = threading.Lock()
+        # Called without arguments once a commit or merge has landed, e.g. to refresh an indexer's Bloom filters
+        self.on_commit = []
+        self.thread = None
+        with _registered:
+            if not _coordinators:
+                atexit.register(flush_all)
+            _coordinators.append(self)
+
+    @property
+    def vectors(self):
+        # Opened on first use rather than at startup, since the vector index loads numpy
+        return get_vector_index()
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def submit(self, documents):
+        """Queue a list of field dicts as one unit and return its ticket"""
+        with self.condition:
+            if self.max_queued and self.thread is not None:
+                self.condition.wait_for(lambda: self.queued_docs < self.max_queued)
+            self.submitted += 1
+            self.queue.append((self.submitted, documents))
+            self.queued_docs += len(documents)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=f'{self.label}-index-writer', daemon=True)
+                self.thread.start()
+            if self.queued_docs >= self.max_docs:
+                self.condition.notify_all()
+            return self.submitted
+
+    def wait(self, ticket, timeout=None):
+        """Block until the batch with this ticket is committed; False if its commit failed or timed out.
+
+        The batch is committed right away rather than after ``max_delay``, so
+        only callers waiting on a single file should use this; bulk callers
+        flush() once. A None ticket, from an empty batch, counts as committed.
+        """
+        if ticket is None:
+            return True
+        with self.condition:
+            if self.committed < ticket and any(queued == ticket for queued, _ in self.queue):
+                self.flush_requested = True
+                self.condition.notify_all()
+            if not self.condition.wait_for(lambda: self.committed >= ticket, timeout):
+                return False
+            if ticket in self.failed:
+                self.failed.discard(ticket)
+                return False
+            return True
+
+    def flush(self, timeout=None, failures=None):
+        """Commit everything queued so far now and wait for it; False if any of it failed.
+
+        The tickets whose commit failed are added to the ``failures`` set, if given.
+        """
+        with self.condition:
+            target = self.submitted
+            if self.queue:
+                self.flush_requested = True
+                self.condition.notify_all()
+            if not self.condition.wait_for(lambda: self.committed >= target, timeout):
+                return False
+            failed = {ticket for ticket in self.failed if ticket <= target}
+            self.failed -= failed
+            if failures is not None:
+                failures |= failed
+            return not failed
+
+    def idle_seconds(self):
+        """Seconds since the last commit finished, or 0 while documents are queued or committing"""
+        with self.condition:
+            if self.queue or self.committing:
+                return 0
+            return time.monotonic() - self.last_commit
+
+    def run_on_commit(self):
+        for callback in self.on_commit:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("Error updating the %s index after a commit: %s", self.label, e)
+
+    def _due(self):
+        return self.queue and (self.flush_requested or self.queued_docs >= self.max_docs
+                               or time.monotonic() - self.oldest >= self.max_delay)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self._due():
+                    self.condition.wait(self.max_delay - (time.monotonic() - self.oldest) if self.queue else None)
+                groups, self.queue = self.queue, []
+                self.queued_docs = 0
+                self.oldest = None
+                self.flush_requested = False
+                self.committing = True
+            ok = self._commit(groups)
+            if ok:
+                self.run_on_commit()
+            with self.condition:
+                if not ok:
+                    self.failed.update(ticket for ticket, _ in groups)
+                self.committed = groups[-1][0]
+                self.committing = False
+                self.last_commit = time.monotonic()
+                self.condition.notify_all()
+
+    def _commit(self, groups):
+        count = sum(len(documents) for _, documents in groups)
+        start = time.perf_counter()
+        try:
+            with self.write_lock:
+                writer = self.ix.writer(timeout=self.lock_timeout)
+                try:
+                    for _, documents in groups:
+                        for fields in documents:
+                            writer.add_document(**fields)
+                    writer.commit()
+                except Exception:
+                    writer.cancel()
+                    raise
+            # Text and vectors only once the commit has landed, so a failed commit leaves
+            # no vector rows behind; until the flush, hits are read from the pending buffer
+            self.doc_store.flush()
+            vectors = self.vectors
+            if vectors is not None:
+                with stats.timed('stage_seconds', stage='vectors', index=self.label):
+                    vectors.add([(fields['vector_id'], fields.get('content') or '', {
+                        'index': self.label, 'doc': fields.get('doc_id'), 'filename': fields['filename'],
+                        'filetype': fields.get('filetype'), 'title': fields.get('title'),
+                        'location': fields.get('location')}) for _, documents in groups for fields in documents])
+            if self.duplicates is not None:
+                self.duplicates.flush()
+            self.surface_forms.observe(fields.get('content') for _, documents in groups for fields in documents)
+            self.surface_forms.flush()
+        except Exception as e:
+            logger.error("Error committing %s documents to the %s index: %s", count, self.label, e)
+            stats.increment('index_commit_errors', index=self.label)
+            return False
+        stats.increment('index_commits', index=self.label)
+        stats.observe('index_commit_seconds', time.perf_counter() - start, index=self.label)
+        logger.debug("Committed %s documents to the %s index", count, self.label)
+        return True
+
+
+def flush_all(timeout=None):
+    """Commit the queued documents of every index"""
+    with _registered:
+        coordinators = list(_coordinators)
+    for coordinator in coordinators:
+        coordinator.flush(timeout)
@@ -0,0 +1,117 @@
+import json
+import logging
+from datetime import datetime
+
+from config import INGEST_CONFIG
+from utils import stats
+
+logger = logging.getLogger(__name__)
+
+# Optional stored fields a pushed document may set
+OPTIONAL_FIELDS = ('location', 'sheet', 'keypath')
+
+
+def iter_lines(stream, max_bytes=INGEST_CONFIG['max_line_bytes']):
+    """Yield (line number, bytes) from a binary stream, one line at a time.
+
+    Lines longer than ``max_bytes`` are skipped up to their newline and
+    yielded as None, so one oversized record cannot exhaust memory.
+    """
+    number = 0
+    while True:
+        line = stream.readline(max_bytes + 1)
+        if not line:
+            return
+        number += 1
+        if len(line) > max_bytes and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_bytes + 1)
+            yield number, None
+            continue
+        yield number, line
+
+
+def _fields(record):
+    """Index fields of one pushed document; raises ValueError when it is unusable"""
+    content = record.get('content')
+    filename = record.get('filename')
+    if not isinstance(content, str):
+        raise ValueError("'content' must be a string")
+    if not isinstance(filename, str) or not filename:
+        raise ValueError("'filename' is required")
+    timestamp = record.get('timestamp')
+    fields = {
+        'filename': filename,
+        'filetype': record['filetype'],
+        'content': content,
+        'title': str(record.get('title') or filename),
+        'location': filename,
+        'timestamp': datetime.fromisoformat(str(timestamp)) if timestamp else datetime.now(),
+    }
+    for name in OPTIONAL_FIELDS:
+        if record.get(name) is not None:
+            fields[name] = str(record[name])
+    return fields
+
+
+def ingest_ndjson(stream, indexers, batch_size=INGEST_CONFIG['batch_size'], default_filetype=None):
+    """Index pre-extracted documents from an NDJSON stream, yielding one acknowledgement per batch.
+
+    Each line is a JSON object with ``filename``, ``content`` and ``filetype``
+    (an index name, or ``default_filetype``) and optionally ``title``,
+    ``timestamp`` (ISO 8601), ``location``, ``sheet`` and ``keypath``. Every
+    ``batch_size`` lines the accepted documents are queued on the write
+    coordinators of their indexes; the acknowledgement lists the lines
+    rejected in that batch. A final summary follows once everything queued
+    has been committed.
+    """
+    batches = {}
+    touched = set()
+    accepted, rejected = 0, []
+    totals = {'accepted': 0, 'rejected': 0}
+    batch_no = 0
+    first_line = 1
+
+    def ack(last_line):
+        nonlocal batches, accepted, rejected, batch_no, first_line
+        for name, batch in batches.items():
+            batch.commit()
+            stats.increment('documents_ingested', len(batch.documents), index=name)
+        batch_no += 1
+        result = {'batch': batch_no, 'lines': [first_line, last_line], 'accepted': accepted,
+                  'rejected': rejected, 'indexes': sorted(batches)}
+        totals['accepted'] += accepted
+        totals['rejected'] += len(rejected)
+        batches, accepted, rejected, first_line = {}, 0, [], last_line + 1
+        return result
+
+    number = 0
+    for number, line in iter_lines(stream):
+        if line is None:
+            rejected.append({'line': number, 'error': 'Line too long'})
+        elif line.strip():
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("Expected a JSON object")
+                record.setdefault('filetype', default_filetype)
+                indexer = indexers.get(record['filetype'])
+                if indexer is None:
+                    raise ValueError(f"Unknown filetype: {record['filetype']}")
+                fields = _fields(record)
+                batch = batches.get(record['filetype'])
+                if batch is None:
+                    batch = batches[record['filetype']] = indexer.writes.batch()
+                    touched.add(record['filetype'])
+                batch.add_document(**fields)
+                accepted += 1
+            except (ValueError, TypeError) as e:  # json.JSONDecodeError and bad timestamps included
+                rejected.append({'line': number, 'error': str(e)})
+        if number - first_line + 1 >= batch_size:
+            yield ack(number)
+    if number >= first_line:
+        yield ack(number)
+
+    committed = all([indexers[name].writes.flush() for name in touched])
+    logger.info("Ingested %s documents, rejected %s", totals['accepted'], totals['rejected'])
+    yield {'done': True, 'batches': batch_no, 'committed': committed, **totals}
@@ -0,0 +1,53 @@
+from whoosh.analysis import Filter, RegexTokenizer, LowercaseFilter, StopFilter, STOP_WORDS
+
+def shared_processor():
+    """The TextProcessor of this process, created on first use.
+
+    Analyzers are pickled into the index schema and into multiprocessing
+    writer workers, so they hold no NLTK state themselves; each process loads
+    it once and shares the lemma cache between all its analyzers. NLTK is only
+    imported here, so building the schema does not load it.
+    """
+    from utils.text_processor import get_text_processor
+    return get_text_processor()
+
+
+class LemmaFilter(Filter):
+    """Replaces token texts with their WordNet lemmas.
+
+    Tokens are collected into batches of ``batch_size`` and POS-tagged with a
+    single tagger call per batch, so a document is tagged in a few calls
+    instead of one per word. Lemmas come from TextProcessor's LRU cache keyed
+    by (word, POS bucket).
+    """
+
+    is_morph = True
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+
+    def __call__(self, tokens):
+        batch = []
+        for t in tokens:
+            # Tokenizers reuse one Token object, so batched tokens are copies
+            batch.append(t.copy())
+            if len(batch) >= self.batch_size:
+                yield from self._lemmatize(batch)
+                batch = []
+        if batch:
+            yield from self._lemmatize(batch)
+
+    def _lemmatize(self, batch):
+        processor = shared_processor()
+        words = [t for t in batch if not t.stopped]
+        buckets = processor.pos_buckets([t.text for t in words])
+        for t, bucket in zip(words, buckets):
+            t.text = processor.lemmatize(t.text, bucket)
+        return batch
+
+
+def LemmaAnalyzer(batch_size=1000, stoplist=STOP_WORDS, minsize=2):
+    """Like Whoosh's StemmingAnalyzer, with NLTK lemmatization in place of the Porter stemmer"""
+    return (RegexTokenizer() | LowercaseFilter()
+            | StopFilter(stoplist=stoplist, minsize=minsize)
+            | LemmaFilter(batch_size=batch_size))
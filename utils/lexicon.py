@@ -0,0 +1,586 @@
+import os
+import re
+import heapq
+import fnmatch
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+from whoosh.query import Wildcard, FuzzyTerm
+from whoosh.support.levenshtein import distance
+
+from config import INDEX_DIR, SCHEMA, LEXICON_CONFIG, SEARCH_CONFIG, SUGGEST_CONFIG
+
+# Markers for the start and end of a term, so anchored pattern pieces only match at the edges
+_START = '\x02'
+_END = '\x03'
+
+
+class NgramIndex:
+    """Character n-gram postings over the terms of one field.
+
+    A wildcard pattern is cut into its literal pieces; the n-grams of those
+    pieces are intersected to get a small candidate set, which is then checked
+    against the full pattern. This replaces the scan over the whole lexicon
+    that Whoosh does for patterns starting with a wildcard.
+    """
+
+    def __init__(self, n, lock):
+        self.n = n
+        # Shared with the Lexicon, which holds it while adding and removing terms
+        self.lock = lock
+        self.postings = {}
+
+    def _grams(self, text):
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def add(self, term):
+        for gram in self._grams(_START + term + _END):
+            self.postings.setdefault(gram, set()).add(term)
+
+    def remove(self, term):
+        for gram in self._grams(_START + term + _END):
+            terms = self.postings.get(gram)
+            if terms is not None:
+                terms.discard(term)
+                if not terms:
+                    del self.postings[gram]
+
+    def candidates(self, pattern):
+        """Terms matching a glob pattern, or None if the pattern has no usable n-grams"""
+        if '[' in pattern:
+            return None
+        pieces = re.split(r'[*?]+', pattern)
+        grams = set()
+        for i, piece in enumerate(pieces):
+            if not piece:
+                continue
+            if i == 0:
+                piece = _START + piece
+            if i == len(pieces) - 1:
+                piece = piece + _END
+            grams |= self._grams(piece)
+        if not grams:
+            return None
+
+        with self.lock:
+            postings = []
+            for gram in grams:
+                terms = self.postings.get(gram)
+                if not terms:
+                    return set()
+                postings.append(terms)
+            postings.sort(key=len)
+            matched = set(postings[0])
+            for terms in postings[1:]:
+                matched &= terms
+                if not matched:
+                    return matched
+
+        expression = re.compile(fnmatch.translate(pattern))
+        return {term for term in matched if expression.match(term)}
+
+
+def _deletes(word, distance):
+    """Every string reachable from a word by removing up to ``distance`` characters"""
+    found = {word}
+    edge = {word}
+    for _ in range(distance):
+        edge = {w[:i] + w[i + 1:] for w in edge for i in range(len(w))}
+        found |= edge
+    return found
+
+
+class DeletionIndex:
+    """Symmetric-delete (SymSpell) neighbourhoods over the terms of one field.
+
+    Each term is filed under every string its first ``prefix_length``
+    characters can be reduced to with up to ``max_distance`` deletions. Two
+    terms within that edit distance always share such a string, so a fuzzy
+    lookup only has to generate the deletions of the query word and check the
+    few terms filed under them, instead of walking the whole lexicon.
+    """
+
+    def __init__(self, max_distance, prefix_length, lock):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.lock = lock
+        self.postings = {}
+
+    def _keys(self, term, distance):
+        return _deletes(term[:self.prefix_length], distance)
+
+    # Most keys belong to a single term, which is then stored as a bare string instead of a set
+
+    def add(self, term):
+        postings = self.postings
+        for key in self._keys(term, self.max_distance):
+            terms = postings.get(key)
+            if terms is None:
+                postings[key] = term
+            elif type(terms) is str:
+                if terms != term:
+                    postings[key] = {terms, term}
+            else:
+                terms.add(term)
+
+    def remove(self, term):
+        postings = self.postings
+        for key in self._keys(term, self.max_distance):
+            terms = postings.get(key)
+            if terms is None:
+                continue
+            if type(terms) is str:
+                if terms == term:
+                    del postings[key]
+            else:
+                terms.discard(term)
+                if len(terms) == 1:
+                    postings[key] = terms.pop()
+
+    def candidates(self, text, maxdist, prefix=0):
+        """Terms within ``maxdist`` edits of text sharing its first ``prefix`` characters,
+        as a term -> distance dict, or None if maxdist is beyond what the index was built for
+        """
+        if maxdist > self.max_distance:
+            return None
+        matched = set()
+        with self.lock:
+            for key in self._keys(text, maxdist):
+                terms = self.postings.get(key)
+                if terms is None:
+                    continue
+                if type(terms) is str:
+                    matched.add(terms)
+                else:
+                    matched |= terms
+
+        head = text[:prefix]
+        found = {}
+        for term in matched:
+            if not term.startswith(head) or abs(len(term) - len(text)) > maxdist:
+                continue
+            dist = distance(term, text, maxdist)
+            if dist <= maxdist:
+                found[term] = dist
+        return found
+
+
+class PrefixIndex:
+    """Frequency-weighted completions over a sorted array of keys.
+
+    Keys are folded to lowercase and kept sorted, so the completions of a
+    prefix are one contiguous range found by bisection. Weights change in
+    place as segments come and go; the next lookup merges the new keys into
+    the sorted array and recomputes only the precomputed top-k lists of the
+    short prefixes that were touched, which are the ranges too wide to rank
+    on every keystroke.
+    """
+
+    def __init__(self, lock, max_keys=None):
+        self.lock = lock
+        self.depth = SUGGEST_CONFIG['precomputed_depth']
+        self.k = SUGGEST_CONFIG['limit']
+        # Once reached, further new keys are ignored so memory stays bounded
+        self.max_keys = max_keys
+        self.weights = {}
+        # Folded key -> text as first seen
+        self.labels = {}
+        self.keys = []
+        # Short prefix -> best keys
+        self.top = {}
+        self.added = set()
+        self.changed = set()
+
+    def add(self, text, weight):
+        key = text.lower()
+        if key not in self.weights:
+            if self.max_keys is not None and len(self.weights) >= self.max_keys:
+                return
+            self.weights[key] = 0
+            self.labels[key] = text
+            self.added.add(key)
+        self.weights[key] += weight
+        self.changed.add(key)
+
+    def remove(self, text, weight):
+        key = text.lower()
+        if key not in self.weights:
+            return
+        weight = self.weights[key] - weight
+        if weight > 0:
+            self.weights[key] = weight
+        else:
+            del self.weights[key]
+            del self.labels[key]
+        self.changed.add(key)
+
+    def _rebuild(self):
+        if not self.changed:
+            return
+        keys = [key for key in self.keys if key in self.weights]
+        # Two sorted runs: the sort merges them in linear time
+        keys.extend(sorted(key for key in self.added if key in self.weights))
+        keys.sort()
+        self.keys = keys
+        prefixes = {key[:i] for key in self.changed for i in range(1, min(len(key), self.depth) + 1)}
+        for prefix in prefixes:
+            top = self._scan(prefix)
+            if top:
+                self.top[prefix] = top
+            else:
+                self.top.pop(prefix, None)
+        self.added.clear()
+        self.changed.clear()
+
+    def _scan(self, prefix):
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + '\U0010ffff', lo)
+        return heapq.nlargest(self.k, self.keys[lo:hi], key=self.weights.__getitem__)
+
+    def complete(self, prefix, limit):
+        """Up to ``limit`` (text, weight) pairs starting with prefix, heaviest first"""
+        prefix = prefix.lower()
+        with self.lock:
+            self._rebuild()
+            if len(prefix) <= self.depth:
+                keys = self.top.get(prefix, [])
+            else:
+                keys = self._scan(prefix)
+            return [(self.labels[key], self.weights[key]) for key in keys[:limit]]
+
+
+class Lexicon:
+    """Auxiliary structures built from the vocabulary of an index.
+
+    The vocabulary is tracked per segment: segments are immutable, so after a
+    commit only the terms of new segments are added and the terms that no
+    longer occur in any segment are removed.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = fields or LEXICON_CONFIG['fields']
+        self.lock = threading.Lock()
+        # Segment id -> ({field: ([terms], document frequencies)}, title counts)
+        self.segments = {}
+        self.generation = -1
+        # Field -> {term: number of segments containing it}
+        self.refcounts = {field: {} for field in self.fields}
+        self.ngrams = {field: NgramIndex(LEXICON_CONFIG['ngram_size'], self.lock) for field in self.fields}
+        self.fuzzy = {field: DeletionIndex(SEARCH_CONFIG['fuzzy_distance'], LEXICON_CONFIG['fuzzy_prefix_length'],
+                                           self.lock)
+                      for field in self.fields}
+        # Completions for /suggest: terms weighted by document frequency, and whole titles
+        self.completions = PrefixIndex(self.lock, max_keys=SUGGEST_CONFIG['max_terms'])
+        self.title_completions = PrefixIndex(self.lock, max_keys=SUGGEST_CONFIG['max_titles'])
+
+    def _structures(self, field):
+        return [self.ngrams[field], self.fuzzy[field]]
+
+    def refresh(self, reader):
+        """Bring the structures up to date with the segments of a reader"""
+        generation = reader.generation()
+        if generation is not None and generation < self.generation:
+            # A searcher opened before the last commit; the newer vocabulary covers it
+            return
+        leaves = {}
+        for segreader, _ in reader.leaf_readers():
+            segment = getattr(segreader, 'segment', None)
+            # An empty index has a leaf reader without a segment
+            segment = segment() if segment is not None else None
+            if segment is not None:
+                leaves[segment.segment_id()] = segreader
+        if leaves.keys() != self.segments.keys():
+            with self.lock:
+                if generation is not None and generation < self.generation:
+                    return
+                for segment_id in set(self.segments) - set(leaves):
+                    self._drop_segment(segment_id)
+                for segment_id in set(leaves) - set(self.segments):
+                    self._add_segment(segment_id, leaves[segment_id])
+        # Only recorded once the structures are up to date, see complete_index()
+        if generation is not None and generation > self.generation:
+            self.generation = generation
+
+    def _add_segment(self, segment_id, segreader):
+        terms_by_field = {}
+        for field in self.fields:
+            if field not in segreader.schema:
+                continue
+            fieldobj = segreader.schema[field]
+            terms = []
+            freqs = array('I')
+            for btext, info in segreader.iter_field(field):
+                terms.append(fieldobj.from_bytes(btext))
+                freqs.append(info.doc_frequency())
+            terms_by_field[field] = (terms, freqs)
+            refcounts = self.refcounts[field]
+            structures = self._structures(field)
+            for term, freq in zip(terms, freqs):
+                count = refcounts.get(term, 0)
+                refcounts[term] = count + 1
+                if not count:
+                    for structure in structures:
+                        structure.add(term)
+                self.completions.add(term, freq)
+
+        titles = Counter()
+        if 'title' in segreader.schema and segreader.schema['title'].stored:
+            for fields in segreader.all_stored_fields():
+                if fields.get('title'):
+                    titles[fields['title']] += 1
+        for title, count in titles.items():
+            self.title_completions.add(title, count)
+        self.segments[segment_id] = (terms_by_field, titles)
+
+    def _drop_segment(self, segment_id):
+        terms_by_field, titles = self.segments.pop(segment_id)
+        for field, (terms, freqs) in terms_by_field.items():
+            refcounts = self.refcounts[field]
+            structures = self._structures(field)
+            for term, freq in zip(terms, freqs):
+                count = refcounts[term] - 1
+                if count:
+                    refcounts[term] = count
+                else:
+                    del refcounts[term]
+                    for structure in structures:
+                        structure.remove(term)
+                self.completions.remove(term, freq)
+        for title, count in titles.items():
+            self.title_completions.remove(title, count)
+
+    def complete(self, prefix, limit):
+        """Completions of a typed prefix as dicts with text, kind ('term' or 'title') and weight.
+
+        Terms complete the last word of the prefix; titles complete the whole prefix.
+        """
+        head, _, word = prefix.rpartition(' ')
+        completions = []
+        if word:
+            # Terms are analyzed (stemmed) forms; offer the word they are usually indexed from
+            surface = get_surface_forms()
+            words = {}
+            for term, weight in self.completions.complete(word, limit):
+                term = surface.get(term)
+                words[term] = words.get(term, 0) + weight
+            for term, weight in words.items():
+                text = f"{head} {term}" if head else term
+                completions.append({'text': text, 'kind': 'term', 'weight': weight})
+        for title, weight in self.title_completions.complete(prefix, limit):
+            completions.append({'text': title, 'kind': 'title', 'weight': weight})
+        completions.sort(key=lambda c: c['weight'], reverse=True)
+        return completions[:limit]
+
+    def rewrite_query(self, query):
+        """Swap leading-wildcard and fuzzy queries for ones backed by the lexicon structures"""
+        def rewrite(q):
+            if (type(q) is Wildcard and q.fieldname in self.ngrams
+                    and q.text[:1] in ('*', '?')):
+                return NgramWildcard(q.fieldname, q.text, self.ngrams[q.fieldname],
+                                     boost=q.boost, constantscore=q.constantscore)
+            if type(q) is FuzzyTerm and q.fieldname in self.fuzzy:
+                return IndexedFuzzyTerm(q.fieldname, q.text, self.fuzzy[q.fieldname], boost=q.boost,
+                                        maxdist=q.maxdist, prefixlength=q.prefixlength,
+                                        constantscore=q.constantscore)
+            return q
+        return query.accept(rewrite)
+
+    def _correction(self, reader, term):
+        """Closest known term to an unknown one and its document frequency, or None"""
+        best = None
+        for field in self.fields:
+            if field not in reader.schema:
+                continue
+            candidates = self.fuzzy[field].candidates(term, SEARCH_CONFIG['fuzzy_distance']) or {}
+            for candidate, dist in candidates.items():
+                freq = reader.doc_frequency(field, candidate)
+                if freq and (best is None or (dist, -freq, candidate) < (best[1], -best[2], best[0])):
+                    best = (candidate, dist, freq)
+        return best and (best[0], best[2])
+
+    def did_you_mean(self, reader, text):
+        """Respell the words of a query that are not in the vocabulary.
+
+        Returns (corrected text, summed document frequency of the corrections,
+        the analyzed terms that were respelled), or None when every word is
+        known or has no close match. Other indexes may know a respelled term,
+        so callers searching several indexes check it against each of them.
+        """
+        field = self.fields[0]
+        if field not in reader.schema:
+            return None
+        tokens = [(t.text, t.startchar, t.endchar)
+                  for t in reader.schema[field].analyzer(text, chars=True, mode='query')]
+        pieces = []
+        respelled = []
+        last = 0
+        weight = 0
+        for term, start, end in tokens:
+            if any(term in self.refcounts[f] for f in self.fields):
+                continue
+            correction = self._correction(reader, term)
+            if correction is None:
+                continue
+            replacement, freq = correction
+            word = text[start:end]
+            # Keep the word's own ending when the stem is a prefix of it ("retrival" -> "retrieval")
+            if word.lower().startswith(term):
+                replacement += word[len(term):]
+            pieces.append(text[last:start] + replacement)
+            last = end
+            weight += freq
+            respelled.append(term)
+        if not pieces:
+            return None
+        return ''.join(pieces) + text[last:], weight, tuple(respelled)
+
+
+_WORD = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=200000)
+def _term_of(word):
+    """The single term the content analyzer makes of a word, or None (stop words, several tokens)"""
+    terms = [token.text for token in SCHEMA['content'].analyzer(word)]
+    return terms[0] if len(terms) == 1 else None
+
+
+class SurfaceForms:
+    """The spelling most documents use for each analyzed term, e.g. "retrieval" for "retriev".
+
+    Fed the text of every committed document: each distinct word is
+    analyzed once (cached) and a majority vote per term keeps its dominant
+    spelling. Shared by every index, since they share the analyzer, and
+    persisted as an append-only table next to the indexes where the last
+    line of a term wins. At most ``max_terms`` terms are tracked.
+    """
+
+    def __init__(self, path, max_terms=SUGGEST_CONFIG['max_terms']):
+        self.path = path
+        self.max_terms = max_terms
+        self.lock = threading.Lock()
+        # Term -> [spelling, votes ahead of the other spellings]
+        self.forms = {}
+        self.pending = set()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                # A line cut short by a crash is skipped
+                if len(parts) == 3 and parts[2].isdigit():
+                    self.forms[parts[0]] = [parts[1], int(parts[2])]
+
+    def observe(self, texts):
+        """Count the words of some document texts, once per document"""
+        words = Counter()
+        for text in texts:
+            if text:
+                words.update(set(_WORD.findall(text.lower())))
+        with self.lock:
+            for word, count in words.items():
+                term = _term_of(word)
+                if term is None:
+                    continue
+                form = self.forms.get(term)
+                if form is None:
+                    if len(self.forms) >= self.max_terms:
+                        continue
+                    self.forms[term] = [word, count]
+                    self.pending.add(term)
+                elif form[0] == word:
+                    form[1] += count
+                elif form[1] > count:
+                    form[1] -= count
+                else:
+                    self.forms[term] = [word, count - form[1]]
+                    self.pending.add(term)
+
+    def get(self, term):
+        form = self.forms.get(term)
+        return form[0] if form is not None else term
+
+    def flush(self):
+        """Append the terms whose spelling is new or changed to the table file"""
+        with self.lock:
+            pending, self.pending = self.pending, set()
+            lines = [f"{term}\t{self.forms[term][0]}\t{self.forms[term][1]}\n" for term in pending]
+        if lines:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(lines))
+
+    def clear(self):
+        with self.lock:
+            self.forms, self.pending = {}, set()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def __len__(self):
+        return len(self.forms)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_surface_forms():
+    """The SurfaceForms table shared by all indexers"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = SurfaceForms(os.path.join(INDEX_DIR, 'surface_forms.tsv'))
+        return _shared
+
+
+def open_surface_forms(path):
+    """Make the table stored at ``path`` the shared one, e.g. when a replica switches generations"""
+    global _shared
+    table = SurfaceForms(path)
+    with _shared_lock:
+        _shared = table
+    return table
+
+
+class NgramWildcard(Wildcard):
+    """Wildcard query that expands to terms found through an NgramIndex"""
+
+    def __init__(self, fieldname, text, ngrams, boost=1.0, constantscore=True):
+        super().__init__(fieldname, text, boost=boost, constantscore=constantscore)
+        self.ngrams = ngrams
+
+    def _btexts(self, ixreader):
+        candidates = self.ngrams.candidates(self.text)
+        if candidates is None:
+            yield from super()._btexts(ixreader)
+            return
+        field = ixreader.schema[self.fieldname]
+        for term in sorted(candidates):
+            btext = field.to_bytes(term)
+            # The candidates cover every segment; keep the ones this reader has
+            if (self.fieldname, btext) in ixreader:
+                yield btext
+
+
+class IndexedFuzzyTerm(FuzzyTerm):
+    """Fuzzy term query that expands through a DeletionIndex instead of an edit-distance scan"""
+
+    def __init__(self, fieldname, text, deletions, boost=1.0, maxdist=1, prefixlength=1, constantscore=True):
+        super().__init__(fieldname, text, boost=boost, maxdist=maxdist, prefixlength=prefixlength,
+                         constantscore=constantscore)
+        self.deletions = deletions
+
+    def _btexts(self, ixreader):
+        candidates = self.deletions.candidates(self.text, self.maxdist, self.prefixlength)
+        if candidates is None:
+            yield from super()._btexts(ixreader)
+            return
+        field = ixreader.schema[self.fieldname]
+        for term in sorted(candidates):
+            btext = field.to_bytes(term)
+            if (self.fieldname, btext) in ixreader:
+                yield btext
@@ -0,0 +1,32 @@
+import random
+import logging
+
+from config import LOGGING_CONFIG
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a random ``rate`` fraction of DEBUG and INFO records and every warning or error"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+def configure_logging(config=LOGGING_CONFIG):
+    """Set up the root logger for the app.
+
+    Modules log through ``logging.getLogger(__name__)`` with %-style arguments,
+    so records below the configured level cost a level check and nothing else;
+    without this call (benchmarks, scripts) only warnings and errors are shown.
+    """
+    root = logging.getLogger()
+    if any(isinstance(f, SamplingFilter) for h in root.handlers for f in h.filters):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(config['format']))
+    handler.addFilter(SamplingFilter(config['sample_rate']))
+    root.addHandler(handler)
+    root.setLevel(config['level'].upper() if isinstance(config['level'], str) else config['level'])
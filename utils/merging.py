@@ -0,0 +1,228 @@
+import math
+import time
+import logging
+import threading
+from datetime import datetime
+
+from whoosh.index import LockError
+from whoosh.reading import SegmentReader
+
+from config import MERGE_CONFIG
+from utils import stats
+
+logger = logging.getLogger(__name__)
+
+
+def segment_stats(ix):
+    """Documents, deleted documents and bytes on disk of each segment of the latest commit"""
+    files = {}
+    for name in ix.storage.list():
+        files.setdefault(name.split('.', 1)[0], []).append(name)
+    segments = []
+    for segment in ix._segments():
+        segid = segment.segment_id()
+        segments.append({
+            'id': segid,
+            'documents': segment.doc_count_all(),
+            'deleted': segment.deleted_count(),
+            'bytes': sum(ix.storage.file_length(name) for name in files.get(segid, ())),
+        })
+    return segments
+
+
+def summarize(segments, config=MERGE_CONFIG):
+    """Totals and the size distribution (segments per tier) of a segment list"""
+    documents = sum(s['documents'] for s in segments)
+    deleted = sum(s['deleted'] for s in segments)
+    tiers = {}
+    for segment in segments:
+        tier = _tier(segment['bytes'], config)
+        tiers[tier] = tiers.get(tier, 0) + 1
+    return {
+        'segments': len(segments),
+        'documents': documents,
+        'deleted': deleted,
+        'deleted_ratio': round(deleted / documents, 4) if documents else 0.0,
+        'bytes': sum(s['bytes'] for s in segments),
+        'largest_segment_bytes': max((s['bytes'] for s in segments), default=0),
+        'tiers': dict(sorted(tiers.items())),
+    }
+
+
+def _tier(size, config):
+    """Size tier of a segment: 0 up to floor_bytes, then one more per merge_factor times larger"""
+    return int(math.log(max(size, config['floor_bytes']) / config['floor_bytes'], config['merge_factor']))
+
+
+def plan_merge(segments, config=MERGE_CONFIG, quiet=True):
+    """Choose the next merge for an index: (segment ids, reason), or (None, None).
+
+    In order of preference: optimize an index with many deleted documents,
+    rewrite the segment with the largest share of deleted documents, merge
+    the ``merge_factor`` smallest segments of the lowest full size tier.
+    Outside a quiet window only the last applies, and only once there are
+    more than ``max_segments`` segments.
+    """
+    if not segments:
+        return None, None
+    factor, limit = config['merge_factor'], config['max_merge_bytes']
+    if quiet:
+        totals = summarize(segments, config)
+        if totals['deleted_ratio'] >= config['optimize_deleted_ratio'] and totals['bytes'] <= config['optimize_max_bytes']:
+            return [s['id'] for s in segments], 'optimize'
+        dirty = [s for s in segments if s['documents'] and s['bytes'] <= limit
+                 and s['deleted'] / s['documents'] >= config['deleted_ratio']]
+        if dirty:
+            return [max(dirty, key=lambda s: s['deleted'] / s['documents'])['id']], 'compact'
+        by_tier = {}
+        for segment in sorted(segments, key=lambda s: s['bytes']):
+            by_tier.setdefault(_tier(segment['bytes'], config), []).append(segment)
+        for tier in sorted(by_tier):
+            chosen = _smallest(by_tier[tier], factor, limit)
+            if chosen:
+                return chosen, 'tier'
+    if len(segments) > config['max_segments']:
+        chosen = _smallest(sorted(segments, key=lambda s: s['bytes']), factor, limit)
+        if chosen:
+            return chosen, 'count'
+    return None, None
+
+
+def _smallest(segments, count, limit):
+    """Ids of the first ``count`` of size-sorted segments if there are that many and they fit in ``limit`` bytes"""
+    chosen = segments[:count]
+    if len(chosen) < count or sum(s['bytes'] for s in chosen) > limit:
+        return None
+    return [s['id'] for s in chosen]
+
+
+def merge_segments(ix, segment_ids, optimize=False):
+    """Merge segments of an index into one in a single commit, dropping their deleted documents.
+
+    Returns False without waiting if another writer holds the index lock.
+    Searchers keep reading the previous generation until they reopen.
+    """
+    try:
+        writer = ix.writer(timeout=0)
+    except LockError:
+        return False
+    chosen = set(segment_ids)
+
+    def mergetype(writer, segments):
+        kept = []
+        for segment in segments:
+            if segment.segment_id() in chosen:
+                reader = SegmentReader(writer.storage, writer.schema, segment)
+                writer.add_reader(reader)
+                reader.close()
+            else:
+                kept.append(segment)
+        return kept
+
+    try:
+        if optimize:
+            writer.commit(optimize=True)
+        else:
+            writer.commit(mergetype=mergetype)
+    except Exception:
+        writer.cancel()
+        raise
+    return True
+
+
+def in_window(windows, now=None):
+    """True if the local time is inside one of the 'HH:MM-HH:MM' windows, or there are none"""
+    if not windows:
+        return True
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    for window in windows:
+        start, end = ([int(part) for part in bound.split(':')] for bound in window.split('-'))
+        start, end = start[0] * 60 + start[1], end[0] * 60 + end[1]
+        # A window may run past midnight, e.g. 22:00-06:00
+        if start <= minute < end if start <= end else minute >= start or minute < end:
+            return True
+    return False
+
+
+class MergeScheduler:
+    """Keep the segments of every index in check from one background thread.
+
+    Commits merge their own small segments; this handles what they leave
+    behind: larger size tiers, segments with many deleted documents and
+    optimizing. Every ``interval`` seconds each index's segment statistics are taken
+    and, when the index is quiet (inside a window and idle for
+    ``idle_seconds``), one planned merge is run. Writers are never made to
+    wait: a merge only starts if the index's write lock is free, and while
+    it runs new documents queue on the write coordinator. Searchers keep
+    their generation. After a merge the thread sleeps long enough to keep
+    the bytes read and written under ``io_bytes_per_second``.
+    """
+
+    def __init__(self, indexers, config=MERGE_CONFIG):
+        self.indexers = indexers
+        self.config = config
+        self.last_merge = {}  # index -> details of its last merge
+        self.thread = None
+
+    def check(self, name):
+        """Run the next merge of one index if it is due; returns (bytes merged, seconds taken)"""
+        indexer = self.indexers[name]
+        writes = indexer.writes
+        segments = segment_stats(indexer.ix)
+        quiet = in_window(self.config['windows']) and writes.idle_seconds() >= self.config['idle_seconds']
+        segment_ids, reason = plan_merge(segments, self.config, quiet)
+        if segment_ids is None:
+            return 0, 0
+        # Whoever holds the lock is committing, which matters more; try again next round
+        if not writes.write_lock.acquire(blocking=False):
+            return 0, 0
+        try:
+            merged = sum(s['bytes'] for s in segments if s['id'] in segment_ids)
+            start = time.perf_counter()
+            if not merge_segments(indexer.ix, segment_ids, optimize=reason == 'optimize'):
+                return 0, 0
+            seconds = time.perf_counter() - start
+        finally:
+            writes.write_lock.release()
+        writes.run_on_commit()
+        stats.increment('index_merges', index=name, reason=reason)
+        stats.increment('index_merged_bytes', merged, index=name)
+        stats.observe('index_merge_seconds', seconds, index=name)
+        self.last_merge[name] = {'time': datetime.now().isoformat(timespec='seconds'), 'reason': reason,
+                                 'segments': len(segment_ids), 'bytes': merged, 'seconds': round(seconds, 3)}
+        logger.info("Merged %s segments (%s bytes) of the %s index in %.2fs: %s", len(segment_ids), merged, name,
+                    seconds, reason)
+        return merged, seconds
+
+    def run_once(self):
+        for name in self.indexers:
+            try:
+                merged, seconds = self.check(name)
+            except Exception as e:
+                logger.error("Error merging segments of the %s index: %s", name, e)
+                continue
+            budget = self.config['io_bytes_per_second']
+            if merged and budget:
+                # Each merged byte is read once and written about once
+                time.sleep(max(0, 2 * merged / budget - seconds))
+
+    def _run(self):
+        while True:
+            time.sleep(self.config['interval'])
+            self.run_once()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='segment-merger', daemon=True)
+        self.thread.start()
+        return self
+
+    def report(self):
+        """Segment statistics, size distribution and last merge of every index"""
+        report = {'windows': self.config['windows'], 'in_window': in_window(self.config['windows']), 'indexes': {}}
+        for name, indexer in self.indexers.items():
+            segments = segment_stats(indexer.ix)
+            report['indexes'][name] = {**summarize(segments, self.config), 'idle_seconds':
+                                       round(indexer.writes.idle_seconds(), 1), 'last_merge': self.last_merge.get(name),
+                                       'segment_list': segments}
+        return report
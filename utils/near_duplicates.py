@@ -0,0 +1,137 @@
+import os
+import re
+import struct
+import hashlib
+import threading
+from functools import lru_cache
+
+from config import INDEX_DIR, DUPLICATE_CONFIG
+
+_TOKEN = re.compile(r'\w+')
+# Table entry: signature and cluster id
+_ENTRY = struct.Struct('<QI')
+
+
+@lru_cache(maxsize=200000)
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def simhash(text, min_tokens=DUPLICATE_CONFIG['min_tokens']):
+    """64-bit SimHash of the words and word pairs of a text, or None when it has too few words.
+
+    Texts that differ in a few words get signatures that differ in a few
+    bits, so near-duplicates are found by Hamming distance.
+    """
+    tokens = _TOKEN.findall(text.lower())
+    if len(tokens) < min_tokens:
+        return None
+    import numpy as np
+    shifts = np.arange(64, dtype=np.uint64)
+    features = tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+    hashes = np.fromiter((_feature_hash(f) for f in features), dtype=np.uint64, count=len(features))
+    # Per bit position: how many features set it, against how many do not
+    ones = ((hashes[:, None] >> shifts) & np.uint64(1)).sum(axis=0)
+    bits = ones * 2 > len(features)
+    return int((bits.astype(np.uint64) << shifts).sum())
+
+
+class DuplicateIndex:
+    """SimHash signatures of one representative per cluster, with an LSH band table.
+
+    The 64 signature bits are split into ``bands`` bands; two signatures
+    within ``max_distance`` bits (fewer than ``bands``) share at least one
+    band exactly, so a lookup only compares signatures from the same band
+    buckets. Shared by every index, so copies across formats (the same text
+    as PDF and TXT) land in one cluster. Persisted as an append-only table
+    next to the indexes.
+    """
+
+    def __init__(self, path, bands=DUPLICATE_CONFIG['bands'], max_distance=DUPLICATE_CONFIG['max_distance'],
+                 max_candidates=DUPLICATE_CONFIG['max_candidates']):
+        if max_distance >= bands:
+            raise ValueError("max_distance must be smaller than bands for the band lookup to find every match")
+        self.path = path
+        self.bands = bands
+        self.width = 64 // bands
+        self.max_distance = max_distance
+        self.max_candidates = max_candidates
+        self.lock = threading.Lock()
+        self.signatures = []
+        self.clusters = []
+        self.buckets = [dict() for _ in range(bands)]
+        self.pending = []
+        self._load()
+
+    def _band_keys(self, signature):
+        mask = (1 << self.width) - 1
+        return [(signature >> (band * self.width)) & mask for band in range(self.bands)]
+
+    def _add(self, signature, cluster):
+        entry = len(self.signatures)
+        self.signatures.append(signature)
+        self.clusters.append(cluster)
+        for band, key in enumerate(self._band_keys(signature)):
+            self.buckets[band].setdefault(key, []).append(entry)
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+            for signature, cluster in _ENTRY.iter_unpack(raw[:len(raw) - len(raw) % _ENTRY.size]):
+                self._add(signature, cluster)
+
+    def find(self, signature):
+        """Cluster of a stored signature within max_distance bits, or None"""
+        for band, key in enumerate(self._band_keys(signature)):
+            for entry in self.buckets[band].get(key, ())[:self.max_candidates]:
+                if bin(self.signatures[entry] ^ signature).count('1') <= self.max_distance:
+                    return self.clusters[entry]
+        return None
+
+    def assign(self, text):
+        """(cluster id, is near-duplicate) for a document text; the id is None for texts too short to compare"""
+        signature = simhash(text)
+        if signature is None:
+            return None, False
+        with self.lock:
+            cluster = self.find(signature)
+            if cluster is not None:
+                return cluster, True
+            cluster = len(self.signatures)
+            self._add(signature, cluster)
+            self.pending.append(_ENTRY.pack(signature, cluster))
+            return cluster, False
+
+    def flush(self):
+        """Append the signatures of new clusters to the table file"""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if pending:
+            with open(self.path, 'ab') as f:
+                f.write(b''.join(pending))
+
+    def clear(self):
+        with self.lock:
+            self.signatures, self.clusters, self.pending = [], [], []
+            self.buckets = [dict() for _ in range(self.bands)]
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def __len__(self):
+        return len(self.signatures)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_duplicate_index():
+    """The DuplicateIndex shared by all indexers, or None when detection is off"""
+    global _shared
+    if not DUPLICATE_CONFIG['enabled']:
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = DuplicateIndex(os.path.join(INDEX_DIR, 'duplicates.sig'))
+        return _shared
@@ -0,0 +1,105 @@
+import mmap
+import codecs
+
+from config import PASSAGE_CONFIG
+
+# Byte order marks, longest first, with the codec that reads what follows them
+_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+]
+
+# Bytes per code unit of the encodings whose whitespace is not a single ASCII byte
+_UNIT = {'utf-16-le': 2, 'utf-16-be': 2, 'utf-32-le': 4, 'utf-32-be': 4}
+
+
+def detect_encoding(sample):
+    """Guess the encoding of a file from its first bytes; returns (codec name, BOM length).
+
+    Checks for a byte order mark, then for UTF-16 without one (every other
+    byte NUL), then strict UTF-8. Anything else is read as cp1252, or as
+    latin-1 when it uses bytes cp1252 leaves undefined, which never fails.
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding, len(bom)
+    if len(sample) >= 4:
+        even, odd = sample[0::2], sample[1::2]
+        if odd.count(0) > len(odd) * 0.4 and even.count(0) < len(even) * 0.05:
+            return 'utf-16-le', 0
+        if even.count(0) > len(even) * 0.4 and odd.count(0) < len(odd) * 0.05:
+            return 'utf-16-be', 0
+    try:
+        # Not final: the sample may end inside a multi-byte sequence
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8', 0
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode('cp1252')
+        return 'cp1252', 0
+    except UnicodeDecodeError:
+        return 'latin-1', 0
+
+
+def _boundary(data, pos, low, encoding, origin=0):
+    """Position at or before ``pos`` (but after ``low``) just past whitespace, so words stay whole.
+
+    ``origin`` is where the text starts (after a BOM), for encodings with
+    multi-byte code units whose positions must stay aligned to it.
+    """
+    unit = _UNIT.get(encoding, 1)
+    if unit == 1:
+        cut = max(data.rfind(b'\n', low, pos), data.rfind(b' ', low, pos))
+        if cut >= 0:
+            return cut + 1
+        if encoding == 'utf-8':
+            # No whitespace nearby: at least do not split a multi-byte character
+            while pos > low and data[pos] & 0xC0 == 0x80:
+                pos -= 1
+        return pos
+    pos -= (pos - origin) % unit
+    spaces = (' '.encode(encoding), '\n'.encode(encoding))
+    for candidate in range(pos - unit, low - 1, -unit):
+        if data[candidate:candidate + unit] in spaces:
+            return candidate + unit
+    return pos
+
+
+def iter_passages(path, size=PASSAGE_CONFIG['passage_bytes'], overlap=PASSAGE_CONFIG['overlap_bytes'],
+                  encoding=None):
+    """Yield (start byte, end byte, text) for overlapping passages of a text file.
+
+    The file is memory-mapped, so only the passage being decoded is held as
+    a Python string. Passages are about ``size`` bytes, end after
+    whitespace where possible and repeat the last ``overlap`` bytes of the
+    previous passage, so a phrase spanning a boundary is still found.
+    Offsets are into the raw file.
+    """
+    with open(path, 'rb') as f:
+        length = f.seek(0, 2)
+        if length == 0:
+            yield 0, 0, ''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if encoding is None:
+                encoding, origin = detect_encoding(data[:PASSAGE_CONFIG['detect_bytes']])
+            else:
+                origin = 0
+            unit = _UNIT.get(encoding, 1)
+            start = origin
+            while start < length:
+                if length - start <= size:
+                    end = length
+                else:
+                    # Cut in the last quarter of the passage, at whitespace if there is any
+                    end = _boundary(data, start + size, start + size * 3 // 4, encoding, origin)
+                yield start, end, data[start:end].decode(encoding, errors='replace')
+                if end >= length:
+                    return
+                # Step back by the overlap, again to a word start, but always move forward
+                start = max(_boundary(data, end - overlap, max(start + unit, end - 2 * overlap), encoding, origin),
+                            start + unit)
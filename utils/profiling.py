@@ -0,0 +1,104 @@
+import io
+import os
+import marshal
+import time
+import uuid
+import pstats
+import zipfile
+import cProfile
+import threading
+import tracemalloc
+
+from config import PROFILE_CONFIG
+
+# cProfile and tracemalloc are process-wide, so one request is profiled at a time
+_profile_lock = threading.Lock()
+
+
+class RequestProfile:
+    """cProfile call tree and tracemalloc top allocations for one request.
+
+    Use as a context manager around the request; ``acquired`` is False when
+    another request is being profiled, and then nothing is recorded.
+    """
+
+    def __init__(self, label, top=PROFILE_CONFIG['top'], frames=PROFILE_CONFIG['traceback_frames']):
+        self.label = label
+        self.top = top
+        self.frames = frames
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.acquired = False
+        self.profiler = cProfile.Profile()
+        self.snapshot = None
+        self.elapsed = None
+
+    def __enter__(self):
+        self.acquired = _profile_lock.acquire(blocking=False)
+        if self.acquired:
+            tracemalloc.start(self.frames)
+            self.start = time.perf_counter()
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.acquired:
+            return
+        try:
+            self.profiler.disable()
+            self.elapsed = time.perf_counter() - self.start
+            self.snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+            ])
+            self.peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            _profile_lock.release()
+
+    def report(self):
+        """Plain-text report: the slowest calls by cumulative and own time, then the top allocations"""
+        out = io.StringIO()
+        out.write(f"{self.label} profile {self.id}: {self.elapsed * 1000:.1f} ms, "
+                  f"peak traced memory {self.peak / 1024:.1f} KiB\n\n")
+        for sort in ('cumulative', 'tottime'):
+            out.write(f"== calls by {sort} time ==\n")
+            pstats.Stats(self.profiler, stream=out).sort_stats(sort).print_stats(self.top)
+        out.write(f"== top {self.top} allocation sites ==\n")
+        for stat in self.snapshot.statistics('traceback')[:self.top]:
+            out.write(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+            for line in stat.traceback.format():
+                out.write(f"  {line}\n")
+        return out.getvalue()
+
+    def artifact(self, body=None):
+        """Zip with report.txt, a pstats dump (profile.prof, for snakeviz or pstats) and the response body"""
+        # Same format as Profile.dump_stats, which only writes to a path; taken
+        # before the report since pstats.Stats(profiler) empties profiler.stats
+        self.profiler.create_stats()
+        dump = marshal.dumps(self.profiler.stats)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('report.txt', self.report())
+            archive.writestr('profile.prof', dump)
+            if body is not None:
+                archive.writestr('response.json', body)
+        return buffer.getvalue()
+
+    def save(self, body=None, directory=PROFILE_CONFIG['dir'], keep=PROFILE_CONFIG['keep']):
+        """Write the artifact to the profile directory, dropping the oldest beyond ``keep``, and return its path"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{self.id}.zip')
+        with open(path, 'wb') as f:
+            f.write(self.artifact(body))
+        saved = sorted(name for name in os.listdir(directory) if name.endswith('.zip'))
+        for name in saved[:-keep]:
+            os.remove(os.path.join(directory, name))
+        return path
+
+
+def saved_profile(profile_id, directory=PROFILE_CONFIG['dir']):
+    """Path of a saved artifact, or None; ids are checked so they cannot leave the directory"""
+    if not profile_id or not all(c.isalnum() or c == '-' for c in profile_id):
+        return None
+    path = os.path.join(directory, f'{profile_id}.zip')
+    return path if os.path.exists(path) else None
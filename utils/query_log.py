@@ -0,0 +1,92 @@
+import os
+import time
+import threading
+
+from config import QUERY_LOG_CONFIG
+
+# One line per search: unix time, filetype, latency in ms, result count, query
+FIELDS = ('time', 'filetype', 'latency_ms', 'results', 'query')
+
+_ESCAPES = {'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'}
+_UNESCAPES = {'\\': '\\', 't': '\t', 'n': '\n', 'r': '\r'}
+
+
+def _escape(text):
+    return ''.join(_ESCAPES.get(c, c) for c in text)
+
+
+def _unescape(text):
+    if '\\' not in text:
+        return text
+    out, chars = [], iter(text)
+    for c in chars:
+        out.append(_UNESCAPES.get(next(chars, ''), '') if c == '\\' else c)
+    return ''.join(out)
+
+
+class QueryLog:
+    """Append-only, tab-separated log of the searches served.
+
+    Lines are buffered and written every ``flush_every`` seconds (or when the
+    buffer fills), so logging costs a list append on the request path. The
+    file is rotated to ``path.1`` ... ``path.<backups>`` once it grows past
+    ``max_bytes``.
+    """
+
+    def __init__(self, path=QUERY_LOG_CONFIG['path'], flush_every=QUERY_LOG_CONFIG['flush_every'],
+                 buffer_lines=QUERY_LOG_CONFIG['buffer_lines'], max_bytes=QUERY_LOG_CONFIG['max_bytes'],
+                 backups=QUERY_LOG_CONFIG['backups']):
+        self.path = path
+        self.flush_every = flush_every
+        self.buffer_lines = buffer_lines
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.last_flush = time.monotonic()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def record(self, query, filetype, seconds, results):
+        line = f'{time.time():.3f}\t{_escape(filetype)}\t{seconds * 1000:.2f}\t{results}\t{_escape(query)}\n'
+        with self.lock:
+            self.buffer.append(line)
+            due = (len(self.buffer) >= self.buffer_lines
+                   or time.monotonic() - self.last_flush >= self.flush_every)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            lines, self.buffer = self.buffer, []
+            self.last_flush = time.monotonic()
+            if not lines:
+                return
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+                size = f.tell()
+            if self.max_bytes and size >= self.max_bytes:
+                self._rotate()
+
+    def _rotate(self):
+        for number in range(self.backups - 1, 0, -1):
+            older = f'{self.path}.{number}'
+            if os.path.exists(older):
+                os.replace(older, f'{self.path}.{number + 1}')
+        if self.backups:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+
+
+def read_query_log(path):
+    """Yield each logged search as a dict keyed by FIELDS, skipping malformed lines"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t', len(FIELDS) - 1)
+            if len(parts) != len(FIELDS):
+                continue
+            try:
+                yield {'time': float(parts[0]), 'filetype': _unescape(parts[1]),
+                       'latency_ms': float(parts[2]), 'results': int(parts[3]), 'query': _unescape(parts[4])}
+            except ValueError:
+                continue
@@ -0,0 +1,433 @@
+"""Index snapshots and file-based replication to read-only replicas.
+
+A snapshot captures the latest committed generation of every index under
+INDEX_DIR (the Whoosh TOC and its segments, the document store) plus the
+shared near-duplicate table and vectors, and writes it to a snapshot
+directory as a manifest. Whoosh segment files never change once written,
+so they are stored by name and only segments the destination lacks are
+copied. Every other file is split into chunks stored by content hash, so
+an append-only file only ships its new tail. The snapshot directory can
+sit on the replica node (a mount, or a directory kept in sync by rsync).
+
+A replica restores the latest manifest into REPLICA_DIR/generations/<id>
+and then points the REPLICA_DIR/current symlink at it in one rename. An
+app started with REPLICA_DIR set serves that generation read-only and
+reopens its indexes when the symlink moves; searches already running keep
+the generation they started on, which stays on disk until it is pruned.
+
+    python -m utils.replication snapshot [--to SNAPSHOT_DIR]
+    python -m utils.replication restore --replica-dir DIR [--from SNAPSHOT_DIR] [--watch]
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+from whoosh.filedb.filestore import FileStorage
+from whoosh.index import TOC, open_dir, exists_in
+
+from config import INDEX_DIR, REPLICA_DIR, REPLICATION_CONFIG
+from utils import stats
+from utils.doc_store import DocumentStore, consistent_sizes
+from utils.index_storage import _segment_pattern
+from utils.lexicon import Lexicon, open_surface_forms
+from utils.bloom import VocabularyFilter
+from utils.vectors import open_vector_index
+from indexer.searching import QueryCache
+
+logger = logging.getLogger(__name__)
+
+# Files next to the indexes that belong in a snapshot, in the order they are captured:
+# vector metadata before the matrix, so every listed row is already written
+SHARED_FILES = ['duplicates.sig', 'surface_forms.tsv', 'vectors/meta.jsonl', 'vectors/df.npy', 'vectors/cells.npy',
+                'vectors/cells.npy.rows.npy', 'vectors/matrix.f32']
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def _chunk_path(snapshot_dir, digest):
+    return os.path.join(snapshot_dir, 'chunks', digest[:2], digest)
+
+
+class _Capture:
+    """One snapshot being written: the manifest entries and the bytes actually shipped"""
+
+    def __init__(self, snapshot_dir, previous, chunk_bytes):
+        self.snapshot_dir = snapshot_dir
+        self.previous = previous.get('files', {}) if previous else {}
+        self.chunk_bytes = chunk_bytes
+        self.files = {}
+        self.shipped = 0
+        self.total = 0
+
+    def _store_chunks(self, data_chunks):
+        digests = []
+        for data in data_chunks:
+            digest = hashlib.sha256(data).hexdigest()
+            path = _chunk_path(self.snapshot_dir, digest)
+            if not os.path.exists(path):
+                _write_atomic(path, data)
+                self.shipped += len(data)
+            digests.append(digest)
+        return digests
+
+    def add_data(self, relpath, data):
+        """A file read whole into memory"""
+        chunks = [data[i:i + self.chunk_bytes] for i in range(0, len(data), self.chunk_bytes)]
+        self.files[relpath] = {'size': len(data), 'chunks': self._store_chunks(chunks)}
+        self.total += len(data)
+
+    def add_file(self, relpath, path, length=None):
+        """The first ``length`` bytes (default: all) of a file, reusing the last snapshot's chunks if it is unchanged"""
+        stat = os.stat(path)
+        length = stat.st_size if length is None else length
+        signature = [stat.st_size, stat.st_mtime_ns, length]
+        previous = self.previous.get(relpath)
+        if previous and previous.get('stat') == signature and 'chunks' in previous:
+            self.files[relpath] = previous
+            self.total += length
+            return
+
+        def read():
+            with open(path, 'rb') as f:
+                remaining = length
+                while remaining > 0:
+                    data = f.read(min(self.chunk_bytes, remaining))
+                    if not data:
+                        raise EOFError(f"{path} shrank while it was copied")
+                    remaining -= len(data)
+                    yield data
+
+        self.files[relpath] = {'size': length, 'stat': signature, 'chunks': self._store_chunks(read())}
+        self.total += length
+
+    def add_segment(self, relpath, unit, path):
+        """A Whoosh segment file, copied only if the snapshot directory does not hold it yet"""
+        stored = os.path.join('segments', unit, os.path.basename(path))
+        target = os.path.join(self.snapshot_dir, stored)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(path, target + '.tmp')
+            os.replace(target + '.tmp', target)
+            self.shipped += os.path.getsize(target)
+        size = os.path.getsize(target)
+        self.files[relpath] = {'size': size, 'segment': stored}
+        self.total += size
+
+
+def _index_units(index_dir):
+    """Relative directories holding a Whoosh index: the index root and its subdirectories"""
+    units = ['.'] if exists_in(index_dir) else []
+    for name in sorted(os.listdir(index_dir)):
+        if os.path.isdir(os.path.join(index_dir, name)) and exists_in(os.path.join(index_dir, name)):
+            units.append(name)
+    return units
+
+
+def _capture_index(capture, index_dir, unit, retries):
+    """Add the latest generation of one index and its document store; returns the generation"""
+    path = os.path.normpath(os.path.join(index_dir, unit))
+    storage = FileStorage(path)
+    for attempt in range(retries):
+        files = dict(capture.files)
+        try:
+            generation = TOC._latest_generation(storage, 'MAIN')
+            toc = TOC.read(storage, 'MAIN', generation)
+            segments = {segment.segment_id() for segment in toc.segments}
+            # The TOC name repeats after an index is recreated, so it is stored by content
+            toc_name = TOC._filename('MAIN', generation)
+            with storage.open_file(toc_name) as f:
+                capture.add_data(os.path.join(unit, toc_name), f.read())
+            for name in storage.list():
+                match = _segment_pattern.match(name)
+                if match and match.group(1) in segments:
+                    capture.add_segment(os.path.join(unit, name), unit, os.path.join(path, name))
+            break
+        except OSError as e:
+            # A merge deleted a segment of the generation being copied; take the newer one
+            capture.files = files
+            logger.debug("Retrying snapshot of the %s index: %s", unit, e)
+    else:
+        raise RuntimeError(f"The {unit} index kept changing; snapshot abandoned after {retries} attempts")
+    # Read after the TOC: every document of the generation is already in the store
+    for name, length in consistent_sizes(path).items():
+        if length:
+            capture.add_file(os.path.join(unit, name), os.path.join(path, name), length)
+    return generation
+
+
+def _read_npy(path, retries):
+    """Bytes of a .npy file that np.save may be rewriting; retried until they load"""
+    import numpy as np
+    for attempt in range(retries):
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            np.load(io.BytesIO(data))
+            return data
+        except (ValueError, EOFError, OSError):
+            time.sleep(0.05 * (attempt + 1))
+    raise RuntimeError(f"{path} could not be read in one piece")
+
+
+def list_snapshots(snapshot_dir):
+    """Snapshot ids in a snapshot directory, oldest first"""
+    manifests = os.path.join(snapshot_dir, 'manifests')
+    if not os.path.isdir(manifests):
+        return []
+    return sorted(name[:-5] for name in os.listdir(manifests) if name.endswith('.json'))
+
+
+def latest_snapshot(snapshot_dir):
+    """Id of the newest complete snapshot, or None"""
+    try:
+        with open(os.path.join(snapshot_dir, 'LATEST'), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_manifest(snapshot_dir, snapshot_id):
+    with open(os.path.join(snapshot_dir, 'manifests', f'{snapshot_id}.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def create_snapshot(snapshot_dir=REPLICATION_CONFIG['snapshot_dir'], index_dir=INDEX_DIR,
+                    keep=REPLICATION_CONFIG['keep_snapshots']):
+    """Write a snapshot of every index under ``index_dir`` and return its manifest.
+
+    Indexes are captured one after another, each at its latest committed
+    generation, so a snapshot taken during heavy indexing may hold some
+    indexes a commit further along than others. The shared tables are
+    captured last, so they cover every captured document.
+    """
+    start = time.perf_counter()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    parent = latest_snapshot(snapshot_dir)
+    previous = load_manifest(snapshot_dir, parent) if parent else None
+    capture = _Capture(snapshot_dir, previous, REPLICATION_CONFIG['chunk_bytes'])
+    retries = REPLICATION_CONFIG['retries']
+
+    generations = {}
+    for unit in _index_units(index_dir):
+        generations[unit] = _capture_index(capture, index_dir, unit, retries)
+    for relpath in SHARED_FILES:
+        path = os.path.join(index_dir, relpath)
+        if not os.path.exists(path):
+            continue
+        if path.endswith('.npy'):
+            capture.add_data(relpath, _read_npy(path, retries))
+        else:
+            capture.add_file(relpath, path)
+
+    snapshot_id = '%06d' % (int(parent) + 1 if parent else 1)
+    manifest = {
+        'id': snapshot_id,
+        'parent': parent,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'source': os.path.abspath(index_dir),
+        'generations': generations,
+        'files': capture.files,
+        'total_bytes': capture.total,
+        'shipped_bytes': capture.shipped,
+    }
+    _write_atomic(os.path.join(snapshot_dir, 'manifests', f'{snapshot_id}.json'),
+                  json.dumps(manifest, indent=1).encode('utf-8'))
+    # Published last: a replica never sees a manifest whose files are still being copied
+    _write_atomic(os.path.join(snapshot_dir, 'LATEST'), snapshot_id.encode('utf-8'))
+    logger.info("Snapshot %s: %s indexes, %s bytes, %s shipped in %.2fs", snapshot_id, len(generations),
+                capture.total, capture.shipped, time.perf_counter() - start)
+    if keep:
+        prune_snapshots(snapshot_dir, keep)
+    return manifest
+
+
+def prune_snapshots(snapshot_dir, keep=REPLICATION_CONFIG['keep_snapshots']):
+    """Delete all but the newest ``keep`` snapshots and the files only they used"""
+    snapshots = list_snapshots(snapshot_dir)
+    for snapshot_id in snapshots[:-keep]:
+        os.remove(os.path.join(snapshot_dir, 'manifests', f'{snapshot_id}.json'))
+    used = set()
+    for snapshot_id in snapshots[-keep:]:
+        for entry in load_manifest(snapshot_dir, snapshot_id)['files'].values():
+            if 'segment' in entry:
+                used.add(os.path.normpath(os.path.join(snapshot_dir, entry['segment'])))
+            else:
+                used.update(_chunk_path(snapshot_dir, digest) for digest in entry['chunks'])
+    removed = 0
+    for folder in ('segments', 'chunks'):
+        for root, _, files in os.walk(os.path.join(snapshot_dir, folder)):
+            for name in files:
+                path = os.path.normpath(os.path.join(root, name))
+                if path not in used:
+                    os.remove(path)
+                    removed += 1
+    if removed:
+        logger.debug("Removed %s files no longer used by a snapshot", removed)
+
+
+def _point(link, target):
+    """Make the symlink ``link`` point to ``target`` in a single rename"""
+    if os.path.exists(link) and not os.path.islink(link):
+        raise RuntimeError(f"{link} is a directory, not a symlink; move it away first")
+    temporary = link + '.tmp'
+    if os.path.lexists(temporary):
+        os.remove(temporary)
+    os.symlink(target, temporary)
+    os.replace(temporary, link)
+
+
+def restore_snapshot(replica_dir, snapshot_dir=REPLICATION_CONFIG['snapshot_dir'], snapshot_id=None,
+                     keep=REPLICATION_CONFIG['keep_generations']):
+    """Build a snapshot (default: the latest) as a new generation of a replica and switch to it.
+
+    Returns the snapshot id now current, or None if there is no snapshot.
+    Segment files are hard-linked from the snapshot directory when it is on
+    the same file system, and copied otherwise.
+    """
+    snapshot_id = snapshot_id or latest_snapshot(snapshot_dir)
+    if snapshot_id is None:
+        return None
+    generations = os.path.join(replica_dir, 'generations')
+    generation = os.path.join(generations, snapshot_id)
+    current = os.path.join(replica_dir, 'current')
+    if os.path.realpath(current) == os.path.realpath(generation) and os.path.isdir(generation):
+        return snapshot_id
+
+    start = time.perf_counter()
+    manifest = load_manifest(snapshot_dir, snapshot_id)
+    staging = generation + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    for relpath, entry in manifest['files'].items():
+        target = os.path.join(staging, relpath)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if 'segment' in entry:
+            source = os.path.join(snapshot_dir, entry['segment'])
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+        else:
+            with open(target, 'wb') as f:
+                for digest in entry['chunks']:
+                    with open(_chunk_path(snapshot_dir, digest), 'rb') as chunk:
+                        shutil.copyfileobj(chunk, f)
+    shutil.rmtree(generation, ignore_errors=True)
+    os.rename(staging, generation)
+    _point(current, os.path.relpath(generation, replica_dir))
+    logger.info("Replica %s switched to snapshot %s in %.2fs", replica_dir, snapshot_id, time.perf_counter() - start)
+
+    # Older generations go, except the newest few that searches may still be reading
+    restored = sorted(name for name in os.listdir(generations) if not name.endswith('.tmp'))
+    for name in restored[:-keep] if keep else []:
+        if name != snapshot_id:
+            shutil.rmtree(os.path.join(generations, name), ignore_errors=True)
+    return snapshot_id
+
+
+class ReplicaFollower:
+    """Reopen the indexes of a read-only replica whenever REPLICA_DIR/current moves.
+
+    Each indexer gets a new Whoosh index and document store opened from the
+    generation directory itself rather than through the symlink, so what it
+    reads cannot change under it. Searches that already hold the previous
+    index and store finish on them.
+    """
+
+    def __init__(self, indexers, interval=REPLICATION_CONFIG['poll_interval']):
+        self.indexers = indexers
+        self.interval = interval
+        self.generation = None
+        self.thread = None
+
+    def check(self):
+        """Switch to the current generation if it changed; True if it did"""
+        generation = os.path.realpath(INDEX_DIR)
+        if generation == self.generation or not os.path.isdir(generation):
+            return False
+        self._switch(generation)
+        return True
+
+    def _switch(self, generation):
+        opened = {}
+        for name, indexer in self.indexers.items():
+            path = os.path.join(generation, os.path.relpath(indexer.index_dir, INDEX_DIR))
+            opened[name] = (open_dir(path), DocumentStore(path))
+        vectors = os.path.join(generation, 'vectors')
+        if os.path.isdir(vectors):
+            open_vector_index(vectors)
+        open_surface_forms(os.path.join(generation, 'surface_forms.tsv'))
+        for name, indexer in self.indexers.items():
+            ix, doc_store = opened[name]
+            # Caches are keyed by generation numbers, which restart when the primary rebuilds
+            indexer.lexicon, indexer.vocabulary, indexer.queries = Lexicon(), VocabularyFilter(), QueryCache()
+            indexer.doc_store = doc_store
+            indexer.ix = ix
+            # Nothing commits on a replica, so the skip checks are brought up to date here
+            indexer.refresh()
+        self.generation = generation
+        stats.increment('replica_switches')
+        logger.info("Serving index generation %s", os.path.basename(generation))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error("Error switching to a new index generation: %s", e)
+
+    def start(self):
+        self.check()
+        self.thread = threading.Thread(target=self._run, name='replica-follower', daemon=True)
+        self.thread.start()
+        return self
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    snapshot = commands.add_parser('snapshot', help="Snapshot every index into a snapshot directory")
+    snapshot.add_argument('--to', dest='snapshot_dir', default=REPLICATION_CONFIG['snapshot_dir'])
+    snapshot.add_argument('--index-dir', default=INDEX_DIR)
+    snapshot.add_argument('--keep', type=int, default=REPLICATION_CONFIG['keep_snapshots'],
+                          help="Snapshots kept (0 keeps all)")
+    restore = commands.add_parser('restore', help="Restore the latest snapshot on a replica and switch to it")
+    restore.add_argument('--from', dest='snapshot_dir', default=REPLICATION_CONFIG['snapshot_dir'])
+    restore.add_argument('--replica-dir', default=REPLICA_DIR, required=REPLICA_DIR is None)
+    restore.add_argument('--snapshot', help="Snapshot id (default: the latest)")
+    restore.add_argument('--keep', type=int, default=REPLICATION_CONFIG['keep_generations'],
+                         help="Generations kept on the replica (0 keeps all)")
+    restore.add_argument('--watch', action='store_true', help="Keep restoring new snapshots as they appear")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    if args.command == 'snapshot':
+        manifest = create_snapshot(args.snapshot_dir, args.index_dir, args.keep)
+        print(json.dumps({key: manifest[key] for key in ('id', 'generations', 'total_bytes', 'shipped_bytes')}))
+        return 0
+    while True:
+        restored = restore_snapshot(args.replica_dir, args.snapshot_dir, args.snapshot, args.keep)
+        if not args.watch:
+            if restored is None:
+                print(f"No snapshot in {args.snapshot_dir}", file=sys.stderr)
+                return 1
+            print(restored)
+            return 0
+        time.sleep(REPLICATION_CONFIG['poll_interval'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from config import STATS_CONFIG
+
+_lock = threading.Lock()
+_counters = {}
+# (name, labels) -> [count per bucket..., count above the last bucket, sum]
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name, value=1, **labels):
+    """Add to a named counter"""
+    key = _key(name, labels) if labels else name
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """Record a duration in a timing histogram"""
+    buckets = STATS_CONFIG['buckets']
+    slot = 0
+    while slot < len(buckets) and seconds > buckets[slot]:
+        slot += 1
+    key = _key(name, labels)
+    with _lock:
+        counts = _histograms.get(key)
+        if counts is None:
+            counts = _histograms[key] = [0] * (len(buckets) + 2)
+        counts[slot] += 1
+        counts[-1] += seconds
+
+
+@contextmanager
+def timed(name, **labels):
+    """Observe how long the block takes, also when it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def record_indexing(index, documents, nbytes, seconds):
+    """Count the documents and source bytes indexed from one file and time it"""
+    increment('files_indexed', index=index)
+    increment('documents_indexed', documents, index=index)
+    increment('bytes_indexed', nbytes, index=index)
+    observe('index_file_seconds', seconds, index=index)
+
+
+def _label_text(labels):
+    return ','.join(f'{k}="{v}"' for k, v in labels)
+
+
+def counters():
+    """Snapshot of all counters; labelled ones are keyed like name{label="value"}"""
+    with _lock:
+        items = list(_counters.items())
+    return {key if isinstance(key, str) else f'{key[0]}{{{_label_text(key[1])}}}': value
+            for key, value in items}
+
+
+def _line(name, labels, value):
+    labels = f'{{{_label_text(labels)}}}' if labels else ''
+    return f'{name}{labels} {value}'
+
+
+def prometheus(gauges=()):
+    """All counters and histograms, plus (name, labels dict, value) gauges, in the Prometheus text format"""
+    prefix = STATS_CONFIG['prefix']
+    buckets = STATS_CONFIG['buckets']
+    with _lock:
+        counter_items = sorted((key if isinstance(key, tuple) else (key, ()), value)
+                               for key, value in _counters.items())
+        histogram_items = sorted((key, list(counts)) for key, counts in _histograms.items())
+
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+
+    for (name, labels), value in counter_items:
+        name = f'{prefix}{name}_total'
+        declare(name, 'counter')
+        lines.append(_line(name, labels, value))
+    for (name, labels), counts in histogram_items:
+        name = f'{prefix}{name}'
+        declare(name, 'histogram')
+        cumulative = 0
+        for bound, count in zip(buckets, counts):
+            cumulative += count
+            lines.append(_line(f'{name}_bucket', labels + (('le', bound),), cumulative))
+        cumulative += counts[len(buckets)]
+        lines.append(_line(f'{name}_bucket', labels + (('le', '+Inf'),), cumulative))
+        lines.append(_line(f'{name}_sum', labels, round(counts[-1], 6)))
+        lines.append(_line(f'{name}_count', labels, cumulative))
+    for name, labels, value in sorted(gauges, key=lambda g: (g[0], sorted(g[1].items()))):
+        name = f'{prefix}{name}'
+        declare(name, 'gauge')
+        lines.append(_line(name, tuple(sorted(labels.items())), value))
+    return '\n'.join(lines) + '\n'
@@ -1,22 +1,58 @@
 import nltk
 import string
+import threading
+from functools import lru_cache
 from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
 from nltk.tag import pos_tag
 
+from config import LEMMA_CONFIG, NLTK_AUTO_DOWNLOAD
+
+# Location of each required resource inside an nltk_data directory
+NLTK_RESOURCES = {
+    'punkt': 'tokenizers/punkt',
+    'stopwords': 'corpora/stopwords',
+    'averaged_perceptron_tagger': 'taggers/averaged_perceptron_tagger',
+    'wordnet': 'corpora/wordnet'
+}
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_text_processor():
+    """The TextProcessor of this process, created on first use"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = TextProcessor()
+    return _shared
+
+
+def lemma_cache_info():
+    """Statistics of the shared lemma cache, or None while no TextProcessor has been created"""
+    return _shared._lemma.cache_info() if _shared is not None else None
+
+
 class TextProcessor:
     def __init__(self):
-        # Download required NLTK data
-        for resource in ['punkt', 'stopwords', 'averaged_perceptron_tagger', 'wordnet']:
+        # Check the required NLTK data; downloading is opt-in so no worker touches the network
+        for resource, path in NLTK_RESOURCES.items():
             try:
-                nltk.data.find(f'tokenizers/{resource}' if resource == 'punkt' else f'corpora/{resource}')
+                nltk.data.find(path)
             except LookupError:
+                if not NLTK_AUTO_DOWNLOAD:
+                    raise LookupError(f"NLTK resource '{resource}' not found, "
+                                      f"install it with: python -m nltk.downloader {resource}")
                 nltk.download(resource)
         
         self.stop_words = set(stopwords.words('english'))
         self.lemmatizer = WordNetLemmatizer()
         self.punctuation = set(string.punctuation)
+        # Lemmas keyed by (word, POS bucket); WordNet lookups dominate lemmatization time
+        self._lemma = lru_cache(maxsize=LEMMA_CONFIG['cache_size'])(self.lemmatizer.lemmatize)
 
     def preprocess(self, text):
         """Apply all text preprocessing steps"""
@@ -29,21 +65,20 @@ class TextProcessor:
         # Remove punctuation and stopwords
         tokens = [token for token in tokens if token not in self.punctuation and token not in self.stop_words]
         
-        # POS tagging
-        pos_tags = pos_tag(tokens)
-        
-        # Lemmatization
-        lemmatized = []
-        for word, tag in pos_tags:
-            # Convert POS tag to WordNet format
-            wn_tag = self._get_wordnet_pos(tag)
-            if wn_tag:
-                lemmatized.append(self.lemmatizer.lemmatize(word, wn_tag))
-            else:
-                lemmatized.append(self.lemmatizer.lemmatize(word))
+        # POS tagging and lemmatization
+        lemmatized = [self.lemmatize(word, bucket) for word, bucket in zip(tokens, self.pos_buckets(tokens))]
         
         return ' '.join(lemmatized)
 
+    def pos_buckets(self, tokens):
+        """WordNet POS bucket ('a', 'n', 'v' or 'r') of each token, tagged in one batch"""
+        # Words without a WordNet tag are lemmatized as nouns, the lemmatizer's default
+        return [self._get_wordnet_pos(tag) or 'n' for _, tag in pos_tag(tokens)]
+
+    def lemmatize(self, word, bucket='n'):
+        """Lemma of a word for a POS bucket, from the LRU cache when possible"""
+        return self._lemma(word, bucket)
+
     def _get_wordnet_pos(self, tag):
         """Convert POS tag to WordNet format"""
         tag_dict = {
@@ -0,0 +1,282 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from collections import Counter
+from functools import lru_cache
+
+from config import INDEX_DIR, VECTOR_CONFIG
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=200000)
+def _token_slots(token, dimensions, positions, df_buckets):
+    """Deterministic projection of a token: ``positions`` (dimension, sign) pairs and its document-frequency bucket"""
+    import numpy as np
+    digest = hashlib.blake2b(token.encode('utf-8'), digest_size=32).digest()
+    slots = np.array([int.from_bytes(digest[i * 3:i * 3 + 3], 'little') % dimensions for i in range(positions)])
+    signs = np.array([1.0 if digest[24] >> i & 1 else -1.0 for i in range(positions)], dtype=np.float32)
+    return slots, signs, int.from_bytes(digest[28:32], 'little') % df_buckets
+
+
+class VectorIndex:
+    """"More like this" vectors of every indexed document, in a memory-mapped float32 matrix.
+
+    A document's vector is a sparse random projection of its TF-IDF
+    weights: each word adds its weight, with a hash-derived sign, to a few
+    hash-derived dimensions. Nothing has to be trained, and vectors can be
+    added one commit at a time. Document frequencies are counted in hashed
+    buckets as documents arrive. Once ``train_min`` vectors exist, they are
+    clustered by spherical k-means into ``nlist`` coarse cells (IVF). A
+    lookup then scores only the rows of the ``nprobe`` cells nearest to the
+    query instead of the whole matrix, and the cells are retrained as the
+    collection grows by ``retrain_growth``.
+    """
+
+    def __init__(self, directory, config=VECTOR_CONFIG):
+        self.directory = directory
+        self.dimensions = config['dimensions']
+        self.positions = config['hash_positions']
+        self.df_buckets = config['df_buckets']
+        self.nlist = config['nlist']
+        self.nprobe = config['nprobe']
+        self.train_min = config['train_min']
+        self.retrain_growth = config['retrain_growth']
+        self.iterations = config['kmeans_iterations']
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self.matrix_path = os.path.join(directory, 'matrix.f32')
+        self.meta_path = os.path.join(directory, 'meta.jsonl')
+        self.df_path = os.path.join(directory, 'df.npy')
+        self.cells_path = os.path.join(directory, 'cells.npy')
+        self._load()
+
+    def _load(self):
+        import numpy as np
+        self.meta = []
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by a crash
+                    row = entry.pop('row')
+                    self.meta.extend([None] * (row + 1 - len(self.meta)))
+                    self.meta[row] = entry
+        self.reserved = len(self.meta)
+        if os.path.exists(self.df_path):
+            state = np.load(self.df_path)
+            self.documents, self.df = int(state[0]), state[1:].astype(np.int64)
+        else:
+            self.documents, self.df = 0, np.zeros(self.df_buckets, dtype=np.int64)
+        self.capacity = 0
+        self.matrix = None
+        self._ensure_capacity(max(self.reserved, 1024))
+        self.centroids, self.assignments, self.trained_at = None, np.zeros(0, dtype=np.int32), 0
+        if os.path.exists(self.cells_path) and os.path.exists(self.cells_path + '.rows.npy'):
+            self.centroids = np.load(self.cells_path)
+            self.assignments = np.load(self.cells_path + '.rows.npy')
+            self.trained_at = len(self.assignments)
+            # Rows added after the last training are assigned to the stored cells
+            self._assign(range(self.trained_at, len(self.meta)))
+        self._rebuild_lists()
+
+    def _ensure_capacity(self, rows):
+        import numpy as np
+        if rows <= self.capacity:
+            return
+        capacity = max(rows, self.capacity * 2)
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        with open(self.matrix_path, 'ab') as f:
+            f.truncate(capacity * self.dimensions * 4)
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r+', shape=(capacity, self.dimensions))
+        self.capacity = capacity
+
+    def __len__(self):
+        return sum(1 for entry in self.meta if entry is not None)
+
+    def reserve(self):
+        """Row number for a document about to be indexed; it becomes searchable once add() stores it"""
+        with self.lock:
+            row = self.reserved
+            self.reserved += 1
+            return row
+
+    def embed(self, text, count=False):
+        """Unit-length vector of a text; ``count`` adds it to the document frequencies"""
+        import numpy as np
+        counts = Counter(_TOKEN.findall((text or '').lower()))
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        if not counts:
+            return vector
+        slots = [_token_slots(token, self.dimensions, self.positions, self.df_buckets) for token in counts]
+        buckets = np.array([bucket for _, _, bucket in slots])
+        if count:
+            self.documents += 1
+            np.add.at(self.df, buckets, 1)
+        idf = np.log((1 + self.documents) / (1 + self.df[buckets])) + 1
+        weights = (1 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))) * idf
+        dims = np.concatenate([dims for dims, _, _ in slots])
+        values = np.concatenate([signs * weight for (_, signs, _), weight in zip(slots, weights)])
+        vector = np.bincount(dims, weights=values, minlength=self.dimensions).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add(self, documents):
+        """Store the vectors of committed documents: (row, text, metadata dict) triples"""
+        import numpy as np
+        if not documents:
+            return
+        with self.lock:
+            self._ensure_capacity(max(row for row, _, _ in documents) + 1)
+            lines = []
+            for row, text, metadata in documents:
+                self.matrix[row] = self.embed(text, count=True)
+                self.meta.extend([None] * (row + 1 - len(self.meta)))
+                self.meta[row] = metadata
+                lines.append(json.dumps({'row': row, **metadata}) + '\n')
+            self.matrix.flush()
+            with open(self.meta_path, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+            np.save(self.df_path, np.concatenate([[self.documents], self.df]))
+            if self.centroids is None:
+                if len(self.meta) >= self.train_min:
+                    self.train()
+            elif len(self.meta) >= self.trained_at * self.retrain_growth:
+                self.train()
+            else:
+                self._assign([row for row, _, _ in documents])
+                self._rebuild_lists()
+
+    def train(self):
+        """Cluster the stored vectors into the coarse IVF cells (spherical k-means)"""
+        import numpy as np
+        with self.lock:
+            rows = len(self.meta)
+            rng = np.random.default_rng(0)
+            sample = np.asarray(self.matrix[np.sort(rng.choice(rows, min(rows, self.nlist * 256), replace=False))])
+            sample = sample[sample.any(axis=1)]
+            nlist = min(self.nlist, len(sample))
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+            for _ in range(self.iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for cell in range(nlist):
+                    members = sample[labels == cell]
+                    if len(members):
+                        centroid = members.sum(axis=0)
+                        norm = np.linalg.norm(centroid)
+                        if norm:
+                            centroids[cell] = centroid / norm
+            self.centroids = centroids
+            self.assignments = np.zeros(0, dtype=np.int32)
+            self._assign(range(rows))
+            self.trained_at = rows
+            np.save(self.cells_path, self.centroids)
+            np.save(self.cells_path + '.rows.npy', self.assignments)
+            self._rebuild_lists()
+            logger.info("Trained %s vector cells on %s documents", nlist, rows)
+
+    def _assign(self, rows):
+        import numpy as np
+        if self.centroids is None:
+            return
+        rows = list(rows)
+        if not rows:
+            return
+        top = max(rows) + 1
+        if len(self.assignments) < top:
+            self.assignments = np.concatenate([self.assignments, np.full(top - len(self.assignments), -1, np.int32)])
+        for start in range(0, len(rows), 8192):
+            chunk = rows[start:start + 8192]
+            self.assignments[chunk] = np.argmax(np.asarray(self.matrix[chunk]) @ self.centroids.T, axis=1)
+
+    def _rebuild_lists(self):
+        """Rows of each cell, in row order"""
+        import numpy as np
+        if self.centroids is None:
+            self.lists = None
+            return
+        order = np.argsort(self.assignments, kind='stable')
+        bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    def vector(self, row):
+        """Stored vector of a row, or None if the row holds no document"""
+        import numpy as np
+        with self.lock:
+            if not 0 <= row < len(self.meta) or self.meta[row] is None:
+                return None
+            return np.array(self.matrix[row])
+
+    def metadata(self, row):
+        with self.lock:
+            return self.meta[row] if 0 <= row < len(self.meta) else None
+
+    def nearest(self, vector, limit, exclude=None):
+        """(row, cosine similarity) of the closest stored vectors, best first"""
+        import numpy as np
+        if not vector.any():
+            return []
+        with self.lock:
+            rows = len(self.meta)
+            if self.lists is None:
+                candidates = np.arange(rows)
+            else:
+                cells = np.argsort(self.centroids @ vector)[::-1][:self.nprobe]
+                candidates = np.concatenate([self.lists[cell] for cell in cells])
+                # Rows added since the lists were last rebuilt
+                candidates = np.concatenate([candidates, np.arange(len(self.assignments), rows)])
+            if not len(candidates):
+                return []
+            scores = np.asarray(self.matrix[candidates]) @ vector
+        if exclude is not None:
+            scores[candidates == exclude] = -np.inf
+        top = np.argsort(scores)[::-1][:limit]
+        return [(int(candidates[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def clear(self):
+        with self.lock:
+            self.matrix = None
+            for path in (self.matrix_path, self.meta_path, self.df_path, self.cells_path,
+                         self.cells_path + '.rows.npy'):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._load()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_vector_index():
+    """The VectorIndex shared by all indexers, or None when similarity search is off"""
+    global _shared
+    if not VECTOR_CONFIG['enabled']:
+        return None
+    with _shared_lock:
+        if _shared is None:
+            _shared = VectorIndex(os.path.join(INDEX_DIR, 'vectors'))
+        return _shared
+
+
+def has_stored_vectors():
+    """True if the shared vector index holds rows on disk, checked without opening it (which loads numpy)"""
+    path = os.path.join(INDEX_DIR, 'vectors', 'meta.jsonl')
+    return VECTOR_CONFIG['enabled'] and os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def open_vector_index(directory):
+    """Make the VectorIndex stored in ``directory`` the shared one, e.g. when a replica switches generations"""
+    global _shared
+    index = VectorIndex(directory)
+    with _shared_lock:
+        _shared = index
+    return index